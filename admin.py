@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, abort, make_response, current_app, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, abort, current_app, session, Response, stream_template
 import os
 import uuid
 import json
@@ -34,10 +34,13 @@ ICONS_DIR = os.path.join(os.path.dirname(__file__), 'static', 'icons')
 # Ancien système d'icônes supprimé - plus besoin d'importer fetch_category_icons
 from flask_login import login_required, current_user
 from app import db
-from models import User, ActionLog, Item, Status, HeadphoneLoan, Product, Sale, SaleItem, PaymentMethod, ZClosure, ZTicketPDF, LoanStatus, Conversation, Message, ConvType, Category, PasswordResetToken, get_app_settings
+from models import User, ActionLog, Item, Status, HeadphoneLoan, DepositType, Product, Sale, SaleItem, PaymentMethod, ZClosure, ZTicketPDF, LoanStatus, Conversation, Message, ConvType, Category, PasswordResetToken, get_app_settings
 from forms import SimpleCsrfForm, ProductForm, CategoryIconForm, RegisterForm, AdminSetPasswordForm
+import loan_attachments
 import password_reset
-from analytics import agreger_prets, affluence_prets
+import photo_jobs
+import analytics_sql
+import counters
 from statuts import statut_apres_refus
 from datetime import datetime, timezone
 from reportlab.lib.pagesizes import A4
@@ -57,38 +60,50 @@ def admin_required(f):
 bp_admin = Blueprint('admin', __name__, url_prefix='/admin')
 
 # --- Admin counters context (badges) ---
-@bp_admin.app_context_processor
-def admin_counters_ctx():
-    counts = {
-        'deletions_items': 0,
-        'deletions_loans': 0,
-        'deletions_total': 0,
-        'sales_today_count': 0,
-    }
-    try:
-        if not current_user.is_authenticated or not current_user.is_admin:
-            return {'admin_counts': counts}
-    except Exception:
-        return {'admin_counts': counts}
+EMPTY_ADMIN_COUNTS = {
+    'deletions_items': 0,
+    'deletions_loans': 0,
+    'deletions_total': 0,
+    'sales_today_count': 0,
+}
+
+
+def _admin_counts():
+    counts = dict(EMPTY_ADMIN_COUNTS)
+    # COUNT sur la seule clé : Query.count() enroberait un SELECT de toutes les colonnes.
     try:
-        counts['deletions_items'] = Item.query.filter_by(status=Status.PENDING_DELETION).count()
+        counts['deletions_items'] = (db.session.query(sa.func.count(Item.id))
+                                     .filter(Item.status == Status.PENDING_DELETION).scalar())
     except Exception:
         pass
     try:
-        counts['deletions_loans'] = HeadphoneLoan.query.filter_by(status=LoanStatus.PENDING_DELETION).count()
+        counts['deletions_loans'] = (db.session.query(sa.func.count(HeadphoneLoan.id))
+                                     .filter(HeadphoneLoan.status == LoanStatus.PENDING_DELETION).scalar())
     except Exception:
         pass
     counts['deletions_total'] = counts['deletions_items'] + counts['deletions_loans']
     try:
         # Sales since last Z-closure (reset after Z)
-        last = ZClosure.query.order_by(ZClosure.to_ts.desc()).first()
-        if last and last.to_ts:
-            counts['sales_today_count'] = Sale.query.filter(Sale.created_at > last.to_ts).count()
-        else:
-            counts['sales_today_count'] = Sale.query.count()
+        last_to_ts = db.session.query(sa.func.max(ZClosure.to_ts)).scalar()
+        sales = db.session.query(sa.func.count(Sale.id))
+        if last_to_ts:
+            sales = sales.filter(Sale.created_at > last_to_ts)
+        counts['sales_today_count'] = sales.scalar()
     except Exception:
         pass
-    return {'admin_counts': counts}
+    return counts
+
+
+@bp_admin.app_context_processor
+def admin_counters_ctx():
+    try:
+        if not current_user.is_authenticated or not current_user.is_admin:
+            return {'admin_counts': EMPTY_ADMIN_COUNTS}
+    except Exception:
+        return {'admin_counts': EMPTY_ADMIN_COUNTS}
+    # Mêmes chiffres pour tous les admins : une seule clé, invalidée par les
+    # écritures sur les tables comptées (counters.WATCHED).
+    return {'admin_counts': counters.counter_cache().get_or_compute(counters.ADMIN, 'badges', _admin_counts)}
 
 # Fonction fetch_icons supprimée - plus nécessaire avec Bootstrap Icons
 
@@ -235,16 +250,10 @@ def visual_model_status():
 
 
 def analytique_casques():
-    """Lit les prêts non supprimés et délègue les calculs à analytics.py."""
-    champs = (HeadphoneLoan.quantity, HeadphoneLoan.deposit_type,
-              HeadphoneLoan.deposit_amount, HeadphoneLoan.loan_date,
-              HeadphoneLoan.return_date)
-    lignes = (HeadphoneLoan.query
-              .filter(HeadphoneLoan.status != LoanStatus.DELETED)
-              .with_entities(*champs).all())
-    resume = agreger_prets(lignes)
-    resume['affluence'] = affluence_prets(lignes)
-    return resume
+    """Chiffres des prêts non supprimés, agrégés par la base (analytics_sql.py)."""
+    return analytics_sql.analytique_prets(
+        db.session, HeadphoneLoan, HeadphoneLoan.status != LoanStatus.DELETED,
+        especes=DepositType.CASH, carte_identite=DepositType.ID_CARD)
 
 
 @bp_admin.route('/')
@@ -277,6 +286,11 @@ def admin_dashboard():
         # échoue : elle est informative, pas critique.
         current_app.logger.exception("Analytique des prêts de casques indisponible")
         casques = None
+    try:
+        photo_queue = photo_jobs.queue_depth(db.session)
+    except Exception:
+        current_app.logger.exception("File des travaux photo indisponible")
+        photo_queue = None
     return render_template(
         'admin/dashboard.html',
         nb_found=nb_found,
@@ -288,6 +302,7 @@ def admin_dashboard():
         total_sales_eur=total_sales_eur,
         casques=casques,
         visual_model_status=model_status(),
+        photo_queue=photo_queue,
         csrf_form=csrf_form
     )
 
@@ -570,6 +585,7 @@ def admin_set_password(user_id):
 @login_required
 @admin_required
 def helmet_rentals():
+    # Signatures et pièces d'identité chargées à l'ouverture de leur fenêtre.
     rentals = HeadphoneLoan.query.order_by(HeadphoneLoan.loan_date.desc()).all()
     csrf_form = SimpleCsrfForm()
     return render_template('admin/helmet_rentals.html', rentals=rentals, csrf_form=csrf_form)
@@ -578,10 +594,20 @@ def helmet_rentals():
 @login_required
 @admin_required
 def export_helmet_rentals():
-    rentals = HeadphoneLoan.query.order_by(HeadphoneLoan.loan_date.desc()).all()
-    # Format HTML (peut être adapté pour CSV)
-    html = render_template('export_helmet_rentals.html', rentals=rentals)
-    response = make_response(html)
+    # Document hors ligne : les signatures y restent embarquées, mais la page
+    # est rendue au fil de l'eau et seules celles d'un lot de 100 prêts sont
+    # en mémoire à la fois.
+    loan_ids = [loan_id for (loan_id,) in db.session.query(HeadphoneLoan.id)
+                .order_by(HeadphoneLoan.loan_date.desc())]
+
+    def rentals():
+        for start in range(0, len(loan_ids), 100):
+            batch = loan_ids[start:start + 100]
+            by_id = {loan.id: loan for loan in HeadphoneLoan.query.filter(HeadphoneLoan.id.in_(batch))}
+            signatures = loan_attachments.signatures_by_loan(batch)
+            yield from ((by_id[loan_id], signatures.get(loan_id)) for loan_id in batch if loan_id in by_id)
+
+    response = Response(stream_template('export_helmet_rentals.html', rentals=rentals()))
     response.headers['Content-Type'] = 'text/html; charset=utf-8'
     response.headers['Content-Disposition'] = 'attachment; filename=export_locations_casques.html'
     return response
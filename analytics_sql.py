@@ -0,0 +1,188 @@
+"""Agrégats des prêts de casques calculés par la base, pour le tableau de bord.
+
+`analytics.py` reçoit toutes les lignes et les parcourt en Python, avec une
+conversion de fuseau par horodatage : le tableau de bord relisait ainsi chaque
+prêt du festival à chaque affichage. Ici :
+
+* les chiffres clés tiennent en un seul SELECT d'agrégats (SUM/COUNT
+  conditionnels), portable PostgreSQL/SQLite ;
+* l'affluence est un ``GROUP BY date_trunc('hour', …)`` en heure locale sur
+  PostgreSQL, soit au plus 24 lignes par journée de festival ; les autres
+  bases (SQLite du développement) regroupent en Python les seules dates ;
+* l'assemblage des résultats est pur et rend exactement les dictionnaires de
+  `agreger_prets` et `affluence_prets`, qui restent l'implémentation de
+  référence (tests/test_analytics_sql.py compare les deux).
+
+Les fonctions reçoivent les colonnes du prêt (`t.quantity`, `t.loan_date`…)
+d'un modèle ou d'une table, et les valeurs de deposit_type telles qu'elles
+sont comparées en SQL : ce module reste, comme analytics.py, indépendant de
+models.py.
+"""
+from collections import defaultdict
+from datetime import timezone
+from decimal import Decimal
+
+import sqlalchemy as sa
+
+from analytics import FUSEAU_FESTIVAL, _en_heure_locale, _fuseau, libelle_jour
+
+CENTIMES = Decimal('0.01')
+
+
+def _quantite(t):
+    # Même règle que `int(quantity or 1)` : une quantité absente ou nulle vaut 1.
+    return sa.func.coalesce(sa.func.nullif(t.quantity, 0), 1)
+
+
+def _secondes_entre(debut, fin, dialecte: str):
+    if dialecte == 'postgresql':
+        return sa.extract('epoch', fin - debut)
+    return (sa.func.julianday(fin) - sa.func.julianday(debut)) * 86400
+
+
+def expressions_resume(t, especes, carte_identite, dialecte: str) -> list:
+    """Colonnes agrégées (étiquetées) dont `resume_depuis_totaux` tire les chiffres clés."""
+    en_cours = t.return_date.is_(None)
+    rendu_date = sa.and_(t.return_date.isnot(None), t.loan_date.isnot(None))
+
+    def somme(condition, valeur=1):
+        return sa.func.coalesce(sa.func.sum(sa.case((condition, valeur), else_=0)), 0)
+
+    return [
+        sa.func.count().label('prets_total'),
+        somme(en_cours).label('prets_en_cours'),
+        sa.func.coalesce(sa.func.sum(_quantite(t)), 0).label('casques_total'),
+        somme(en_cours, _quantite(t)).label('casques_dehors'),
+        sa.func.sum(sa.case((sa.and_(en_cours, t.deposit_type == especes), t.deposit_amount))
+                    ).label('especes_detenues'),
+        somme(sa.and_(en_cours, t.deposit_type == carte_identite)).label('cartes_detenues'),
+        somme(t.deposit_type == carte_identite).label('caution_ci_total'),
+        somme(t.deposit_type == especes).label('caution_especes_total'),
+        sa.func.sum(sa.case((rendu_date, _secondes_entre(t.loan_date, t.return_date, dialecte)))
+                    ).label('duree_secondes'),
+        somme(rendu_date).label('prets_dures'),
+    ]
+
+
+def resume_depuis_totaux(totaux: dict) -> dict:
+    """Dictionnaire de `agreger_prets` à partir d'une ligne d'`expressions_resume`."""
+    total = int(totaux['prets_total'])
+    en_cours = int(totaux['prets_en_cours'])
+    rendus = total - en_cours
+    especes = totaux['especes_detenues']
+    dures = int(totaux['prets_dures'])
+    return {
+        'casques_dehors':        int(totaux['casques_dehors']),
+        'casques_total':         int(totaux['casques_total']),
+        'prets_en_cours':        en_cours,
+        'prets_rendus':          rendus,
+        'prets_total':           total,
+        'taux_retour':           round(100 * rendus / total) if total else 0,
+        # Numeric(10, 2) : SQLite rend un flottant, ramené au centime.
+        'especes_detenues':      Decimal(str(especes)).quantize(CENTIMES) if especes else Decimal('0'),
+        'cartes_detenues':       int(totaux['cartes_detenues']),
+        'caution_ci_total':      int(totaux['caution_ci_total']),
+        'caution_especes_total': int(totaux['caution_especes_total']),
+        'duree_moyenne_min':     round(float(totaux['duree_secondes']) / 60 / dures) if dures else None,
+    }
+
+
+def _heure_locale_sql(colonne, nom_fuseau: str):
+    # Dates naïves en UTC : timezone('UTC', …) les situe, timezone(fuseau, …)
+    # les ramène en heure locale naïve. Un simple « AT TIME ZONE fuseau » les
+    # prendrait pour de l'heure locale et décalerait tout de deux heures.
+    return sa.func.date_trunc('hour', sa.func.timezone(nom_fuseau, sa.func.timezone('UTC', colonne)))
+
+
+def requetes_creneaux(t, filtre, nom_fuseau: str = FUSEAU_FESTIVAL):
+    """Requêtes PostgreSQL (prêts, retours) groupées par heure locale."""
+    # GROUP BY sur le nom de colonne de sortie : répétée, l'expression y
+    # porterait ses propres paramètres liés, que PostgreSQL ne reconnaît pas
+    # comme ceux du SELECT.
+    heure_pret = _heure_locale_sql(t.loan_date, nom_fuseau).label('heure')
+    prets = (sa.select(heure_pret, sa.func.count().label('nombre'),
+                       sa.func.sum(_quantite(t)).label('casques'))
+             .where(filtre, t.loan_date.isnot(None)).group_by(sa.literal_column('heure')))
+    heure_retour = _heure_locale_sql(t.return_date, nom_fuseau).label('heure')
+    retours = (sa.select(heure_retour, sa.func.count().label('nombre'))
+               .where(filtre, t.return_date.isnot(None)).group_by(sa.literal_column('heure')))
+    return prets, retours
+
+
+def creneaux_depuis_lignes(lignes, nom_fuseau: str = FUSEAU_FESTIVAL) -> list[tuple]:
+    """Regroupement en Python des bases sans fuseaux horaires : (heure locale, prêts, casques, retours)."""
+    tz = _fuseau(nom_fuseau)
+    creneaux = defaultdict(lambda: [0, 0, 0])
+    for ligne in lignes:
+        pris = _en_heure_locale(ligne.loan_date, tz)
+        if pris:
+            creneau = creneaux[pris.replace(minute=0, second=0, microsecond=0, tzinfo=None)]
+            creneau[0] += 1
+            creneau[1] += int(ligne.quantity or 1)
+        rendu = _en_heure_locale(ligne.return_date, tz)
+        if rendu:
+            creneaux[rendu.replace(minute=0, second=0, microsecond=0, tzinfo=None)][2] += 1
+    return [(heure, *valeurs) for heure, valeurs in creneaux.items()]
+
+
+def affluence_depuis_creneaux(creneaux, nom_fuseau: str = FUSEAU_FESTIVAL) -> dict:
+    """Dictionnaire de `affluence_prets` à partir de créneaux (heure locale, prêts, casques, retours)."""
+    prets_par_heure = [0] * 24
+    retours_par_heure = [0] * 24
+    casques_par_heure = [0] * 24
+    par_jour = {}
+
+    def jour(date_locale):
+        return par_jour.setdefault(date_locale, {
+            'date': date_locale, 'libelle': libelle_jour(date_locale),
+            'prets': 0, 'retours': 0, 'casques': 0})
+
+    for heure, prets, casques, retours in creneaux:
+        if prets:
+            prets_par_heure[heure.hour] += prets
+            casques_par_heure[heure.hour] += casques
+            entree = jour(heure.date())
+            entree['prets'] += prets
+            entree['casques'] += casques
+        if retours:
+            retours_par_heure[heure.hour] += retours
+            jour(heure.date())['retours'] += retours
+
+    def pointe(serie):
+        maximum = max(serie)
+        return serie.index(maximum) if maximum else None
+
+    return {
+        'heures':             list(range(24)),
+        'prets_par_heure':    prets_par_heure,
+        'retours_par_heure':  retours_par_heure,
+        'casques_par_heure':  casques_par_heure,
+        'heure_pointe_prets': pointe(prets_par_heure),
+        'heure_pointe_retours': pointe(retours_par_heure),
+        'max_prets_heure':    max(prets_par_heure),
+        'max_retours_heure':  max(retours_par_heure),
+        'par_jour':           sorted(par_jour.values(), key=lambda e: e['date']),
+        'fuseau':             nom_fuseau if _fuseau(nom_fuseau) is not timezone.utc else 'UTC',
+    }
+
+
+def analytique_prets(session, t, filtre, *, especes, carte_identite,
+                     nom_fuseau: str = FUSEAU_FESTIVAL) -> dict:
+    """Chiffres clés et affluence des prêts retenus par `filtre`, comme agreger_prets + affluence_prets."""
+    dialecte = session.get_bind().dialect.name
+    totaux = session.execute(
+        sa.select(*expressions_resume(t, especes, carte_identite, dialecte)).where(filtre)).one()
+    resume = resume_depuis_totaux(totaux._asdict())
+    if dialecte == 'postgresql':
+        requete_prets, requete_retours = requetes_creneaux(t, filtre, nom_fuseau)
+        creneaux = defaultdict(lambda: [0, 0, 0])
+        for heure, nombre, casques in session.execute(requete_prets):
+            creneaux[heure][0:2] = [int(nombre), int(casques)]
+        for heure, nombre in session.execute(requete_retours):
+            creneaux[heure][2] = int(nombre)
+        creneaux = [(heure, *valeurs) for heure, valeurs in creneaux.items()]
+    else:
+        creneaux = creneaux_depuis_lignes(session.execute(
+            sa.select(t.quantity, t.loan_date, t.return_date).where(filtre)), nom_fuseau)
+    resume['affluence'] = affluence_depuis_creneaux(creneaux, nom_fuseau)
+    return resume
@@ -115,6 +115,18 @@ UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 30 * 1024 * 1024  # 30 MB
+# Cache disque des images servies depuis la base (blob_store.py), partagé
+# entre workers et plafonné en taille ; sous instance/, hors de static/ pour
+# n'être ni servi tel quel ni versionné.
+app.config['BLOB_CACHE_DIR'] = os.environ.get('BLOB_CACHE_DIR', os.path.join(app.instance_path, 'blob-cache'))
+app.config['BLOB_CACHE_MAX_BYTES'] = int(os.environ.get('BLOB_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Total affiché sur les listes d'objets, compté jusqu'à ce plafond (« plus de
+# N objets » au-delà) ; 0 pour ne pas l'afficher.
+app.config['LIST_TOTAL_CAP'] = int(os.environ.get('LIST_TOTAL_CAP', '1000'))
+# Pastilles (admin, messages non lus) : durée de vie en cache, voir counters.py.
+# Partagées entre workers via Redis quand REDIS_URL en désigne un.
+app.config['COUNTERS_TTL_SECONDS'] = int(os.environ.get('COUNTERS_TTL_SECONDS', '30'))
+app.config['REDIS_URL'] = os.environ.get('REDIS_URL')
 
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
@@ -123,7 +135,7 @@ limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["300 per minute"],
-    storage_uri=os.environ.get('REDIS_URL', 'memory://'),
+    storage_uri=app.config['REDIS_URL'] or 'memory://',
 )
 
 @app.context_processor
@@ -141,8 +153,11 @@ def inject_unread_count():
     from flask_login import current_user
     try:
         if current_user.is_authenticated:
+            import counters
             from messaging import total_unread
-            return {'unread_msg_count': total_unread(current_user.id)}
+            user_id = current_user.id
+            return {'unread_msg_count': counters.counter_cache().get_or_compute(
+                counters.UNREAD, user_id, lambda: total_unread(user_id))}
     except Exception:
         pass
     return {'unread_msg_count': 0}
@@ -153,23 +168,112 @@ login_manager.login_message_category = 'info'
 
 # Import models and create tables
 import models
+import match_candidates  # enregistre les événements de session qui tiennent la table à jour
+import counters
+counters.register(db.session)  # invalide les pastilles mises en cache après chaque écriture
 from models import User, ItemPhoto
 
 
 @app.cli.command("index-photo-embeddings")
 @click.option("--force", is_flag=True, help="Recalculate all photos for the configured model version.")
-def index_photo_embeddings_command(force):
-    """Index missing photo embeddings; use --force after a model change."""
+@click.option("--batch-size", type=int, default=None,
+              help="Images per forward pass (default: VISUAL_MATCHER_BATCH_SIZE or 16).")
+@click.option("--threads", type=int, default=0, help="torch intra-op threads (0: torch default).")
+def index_photo_embeddings_command(force, batch_size, threads):
+    """Index missing photo embeddings in batches; use --force after a model change.
+
+    Only photo ids are listed up front; bytes are loaded one batch at a time
+    and committed with it, so memory stays bounded by the batch size.
+    """
+    import time
     import click
-    from photo_embeddings import ensure_photo_embedding, current_model_version
-    count = 0
-    for photo in ItemPhoto.query.order_by(ItemPhoto.id).yield_per(50):
-        ensure_photo_embedding(photo, force=force)
-        count += 1
-        if count % 25 == 0:
-            db.session.commit()
-    db.session.commit()
-    click.echo(f"{count} photo(s) indexed for {current_model_version()}.")
+    import visual_matcher
+    from models import PhotoEmbedding
+    from photo_embeddings import FAILED, READY, ensure_photo_embeddings, current_model_version
+
+    visual_matcher.set_num_threads(threads)
+    batch_size = batch_size or visual_matcher.DEFAULT_BATCH_SIZE
+    version = current_model_version()
+    query = db.session.query(ItemPhoto.id)
+    if not force:
+        ready = db.session.query(PhotoEmbedding.item_photo_id).filter_by(model_version=version, status=READY)
+        query = query.filter(ItemPhoto.id.notin_(ready))
+    ids = [photo_id for (photo_id,) in query.order_by(ItemPhoto.id)]
+    count = failed = 0
+    started = time.perf_counter()
+    for start in range(0, len(ids), batch_size):
+        photos = (ItemPhoto.query.options(sqlalchemy.orm.undefer(ItemPhoto.data))
+                  .filter(ItemPhoto.id.in_(ids[start:start + batch_size])).order_by(ItemPhoto.id).all())
+        records = ensure_photo_embeddings(photos, force=force, batch_size=batch_size)
+        failed += sum(1 for record in records if record is not None and record.status == FAILED)
+        db.session.commit()
+        count += len(photos)
+        elapsed = time.perf_counter() - started
+        click.echo(f"  {count}/{len(ids)} photo(s), {count / elapsed if elapsed else 0.0:.1f} images/s")
+    click.echo(f"{count} photo(s) indexed for {version} ({failed} failed).")
+
+
+@app.cli.command("bench-visual-matcher")
+@click.option("--backend", "backends", multiple=True, type=click.Choice(["torch", "int8", "onnx"]),
+              help="Backend to measure (repeatable; default: all three).")
+@click.option("--images", "image_count", default=32, show_default=True,
+              help="Images to embed: stored photos first, synthetic ones if there are too few.")
+@click.option("--batch-size", default=16, show_default=True)
+@click.option("--rounds", default=3, show_default=True, help="Throughput passes over the image set.")
+def bench_visual_matcher_command(backends, image_count, batch_size, rounds):
+    """Compare visual_matcher backends: load time, latency, throughput and peak RSS.
+
+    Each backend runs in its own fresh process so its peak RSS is not
+    inflated by the models measured before it.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    import visual_matcher
+
+    images = [bytes(data) for (data,) in db.session.query(ItemPhoto.data)
+              .filter(ItemPhoto.data.isnot(None)).order_by(ItemPhoto.id.desc()).limit(image_count)]
+    stored = len(images)
+    images += visual_matcher.sample_images(image_count - stored)
+    click.echo(f"{len(images)} image(s) ({stored} stored photo(s)), batches of {batch_size}.")
+    click.echo(f"{'backend':<8} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>7} {'RSS Mo':>8}")
+    context = multiprocessing.get_context("spawn")
+    for name in backends or ("torch", "int8", "onnx"):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            row = pool.submit(visual_matcher.benchmark_backend, name, images, batch_size, rounds).result()
+        if "error" in row:
+            click.echo(f"{name:<8} unavailable: {row['error']}")
+            continue
+        click.echo(f"{name:<8} {row['load_s']:>7} {row['latency_ms_p50']:>8} {row['latency_ms_p95']:>8} "
+                   f"{row['images_per_s']:>7} {row['max_rss_mb']:>8}")
+
+
+@app.cli.command("photo-worker")
+@click.option("--batch-size", default=4, show_default=True, help="Jobs reserved per round trip.")
+@click.option("--poll-interval", default=5.0, show_default=True, help="Seconds to wait when the queue is empty.")
+@click.option("--once", is_flag=True, help="Drain the queue, then exit.")
+def photo_worker_command(batch_size, poll_interval, once):
+    """Process queued photo jobs: pHash and DINOv2 vectors (see photo_jobs.py)."""
+    import photo_jobs
+    count = photo_jobs.run_worker(db.session, batch_size=batch_size, poll_interval=poll_interval, once=once)
+    click.echo(f"{count} photo job(s) processed.")
+
+
+@app.cli.command("backfill-embedding-vectors")
+@click.option("--batch-size", default=500, show_default=True, help="Rows copied per transaction.")
+@click.option("--force", is_flag=True, help="Rewrite vectors already copied.")
+def backfill_embedding_vectors_command(batch_size, force):
+    """Copy bytea embeddings into the optional pgvector column (see migrations/README.md).
+
+    New embeddings are mirrored as they are computed; this command covers the
+    rows indexed before the optional migration was applied.
+    """
+    from photo_embeddings import backfill_embedding_vectors
+    try:
+        count = backfill_embedding_vectors(db.session, batch_size=batch_size, force=force)
+    except RuntimeError as exc:
+        click.echo(f"{exc}. Apply migrations/optional/20260724_02_photo_embeddings_pgvector_optional.py first.")
+        return
+    click.echo(f"{count} vector(s) copied into embedding_vector.")
 
 
 @app.cli.command("photos-status")
@@ -215,11 +319,32 @@ def photos_status_command():
                    f"{len(noms)} photo(s), {octets // 1024} Ko  {noms[0] if noms else ''}")
 
 
+@app.cli.command("rebuild-match-candidates")
+def rebuild_match_candidates_command():
+    """Recalcule entièrement la table match_candidates.
+
+    À lancer au déploiement d'une nouvelle version du moteur : d'ici là (ou
+    jusqu'à ce que le worker photo s'en charge), /matches calcule les paires à
+    la volée. Utile aussi après un import massif fait hors de l'application.
+    """
+    import matching
+    count = match_candidates.rebuild_all(db.session)
+    db.session.commit()
+    click.echo(f"{count} paire(s) au-dessus du plancher "
+               f"({matching.MATCH_CONFIG['candidate_floor']}) enregistrée(s).")
+
+
 @app.cli.command("calibrate-matching")
 @click.option("--min-seuil", default=50, help="Seuil le plus bas balayé.")
 @click.option("--max-seuil", default=98, help="Seuil le plus haut balayé.")
 @click.option("--pas", default=5, help="Pas du balayage.")
-def calibrate_matching_command(min_seuil, max_seuil, pas):
+@click.option("--workers", default=1, show_default=True,
+              help="Processus de calcul (0 : un par cœur).")
+@click.option("--sample", type=int, default=None,
+              help="Au plus N perdus et N trouvés tirés au hasard (les paires jugées sont toujours gardées).")
+@click.option("--output", type=click.Choice(["texte", "csv", "json"]), default="texte",
+              help="csv/json : balayage seul, sur la sortie standard.")
+def calibrate_matching_command(min_seuil, max_seuil, pas, workers, sample, output):
     """Mesure les seuils de matching sur les données réelles du festival.
 
     Les valeurs par défaut de MATCH_CONFIG ont été calibrées sur un corpus
@@ -229,11 +354,18 @@ def calibrate_matching_command(min_seuil, max_seuil, pas):
     combien de paires seraient proposées, le rappel et la précision.
 
     À lancer après la première demi-journée d'exploitation, une fois que les
-    agents ont validé et rejeté quelques dizaines de paires.
+    agents ont validé et rejeté quelques dizaines de paires. Sur les données
+    complètes d'une fin de festival, `--workers 0` répartit le calcul sur
+    tous les cœurs (voir calibration.py).
     """
+    import os
+    import sys
+    import numpy as np
+    import calibration
     import matching
     from models import Item, Status, Match, RejectedPair
-    from views import _item_pair_bonus, _compute_weighted_score, _embedding_similarity_pct
+    from match_blocking import candidate_pairs
+    from match_features import load_features
 
     valides = {(m.lost_id, m.found_id) for m in Match.query.all()}
     rejetes = {(r.lost_id, r.found_id) for r in RejectedPair.query.all()}
@@ -241,42 +373,81 @@ def calibrate_matching_command(min_seuil, max_seuil, pas):
         click.echo("Aucune paire validée : impossible de mesurer le rappel. "
                    "Relancez après que les agents aient validé des correspondances.")
         return
+    texte = output == "texte"
+    echo = click.echo if texte else (lambda *args, **kwargs: None)
 
     perdus = Item.query.filter_by(status=Status.LOST).all()
     trouves = Item.query.filter_by(status=Status.FOUND).all()
-    click.echo(f"{len(perdus)} perdus × {len(trouves)} trouvés = "
-               f"{len(perdus) * len(trouves)} paires — "
-               f"{len(valides)} validée(s), {len(rejetes)} rejetée(s)")
-
-    fields_weights = matching.MATCH_CONFIG['fields_weights']
-    scores = {}
-    for lost in perdus:
-        for found in trouves:
-            base = matching.match_score(lost, found, fields_weights)
-            bonus = _item_pair_bonus(lost, found)
-            img = _embedding_similarity_pct(lost, found)
-            scores[(lost.id, found.id)] = _compute_weighted_score(base, img, bonus)
+    if sample:
+        rng = np.random.default_rng(0)
+        perdus = calibration.sample_items(perdus, sample, {lost_id for lost_id, _ in valides | rejetes}, rng)
+        trouves = calibration.sample_items(trouves, sample, {found_id for _, found_id in valides | rejetes}, rng)
+    echo(f"{len(perdus)} perdus × {len(trouves)} trouvés = "
+         f"{len(perdus) * len(trouves)} paires — "
+         f"{len(valides)} validée(s), {len(rejetes)} rejetée(s)"
+         + (" (échantillon)" if sample else ""))
+
+    features = load_features(db.session, perdus + trouves)
+    workers = workers or os.cpu_count() or 1
+    matrice = calibration.score_all([features[i.id] for i in perdus],
+                                    [features[i.id] for i in trouves], workers=workers)
+    ligne = {item.id: i for i, item in enumerate(perdus)}
+    colonne = {item.id: j for j, item in enumerate(trouves)}
+
+    def masque(paires):
+        result = np.zeros(matrice.shape, dtype=bool)
+        for lost_id, found_id in paires:
+            if lost_id in ligne and found_id in colonne:
+                result[ligne[lost_id], colonne[found_id]] = True
+        return result
+
+    balayage = calibration.threshold_sweep(matrice, masque(valides), masque(rejetes),
+                                           range(min_seuil, max_seuil + 1, pas))
+    if not texte:
+        calibration.write_sweep(balayage, output, sys.stdout)
+        return
 
-    click.echo("")
-    click.echo(f"{'seuil':>6} {'proposées':>10} {'rappel':>8} {'précision':>10}  (sur paires jugées)")
-    for seuil in range(min_seuil, max_seuil + 1, pas):
-        retenues = {k for k, v in scores.items() if v >= seuil}
-        vp = len(retenues & valides)
-        fp = len(retenues & rejetes)
-        rappel = 100.0 * vp / len(valides)
-        precision = 100.0 * vp / (vp + fp) if (vp + fp) else float('nan')
-        click.echo(f"{seuil:>6} {len(retenues):>10} {rappel:>7.0f}% {precision:>9.1f}%")
+    echo("")
+    echo(f"{'seuil':>6} {'proposées':>10} {'rappel':>8} {'précision':>10}  (sur paires jugées)")
+    for row in balayage:
+        echo(f"{row['seuil']:>6} {row['proposees']:>10} {row['rappel']:>7.0f}% {row['precision']:>9.1f}%")
 
+    def score(paire):
+        lost_id, found_id = paire
+        return float(matrice[ligne[lost_id], colonne[found_id]])
+
+    jugees = [k for k in valides if k[0] in ligne and k[1] in colonne]
     actuel = matching.MATCH_CONFIG['threshold_default']
-    manquees = [k for k in valides if scores.get(k, 0.0) < actuel]
-    click.echo("")
-    click.echo(f"Seuil configuré actuellement : {actuel}")
+    manquees = [k for k in jugees if score(k) < actuel]
+    echo("")
+    echo(f"Seuil configuré actuellement : {actuel}")
     if manquees:
-        click.echo(f"⚠ {len(manquees)} paire(s) validée(s) passeraient SOUS ce seuil :")
-        for lost_id, found_id in manquees[:20]:
-            click.echo(f"   perdu #{lost_id} ↔ trouvé #{found_id} : {scores.get((lost_id, found_id), 0.0)}")
+        echo(f"⚠ {len(manquees)} paire(s) validée(s) passeraient SOUS ce seuil :")
+        for paire in manquees[:20]:
+            echo(f"   perdu #{paire[0]} ↔ trouvé #{paire[1]} : {score(paire)}")
     else:
-        click.echo("✓ Toutes les paires validées sont au-dessus du seuil configuré.")
+        echo("✓ Toutes les paires validées sont au-dessus du seuil configuré.")
+
+    # Blocage (match_blocking.py) : les scores ci-dessus portent sur toutes les
+    # paires ; on mesure à part ce que le blocage aurait écarté, sur les paires
+    # mêmes que retiennent /matches, la table match_candidates et la page d'un
+    # objet (clés communes et photos proches).
+    retenues = candidate_pairs({lost.id: features[lost.id] for lost in perdus},
+                               {found.id: features[found.id] for found in trouves}, enabled=True)
+    scorees = len(retenues)
+    ecartees = [k for k in jugees if k not in retenues]
+    etat = "activé" if matching.MATCH_CONFIG['blocking_enabled'] else "désactivé"
+    part = 100.0 * scorees / matrice.size if matrice.size else 0.0
+    echo("")
+    echo(f"Blocage ({etat}) : {scorees} paire(s) scorée(s) sur {matrice.size} ({part:.0f} %)")
+    if ecartees:
+        perte = 100.0 * len(ecartees) / len(jugees)
+        echo(f"⚠ {len(ecartees)} paire(s) validée(s) écartée(s) par le blocage "
+             f"(rappel perdu : {perte:.1f} %) :")
+        for paire in ecartees[:20]:
+            echo(f"   perdu #{paire[0]} ↔ trouvé #{paire[1]} : {score(paire)}")
+    else:
+        echo("✓ Aucune paire validée n'est écartée par le blocage.")
 
 
 with app.app_context():
@@ -296,8 +467,7 @@ with app.app_context():
                     quantity INTEGER NOT NULL DEFAULT 1,
                     deposit_amount NUMERIC(10,2),
                     loan_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                    return_date TIMESTAMP,
-                    signature TEXT
+                    return_date TIMESTAMP
                 )
             '''))
             # Ajout automatique des colonnes manquantes (Railway, PostgreSQL)
@@ -329,13 +499,8 @@ with app.app_context():
             if result.fetchone() is None:
                 conn.execute(sqlalchemy.text("ALTER TABLE headphone_loans ADD COLUMN previous_status VARCHAR(20);"))
                 conn.execute(sqlalchemy.text("COMMIT;"))
-            # Ajoute id_card_photo si manquant
-            result = conn.execute(sqlalchemy.text("""
-                SELECT column_name FROM information_schema.columns WHERE table_name='headphone_loans' AND column_name='id_card_photo'
-            """))
-            if result.fetchone() is None:
-                conn.execute(sqlalchemy.text("ALTER TABLE headphone_loans ADD COLUMN id_card_photo TEXT;"))
-                conn.execute(sqlalchemy.text("COMMIT;"))
+            # signature et id_card_photo ne sont plus recréées : les images
+            # vivent dans loan_attachments (migration 20261017_09).
             # --- Ensure shuttle_settings columns exist ---
             try:
                 # loop_enabled
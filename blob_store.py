@@ -0,0 +1,248 @@
+"""Photos adressées par contenu, avec un cache disque devant les colonnes bytea.
+
+/uploads/<fichier> retombait, pour chaque image absente du disque, sur quatre
+requêtes successives (photos d'objets, photo historique, photo de restitution,
+produits) qui relisaient le contenu binaire depuis PostgreSQL à chaque
+affichage. Désormais :
+
+* la table photo_blob_refs associe une fois pour toutes un nom de fichier à
+  l'empreinte SHA-256 de son contenu (`image_hash`, déjà utilisée pour les
+  vecteurs DINOv2) et à la ligne qui porte les octets ;
+* les octets lus une fois sont gardés sur disque sous leur empreinte, dans un
+  cache plafonné en taille (les fichiers les moins récemment servis partent en
+  premier) ;
+* l'empreinte sert d'ETag : un navigateur qui a déjà l'image reçoit un 304
+  sans que la base ni le disque soient lus.
+
+Un nom de fichier est généré à chaque upload (uuid) et son contenu ne change
+jamais, d'où une association sans invalidation.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from photo_embeddings import image_hash
+
+_LOGGER = logging.getLogger(__name__)
+
+# Taille visée après une éviction, en fraction du plafond : libérer un peu plus
+# que le strict nécessaire évite de rebalayer le cache à chaque écriture.
+EVICT_TO = 0.9
+# Au-delà de ce délai, le total tenu en mémoire est recalculé par un balayage
+# complet : il ignore les écritures des autres workers.
+RESCAN_SECONDS = 300
+
+
+def blob_key(data: bytes) -> str:
+    """Empreinte du contenu, identique à celle de photo_embeddings."""
+    return image_hash(data)
+
+
+class DiskCache:
+    """Fichiers nommés par leur empreinte sous `root/ab/abcdef…`, plafonnés à `max_bytes`.
+
+    L'ordre LRU repose sur la date de modification, remise à jour à chaque
+    lecture : le cache est partagé tel quel entre les workers gunicorn et
+    survit à leur redémarrage. Seule une estimation de la taille totale est
+    gardée en mémoire, pour ne balayer le répertoire qu'une fois le plafond
+    atteint ou l'estimation trop ancienne (`RESCAN_SECONDS`).
+    """
+
+    def __init__(self, root: str, max_bytes: int, clock=time.monotonic):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._total: int | None = None
+        self._scanned_at = 0.0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str) -> str | None:
+        """Chemin du fichier en cache (marqué comme récemment servi), None s'il est absent."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        """Écrit le contenu puis évince si le plafond est dépassé ; renvoie le chemin."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Fichier temporaire puis renommage atomique : un autre worker ne lit
+        # jamais un fichier à moitié écrit.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            stale = self._total is None or self._clock() - self._scanned_at >= RESCAN_SECONDS
+            if not stale:
+                # Une clé réécrite compte deux fois : l'estimation ne fait
+                # qu'avancer le prochain balayage.
+                self._total += len(data)
+            if not stale and self._total <= self.max_bytes:
+                return path
+        self.evict(keep=key)
+        return path
+
+    def evict(self, keep: str | None = None) -> int:
+        """Balaye le cache, supprime les fichiers les plus anciens au-delà du plafond ; renvoie le nombre supprimé."""
+        with self._lock:
+            self._scanned_at = self._clock()
+            entries = []
+            for directory, _, files in os.walk(self.root):
+                for name in files:
+                    if name.startswith('.tmp-'):
+                        continue
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, name, path))
+            total = sum(size for _, size, _, _ in entries)
+            self._total = total
+            if total <= self.max_bytes:
+                return 0
+            target = self.max_bytes * EVICT_TO
+            removed = 0
+            for _, size, name, path in sorted(entries):
+                if total <= target:
+                    break
+                if name == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self._total = total
+            return removed
+
+
+def _sources():
+    """Colonnes binaires servies par /uploads, dans l'ordre de l'ancienne recherche.
+
+    nom → (modèle, colonne du nom de fichier, colonne binaire, colonne MIME, libellé).
+    """
+    from models import Item, ItemPhoto, Product
+    return {
+        'item_photo': (ItemPhoto, ItemPhoto.filename, ItemPhoto.data, ItemPhoto.mime_type, 'photo objet'),
+        'item': (Item, Item.photo_filename, Item.photo_data, Item.photo_mime_type, 'photo historique'),
+        'item_return': (Item, Item.return_photo_filename, Item.return_photo_data,
+                        Item.return_photo_mime_type, 'photo restitution'),
+        'product': (Product, Product.image_filename, Product.image_data, Product.image_mime_type,
+                    'produit boutique'),
+    }
+
+
+def _register(filename: str):
+    """Cherche le fichier dans chaque source, enregistre l'association ; (ref, octets) ou (None, None).
+
+    Ne sert qu'à la première lecture d'un fichier. Chaque source est
+    interrogée séparément : une erreur sur l'une (table absente, modèle
+    désynchronisé) ne doit pas masquer les autres.
+    """
+    from app import db
+    from models import PhotoBlobRef
+
+    for source, (model, filename_col, data_col, mime_col, libelle) in _sources().items():
+        try:
+            row = db.session.query(model.id, data_col, mime_col).filter(filename_col == filename).first()
+        except Exception:
+            db.session.rollback()
+            _LOGGER.exception("Recherche d'image impossible dans %s", libelle)
+            continue
+        if row is None or not row[1]:
+            continue
+        data = bytes(row[1])
+        ref = PhotoBlobRef(filename=filename, blob_key=blob_key(data), mime_type=row[2],
+                           source=source, source_id=row[0], size_bytes=len(data))
+        try:
+            db.session.add(ref)
+            db.session.commit()
+        except Exception:
+            # Deux workers ont servi le même fichier en même temps : l'autre a
+            # déjà écrit la ligne, le contenu est le même.
+            db.session.rollback()
+            ref = db.session.get(PhotoBlobRef, filename) or ref
+        return ref, data
+    return None, None
+
+
+def lookup(filename: str):
+    """Association nom de fichier → empreinte, enregistrée à la première lecture.
+
+    Renvoie (ref, octets) : les octets ne sont fournis que lorsqu'ils viennent
+    d'être lus pour enregistrer l'association, None sinon.
+    """
+    from app import db
+    from models import PhotoBlobRef
+
+    if not filename:
+        return None, None
+    ref = db.session.get(PhotoBlobRef, filename)
+    if ref is not None:
+        return ref, None
+    return _register(filename)
+
+
+def load(ref) -> bytes | None:
+    """Octets désignés par `ref` ; une association orpheline est supprimée."""
+    from app import db
+
+    source = _sources().get(ref.source)
+    if source is None:
+        return None
+    model, _, data_col, _, _ = source
+    data = db.session.query(data_col).filter(model.id == ref.source_id).scalar()
+    if data:
+        return bytes(data)
+    # La ligne a été supprimée (objet purgé, produit retiré) : on oublie
+    # l'association plutôt que de la relire à chaque requête.
+    db.session.delete(ref)
+    db.session.commit()
+    return None
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def disk_cache() -> DiskCache:
+    """Le cache disque configuré (BLOB_CACHE_DIR, BLOB_CACHE_MAX_BYTES)."""
+    global _CACHE
+    from flask import current_app
+
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = DiskCache(current_app.config['BLOB_CACHE_DIR'],
+                               current_app.config['BLOB_CACHE_MAX_BYTES'])
+        return _CACHE
+
+
+def cached_path(ref, data: bytes | None = None) -> str | None:
+    """Chemin du fichier en cache pour `ref`, rempli depuis la base si besoin."""
+    cache = disk_cache()
+    path = cache.get(ref.blob_key)
+    if path is not None:
+        return path
+    if data is None:
+        data = load(ref)
+        if data is None:
+            return None
+    return cache.put(ref.blob_key, data)
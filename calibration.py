@@ -0,0 +1,127 @@
+"""Calibration des seuils de matching : score de toutes les paires et balayage.
+
+`flask calibrate-matching` scorait chaque paire perdu × trouvé sur un seul
+cœur, puis reconstruisait des ensembles Python pour chaque seuil balayé : des
+minutes sur les données complètes d'une fin de festival. Ici :
+
+* les perdus sont découpés en tranches, scorées dans un ProcessPoolExecutor ;
+  chaque processus reçoit une fois pour toutes les tables de caractéristiques
+  (immuables) via l'initialiseur, et ne renvoie que sa tranche de la matrice ;
+* le balayage trie les scores une seule fois : pour chaque seuil, le nombre de
+  paires proposées, de vrais et de faux positifs se lit dans des sommes
+  cumulées.
+
+Module pur : il ne travaille que sur des matching.MatchFeatures et des
+tableaux NumPy, sans base de données ni application Flask — un processus
+de calcul n'a donc rien d'autre à importer.
+"""
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import matching
+
+# Tranches par processus : assez pour équilibrer la charge, assez peu pour que
+# le coût de transmission des résultats reste négligeable.
+_SHARDS_PER_WORKER = 4
+
+_worker_lost = None
+_worker_found = None
+
+
+def _init_worker(lost_features, found_features):
+    global _worker_lost, _worker_found
+    _worker_lost = lost_features
+    _worker_found = found_features
+
+
+def _score_shard(bounds):
+    start, stop = bounds
+    # workers=1 : le parallélisme est déjà celui des processus.
+    scores, _, _, _ = matching.pair_score_matrix(_worker_lost[start:stop], _worker_found, workers=1)
+    return start, scores
+
+
+def _shard_bounds(count: int, shards: int) -> list[tuple[int, int]]:
+    size = max(1, -(-count // shards))
+    return [(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+def score_all(lost_features, found_features, workers: int = 1) -> np.ndarray:
+    """Matrice des scores finaux perdus × trouvés, calculée sur `workers` processus."""
+    lost_features, found_features = list(lost_features), list(found_features)
+    if workers <= 1 or len(lost_features) < 2:
+        return matching.pair_score_matrix(lost_features, found_features)[0]
+    scores = np.zeros((len(lost_features), len(found_features)))
+    bounds = _shard_bounds(len(lost_features), workers * _SHARDS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(lost_features, found_features)) as pool:
+        for start, block in pool.map(_score_shard, bounds):
+            scores[start:start + block.shape[0]] = block
+    return scores
+
+
+def threshold_sweep(scores, validated, rejected, thresholds) -> list[dict]:
+    """Paires proposées, rappel et précision pour chaque seuil.
+
+    `scores` : scores de toutes les paires (tableau à plat) ; `validated` et
+    `rejected` : masques booléens de même forme. Le rappel porte sur les paires
+    validées présentes dans `scores` ; la précision sur les paires jugées.
+    """
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    order = np.argsort(scores, kind='stable')
+    ordered = scores[order]
+    # Sommes cumulées depuis les meilleurs scores : la case k compte les
+    # paires de rang >= k dans l'ordre croissant.
+    validated_from = np.concatenate([np.cumsum(np.asarray(validated).ravel()[order][::-1])[::-1], [0]])
+    rejected_from = np.concatenate([np.cumsum(np.asarray(rejected).ravel()[order][::-1])[::-1], [0]])
+    total_validated = int(validated_from[0]) if scores.size else 0
+
+    rows = []
+    for threshold in thresholds:
+        first = int(np.searchsorted(ordered, threshold, side='left'))
+        tp = int(validated_from[first])
+        fp = int(rejected_from[first])
+        rows.append({
+            'seuil': threshold,
+            'proposees': int(scores.size - first),
+            'vrais_positifs': tp,
+            'faux_positifs': fp,
+            'rappel': 100.0 * tp / total_validated if total_validated else float('nan'),
+            'precision': 100.0 * tp / (tp + fp) if (tp + fp) else float('nan'),
+        })
+    return rows
+
+
+def sample_items(items, size: int, keep_ids, rng) -> list:
+    """Au plus `size` objets tirés au hasard, en gardant toujours ceux de `keep_ids`.
+
+    Les objets des paires jugées restent dans l'échantillon : rappel et
+    précision sont ainsi mesurés sur toutes les paires jugées.
+    """
+    if size is None or len(items) <= size:
+        return list(items)
+    kept = [item for item in items if item.id in keep_ids]
+    others = [item for item in items if item.id not in keep_ids]
+    room = max(0, size - len(kept))
+    chosen = [others[i] for i in sorted(rng.choice(len(others), size=min(room, len(others)), replace=False))]
+    return kept + chosen
+
+
+def write_sweep(rows, fmt: str, stream) -> None:
+    """Écrit le balayage en CSV ou JSON (NaN → vide / null)."""
+    def clean(value):
+        return None if isinstance(value, float) and np.isnan(value) else value
+
+    if fmt == 'json':
+        json.dump([{k: clean(v) for k, v in row.items()} for row in rows], stream, indent=2)
+        stream.write('\n')
+    elif fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=list(rows[0]) if rows else ['seuil'])
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: '' if clean(v) is None else v for k, v in row.items()})
+    else:
+        raise ValueError(f"Format inconnu : {fmt}")
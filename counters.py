@@ -0,0 +1,236 @@
+"""Compteurs des pastilles (admin, messages non lus) mis en cache, invalidés à l'écriture.
+
+Les processeurs de contexte `admin_counters_ctx` et `inject_unread_count`
+recomptaient à chaque rendu de page : objets et prêts en attente de
+suppression, dernière clôture Z puis ventes depuis celle-ci, messages non lus
+(une jointure sur trois tables). Soit quatre à cinq requêtes par page pour des
+chiffres qui ne changent qu'à quelques écritures précises.
+
+Ici chaque valeur est gardée quelques secondes (`COUNTERS_TTL_SECONDS`) :
+
+* dans Redis si `REDIS_URL` désigne un serveur Redis (le même que le rate
+  limiting), partagé par tous les workers gunicorn ;
+* sinon dans la mémoire du worker : l'invalidation ne touche alors que le
+  worker qui a écrit, les autres se remettent à jour à l'expiration.
+
+Les écritures qui changent ces chiffres invalident le cache après leur commit
+(`register`, événements de session) : une table surveillée modifiée sur l'une
+de ses colonnes comptées fait passer le groupe concerné à une nouvelle
+« génération », dont les clés sont vides. Un calcul lancé avant l'invalidation
+et terminé après écrit donc sous l'ancienne génération, que personne ne relit.
+"""
+import json
+import logging
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+KEY_PREFIX = 'lf:counters:'
+ADMIN = 'admin'
+UNREAD = 'unread'
+
+# Table → (groupe, colonnes dont la modification change un compteur, colonne
+# désignant la seule clé concernée ou None pour tout le groupe). Insertions et
+# suppressions comptent toujours.
+WATCHED = {
+    'items': (ADMIN, ('status',), None),
+    'headphone_loans': (ADMIN, ('status',), None),
+    'sales': (ADMIN, (), None),
+    'z_closures': (ADMIN, ('to_ts',), None),
+    'messages': (UNREAD, ('is_deleted',), None),
+    'conversations': (UNREAD, ('is_archived',), None),
+    # Lire une conversation ne change que son propre compteur.
+    'conversation_participants': (UNREAD, ('last_read_at',), 'user_id'),
+}
+
+_PENDING = 'counters_pending'
+
+
+class LocalBackend:
+    """Dictionnaire en mémoire du processus, avec expiration."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._values: dict[str, tuple[float | None, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            found = self._values.get(key)
+            if found is None:
+                return None
+            expires, value = found
+            if expires is not None and expires <= self._clock():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        with self._lock:
+            # Purge au passage : les clés des générations abandonnées ne sont
+            # plus jamais relues et s'accumuleraient sinon.
+            now = self._clock()
+            if len(self._values) > 10_000:
+                self._values = {k: v for k, v in self._values.items() if v[0] is None or v[0] > now}
+            self._values[key] = (now + ttl, value)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._values.get(key, (None, '0'))[1]) + 1
+            self._values[key] = (None, str(value))
+            return value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+
+class RedisBackend:
+    """Même interface sur un client redis-py (réponses décodées)."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def get(self, key: str) -> str | None:
+        return self._client.get(key)
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        self._client.set(key, value, ex=ttl)
+
+    def incr(self, key: str) -> int:
+        return self._client.incr(key)
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+
+class CounterCache:
+    """Valeurs JSON rangées par groupe et par clé, sous la génération courante du groupe."""
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+
+    def _key(self, group: str, key) -> str:
+        generation = self.backend.get(f'{KEY_PREFIX}gen:{group}') or '0'
+        return f'{KEY_PREFIX}{group}:{generation}:{key}'
+
+    def get_or_compute(self, group: str, key, compute):
+        """Valeur en cache, sinon `compute()` mémorisée ; calculée sans cache si celui-ci est indisponible."""
+        try:
+            full_key = self._key(group, key)
+            cached = self.backend.get(full_key)
+        except Exception:
+            _LOGGER.warning("Cache des compteurs indisponible, calcul direct", exc_info=True)
+            return compute()
+        if cached is not None:
+            return json.loads(cached)
+        value = compute()
+        try:
+            self.backend.set(full_key, json.dumps(value), self.ttl)
+        except Exception:
+            _LOGGER.warning("Cache des compteurs indisponible en écriture", exc_info=True)
+        return value
+
+    def invalidate(self, group: str, key=None) -> None:
+        """Oublie une clé du groupe, ou tout le groupe si `key` est None."""
+        try:
+            if key is None:
+                self.backend.incr(f'{KEY_PREFIX}gen:{group}')
+            else:
+                self.backend.delete(self._key(group, key))
+        except Exception:
+            # Les valeurs restantes expireront d'elles-mêmes.
+            _LOGGER.warning("Invalidation des compteurs %s impossible", group, exc_info=True)
+
+
+def _make_backend(redis_url: str | None):
+    if redis_url and redis_url.startswith(('redis://', 'rediss://', 'unix://')):
+        try:
+            import redis
+        except ImportError:
+            _LOGGER.warning("REDIS_URL défini mais le paquet redis est absent : compteurs en mémoire locale")
+        else:
+            # Délais courts : un Redis lent ne doit pas retenir le rendu des pages.
+            return RedisBackend(redis.Redis.from_url(
+                redis_url, decode_responses=True, socket_timeout=0.25, socket_connect_timeout=0.25))
+    return LocalBackend()
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def counter_cache() -> CounterCache:
+    """Le cache configuré (REDIS_URL, COUNTERS_TTL_SECONDS)."""
+    global _CACHE
+    from flask import current_app
+
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = CounterCache(_make_backend(current_app.config.get('REDIS_URL')),
+                                  current_app.config['COUNTERS_TTL_SECONDS'])
+        return _CACHE
+
+
+# ── Invalidation à l'écriture ─────────────────────────────────────────────────
+
+def touched(table: str, changed: set[str] | None, row: dict) -> tuple[str, object] | None:
+    """(groupe, clé ou None) à invalider pour une ligne écrite, None si aucun compteur ne bouge.
+
+    `changed` : colonnes modifiées, None pour une insertion ou une suppression.
+    `row` : valeurs de la ligne, pour la colonne qui désigne la clé.
+    """
+    watched = WATCHED.get(table)
+    if watched is None:
+        return None
+    group, columns, key_column = watched
+    if changed is not None and not changed.intersection(columns):
+        return None
+    return group, row.get(key_column) if key_column else None
+
+
+def register(session) -> None:
+    """Branche l'invalidation sur `session` (la session de Flask-SQLAlchemy)."""
+    import sqlalchemy as sa
+    from sqlalchemy import event
+
+    @event.listens_for(session, 'after_flush')
+    def _collect(session, flush_context):
+        pending = session.info.setdefault(_PENDING, set())
+        for objects, dirty in ((session.new, False), (session.deleted, False), (session.dirty, True)):
+            for obj in objects:
+                table = getattr(obj, '__tablename__', None)
+                if table not in WATCHED:
+                    continue
+                _, columns, key_column = WATCHED[table]
+                changed = None
+                if dirty:
+                    attrs = sa.inspect(obj).attrs
+                    changed = {column for column in columns if attrs[column].history.has_changes()}
+                row = {key_column: getattr(obj, key_column, None)} if key_column else {}
+                found = touched(table, changed, row)
+                if found is not None:
+                    pending.add(found)
+
+    @event.listens_for(session, 'after_commit')
+    def _invalidate(session):
+        # Après le commit seulement : invalider avant laisserait un autre worker
+        # recompter l'ancien état et le remettre en cache.
+        pending = session.info.pop(_PENDING, None)
+        if not pending:
+            return
+        try:
+            cache = counter_cache()
+        except RuntimeError:
+            # Hors contexte d'application (script) : rien n'a pu être mis en cache.
+            return
+        for group, key in pending:
+            # Une clé isolée est couverte par l'invalidation de tout son groupe.
+            if key is None or (group, None) not in pending:
+                cache.invalidate(group, key)
+
+    @event.listens_for(session, 'after_soft_rollback')
+    def _forget(session, previous_transaction):
+        session.info.pop(_PENDING, None)
@@ -0,0 +1,227 @@
+"""Export des objets d'un statut en archive ZIP, produite au fil de l'eau.
+
+L'export HTML historique chargeait jusqu'à EXPORT_LIMIT objets avec toutes
+leurs photos encodées en base64 dans une seule chaîne : plusieurs centaines de
+Mo dans le worker, et un délai qui dépassait le `--timeout 120` de gunicorn.
+L'archive ZIP ne garde en mémoire qu'un petit lot de lignes à la fois :
+
+* les photos d'origine sont lues par lots (`yield_per`) et écrites telles
+  quelles sous ``photos/<id objet>/<fichier>`` (stockées sans compression :
+  JPEG et WebP ne gagnent rien à être recompressés) ;
+* ``manifest.csv`` et ``manifest.json`` décrivent ensuite chaque objet et
+  listent les chemins des photos effectivement présentes dans l'archive.
+
+zipfile sait écrire dans un flux non positionnable (descripteurs de données
+après chaque fichier) : `stream_zip` lui fournit un tampon vidé après chaque
+écriture, si bien que les octets partent vers le client dès qu'ils sont
+produits. Il n'y a pas de plafond sur le nombre d'objets.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import zipfile
+
+_LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# Photos d'origine (jusqu'à 30 Mo) : lot volontairement petit.
+PHOTO_BATCH = 8
+ROW_BATCH = 500
+
+MANIFEST_FIELDS = (
+    'id', 'statut', 'categorie', 'titre', 'description', 'couleurs', 'marque',
+    'contenu_particulier', 'lieu', 'lieu_trouve', 'lieu_stockage', 'date_signalement',
+    'nom_declarant', 'email_declarant', 'telephone_declarant',
+    'nom_reclamant', 'email_reclamant', 'telephone_reclamant',
+    'date_restitution', 'commentaire_restitution', 'photos',
+)
+
+
+class _Sink:
+    """Fichier en écriture seule dont `drain` rend le contenu accumulé depuis l'appel précédent."""
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+
+    def write(self, data) -> int:
+        return self._buffer.write(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def stream_zip(entries):
+    """Produit une archive ZIP morceau par morceau.
+
+    `entries` itère des triplets ``(nom, morceaux, compresser)`` où `morceaux`
+    est un itérable d'octets (ou de str, encodées en UTF-8). Chaque entrée
+    n'est consommée qu'au moment de son écriture.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks, compress in entries:
+            info = zipfile.ZipInfo(name)
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            info.external_attr = 0o644 << 16
+            with archive.open(info, mode='w', force_zip64=True) as handle:
+                for chunk in chunks:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    for start in range(0, len(chunk), CHUNK_SIZE):
+                        handle.write(chunk[start:start + CHUNK_SIZE])
+                        data = sink.drain()
+                        if data:
+                            yield data
+            data = sink.drain()
+            if data:
+                yield data
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def _date(value) -> str:
+    return value.isoformat(timespec='minutes') if value else ''
+
+
+def manifest_row(item, photos: list[str]) -> dict:
+    """Ligne du manifeste pour un objet ; `photos` liste ses chemins dans l'archive."""
+    return {
+        'id': item.id,
+        'statut': item.status.value if item.status else '',
+        'categorie': item.category.name if item.category else '',
+        'titre': item.title,
+        'description': item.comments or '',
+        'couleurs': item.item_color or '',
+        'marque': item.item_brand or '',
+        'contenu_particulier': item.item_distinctive or '',
+        'lieu': item.location or '',
+        'lieu_trouve': item.found_location or '',
+        'lieu_stockage': item.storage_location or '',
+        'date_signalement': _date(item.date_reported),
+        'nom_declarant': item.reporter_name or '',
+        'email_declarant': item.reporter_email or '',
+        'telephone_declarant': item.reporter_phone or '',
+        'nom_reclamant': item.claimant_name or '',
+        'email_reclamant': item.claimant_email or '',
+        'telephone_reclamant': item.claimant_phone or '',
+        'date_restitution': _date(item.return_date),
+        'commentaire_restitution': item.return_comment or '',
+        'photos': photos,
+    }
+
+
+def csv_chunks(rows):
+    """Manifeste CSV, une ligne par morceau ; les chemins de photos sont séparés par « | »."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=MANIFEST_FIELDS)
+    # BOM : Excel ouvre sinon le fichier en Windows-1252 et casse les accents.
+    buffer.write('\ufeff')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({**row, 'photos': '|'.join(row['photos'])})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def json_chunks(rows):
+    """Manifeste JSON (une liste d'objets), produit ligne à ligne."""
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps(row, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def photo_path(item_id: int, filename: str) -> str:
+    return f'photos/{item_id}/{os.path.basename(filename)}'
+
+
+def _items_query(status):
+    from models import Item, Status
+
+    return (Item.query.filter(Item.status == status, Item.status != Status.PENDING_DELETION)
+            .order_by(Item.date_reported.desc(), Item.id.desc()))
+
+
+def _disk_bytes(filename: str) -> bytes | None:
+    """Fallback disque des anciennes images (même logique que /uploads)."""
+    from flask import current_app
+    from werkzeug.utils import safe_join
+
+    path = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+    if not path or not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as handle:
+        return handle.read()
+
+
+def _photo_entries(status, written: dict):
+    """Entrées ZIP des photos d'objets ; `written` reçoit id objet → chemins écrits."""
+    from sqlalchemy.orm import undefer
+    from models import Item, ItemPhoto, Status
+
+    photos = (ItemPhoto.query.join(Item, ItemPhoto.item_id == Item.id)
+              .filter(Item.status == status, Item.status != Status.PENDING_DELETION)
+              .options(undefer(ItemPhoto.data))
+              .order_by(ItemPhoto.item_id, ItemPhoto.id)
+              .yield_per(PHOTO_BATCH))
+    for photo in photos:
+        data = bytes(photo.data) if photo.data else _disk_bytes(photo.filename)
+        if not data:
+            _LOGGER.warning("Export : photo %s sans contenu, ignorée", photo.filename)
+            continue
+        path = photo_path(photo.item_id, photo.filename)
+        written.setdefault(photo.item_id, []).append(path)
+        yield path, (data,), False
+
+    # Objets antérieurs à la table item_photos : une seule photo sur l'objet.
+    legacy = (_items_query(status)
+              .filter(Item.photo_filename.isnot(None), ~Item.photos.any())
+              .options(undefer(Item.photo_data))
+              .yield_per(PHOTO_BATCH))
+    for item in legacy:
+        data = bytes(item.photo_data) if item.photo_data else _disk_bytes(item.photo_filename)
+        if not data:
+            continue
+        path = photo_path(item.id, item.photo_filename)
+        written.setdefault(item.id, []).append(path)
+        yield path, (data,), False
+
+
+def _manifest_rows(status, written: dict):
+    from sqlalchemy.orm import selectinload
+    from models import Item
+
+    items = (_items_query(status).options(selectinload(Item.category))
+             .yield_per(ROW_BATCH))
+    for item in items:
+        yield manifest_row(item, written.get(item.id, []))
+
+
+def zip_export(status):
+    """Archive complète des objets de `status` : photos puis manifestes CSV et JSON.
+
+    Les photos passent en premier pour que les manifestes ne référencent que
+    des fichiers réellement présents dans l'archive.
+    """
+    written: dict[int, list[str]] = {}
+
+    def entries():
+        yield from _photo_entries(status, written)
+        yield 'manifest.csv', csv_chunks(_manifest_rows(status, written)), True
+        yield 'manifest.json', json_chunks(_manifest_rows(status, written)), True
+
+    return stream_zip(entries())
@@ -0,0 +1,32 @@
+"""Configuration gunicorn chargée automatiquement (les options du Procfile restent prioritaires).
+
+Seul rôle : lancer le serveur de modèle partagé (model_server.py) quand
+VISUAL_MATCHER_SOCKET est défini, pour que les workers web n'aient pas
+chacun leur copie de DINOv2. Le serveur est démarré avant les workers et
+arrêté avec l'arbitre ; s'il tombe, les workers voient simplement le modèle
+« unavailable » jusqu'au redémarrage.
+"""
+import os
+import subprocess
+import sys
+
+_sidecar = None
+
+
+def on_starting(server):
+    global _sidecar
+    path = os.environ.get('VISUAL_MATCHER_SOCKET')
+    if not path or os.environ.get('VISUAL_MATCHER_SIDECAR', '1') != '1':
+        return
+    _sidecar = subprocess.Popen([sys.executable, '-m', 'model_server', '--socket', path],
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    server.log.info("Serveur de modèle lancé (pid %s) sur %s", _sidecar.pid, path)
+
+
+def on_exit(server):
+    if _sidecar is not None and _sidecar.poll() is None:
+        _sidecar.terminate()
+        try:
+            _sidecar.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            _sidecar.kill()
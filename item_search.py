@@ -0,0 +1,96 @@
+"""Recherche plein texte des listes d'objets (PostgreSQL, français, sans accents).
+
+La recherche de /items faisait ``title ILIKE '%q%' OR comments ILIKE '%q%'`` :
+un parcours complet de la table à chaque frappe, sans tolérance aux accents,
+aux pluriels ni aux synonymes que le moteur de correspondance connaît déjà
+(« portable » ne trouvait pas un « téléphone »). Sur PostgreSQL :
+
+* la colonne générée ``items.search_vector`` (migration 20261017_07) indexe
+  titre (poids A), marque et couleurs (B) et commentaires (C) avec la
+  configuration ``lf_french`` : racinisation française précédée d'unaccent ;
+* la saisie est découpée en termes comme ``matching.normalize_text``
+  (minuscules, accents et mots vides retirés), chacun élargi à ses synonymes
+  de ``matching.SYNONYMS`` et complété en préfixe (« port » trouve
+  « portefeuille ») : ``(portabl:* | telephon:* | …) & noir:*`` ;
+* un index trigramme sur le titre rattrape les fautes de frappe
+  (« portabel ») ;
+* les résultats sont classés par ``ts_rank``, les correspondances seulement
+  approchées après les autres.
+
+Les autres bases (SQLite des tests et du développement) gardent l'ILIKE.
+"""
+import re
+
+import sqlalchemy as sa
+from unidecode import unidecode
+
+from matching import STOPWORDS, SYNONYMS
+
+TS_CONFIG = 'lf_french'
+# Part du score trigramme dans le classement : assez pour départager les
+# fautes de frappe, trop peu pour passer devant une vraie correspondance.
+FUZZY_WEIGHT = 0.01
+# Rang arrondi : comparé tel quel dans le curseur de keyset_pagination, un
+# flottant relu puis renvoyé à la base ne retomberait pas sur la même valeur.
+RANK_DIGITS = 6
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def _fold(text: str) -> str:
+    return unidecode(text or '').lower()
+
+
+def _synonym_groups() -> dict[str, frozenset[str]]:
+    """Mot → tous les mots simples de son groupe de synonymes (principal compris)."""
+    groups: dict[str, set[str]] = {}
+    for main, synonyms in SYNONYMS.items():
+        words = {w for w in (_fold(s) for s in [main, *synonyms]) if _TOKEN_RE.fullmatch(w)}
+        for word in words:
+            groups.setdefault(word, set()).update(words)
+    return {word: frozenset(group) for word, group in groups.items()}
+
+
+_GROUPS = _synonym_groups()
+
+
+def search_terms(query: str) -> list[list[str]]:
+    """Termes de la saisie (tous requis), chacun suivi de ses synonymes (un seul suffit)."""
+    terms = []
+    for token in _TOKEN_RE.findall(_fold(query)):
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        variants = sorted(_GROUPS.get(token, frozenset()) - {token})
+        terms.append([token, *variants])
+    return terms
+
+
+def tsquery_text(terms: list[list[str]]) -> str:
+    """Expression ``to_tsquery`` : variantes en OU, termes en ET, chacun en préfixe."""
+    return ' & '.join('(' + ' | '.join(f'{word}:*' for word in variants) + ')' for variants in terms)
+
+
+def apply_search(query, text: str, dialect: str):
+    """Filtre `query` (sur Item) par la saisie ; renvoie (requête, expression de rang ou None).
+
+    Le rang n'est fourni que sur PostgreSQL ; ailleurs, la requête est filtrée
+    par ILIKE et garde l'ordre chronologique.
+    """
+    from models import Item
+
+    text = (text or '').strip()
+    if not text:
+        return query, None
+    terms = search_terms(text)
+    if dialect != 'postgresql' or not terms:
+        like = f'%{text}%'
+        return query.filter(sa.or_(Item.title.ilike(like), Item.comments.ilike(like))), None
+    vector = sa.literal_column('items.search_vector')
+    tsquery = sa.func.to_tsquery(sa.literal_column(f"'{TS_CONFIG}'::regconfig"), tsquery_text(terms))
+    matches = vector.op('@@')(tsquery)
+    # word_similarity(saisie, titre) au-dessus du seuil pg_trgm ; forme servie par l'index trigramme.
+    fuzzy = sa.literal(text).op('<%')(Item.title)
+    rank = sa.func.round(
+        sa.cast(sa.func.ts_rank(vector, tsquery) + FUZZY_WEIGHT * sa.func.word_similarity(text, Item.title),
+                sa.Numeric), RANK_DIGITS)
+    return query.filter(sa.or_(matches, fuzzy)), rank
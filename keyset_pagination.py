@@ -0,0 +1,142 @@
+"""Pagination par curseur (« keyset ») sur (date_reported, id) pour les listes d'objets.
+
+`paginate()` de Flask-SQLAlchemy refaisait à chaque page un COUNT sur tout
+l'ensemble filtré, puis un OFFSET qui lit et jette toutes les lignes des pages
+précédentes : la page 40 des objets trouvés d'un gros festival coûtait
+40 pages de lecture. Ici chaque page repart de la dernière ligne affichée :
+
+* le curseur encode (date_reported, id) de la ligne frontière ; l'id départage
+  les objets signalés à la même seconde, l'ordre est donc total ;
+* la page suivante lit ``(date, id) < curseur`` par ordre décroissant, la
+  précédente ``(date, id) > curseur`` par ordre croissant puis l'inverse ; une
+  ligne de plus que la page indique s'il reste quelque chose au-delà ;
+* avec l'index (status, date_reported, id), le coût d'une page ne dépend plus
+  de sa profondeur.
+
+Le total exact disparaît avec le COUNT ; `bounded_count` le remplace par un
+comptage plafonné (« plus de 1000 objets ») dont le coût reste borné.
+"""
+import base64
+import binascii
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import sqlalchemy as sa
+
+
+def encode_cursor(*values) -> str:
+    """Curseur opaque (base64 url) de la ligne frontière : ([rang,] date, id)."""
+    raw = '|'.join(v.isoformat() if isinstance(v, datetime) else str(v) for v in values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str | None) -> tuple | None:
+    """Inverse d'`encode_cursor` ; None pour un curseur absent ou illisible."""
+    if not cursor:
+        return None
+    try:
+        parts = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('|')
+        if len(parts) == 2:
+            return datetime.fromisoformat(parts[0]), int(parts[1])
+        if len(parts) == 3:
+            return Decimal(parts[0]), datetime.fromisoformat(parts[1]), int(parts[2])
+    except (binascii.Error, UnicodeDecodeError, ValueError, InvalidOperation):
+        pass
+    return None
+
+
+class KeysetPage:
+    """Une page de résultats et les curseurs vers ses voisines (None en bout de liste)."""
+
+    def __init__(self, items: list, next_cursor: str | None, prev_cursor: str | None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        # Renseignés par l'appelant via bounded_count, s'il affiche un total.
+        self.total = None
+        self.total_exact = True
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+
+def page_bounds(rows: list, per_page: int, *, backwards: bool, has_cursor: bool, key):
+    """Découpe les `per_page + 1` lignes lues et calcule les curseurs voisins.
+
+    `rows` arrive dans l'ordre de lecture (croissant si `backwards`) ; `key`
+    donne (date, id) d'une ligne. Renvoie (lignes dans l'ordre décroissant,
+    curseur suivant, curseur précédent).
+    """
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows = rows[::-1]
+    if not rows:
+        return rows, None, None
+    first, last = encode_cursor(*key(rows[0])), encode_cursor(*key(rows[-1]))
+    if backwards:
+        # On remonte : il y a forcément une suite (la page d'où l'on vient).
+        return rows, last, first if more else None
+    return rows, last if more else None, first if has_cursor else None
+
+
+def paginate(query, date_col, id_col, *, per_page: int, after: str | None = None,
+             before: str | None = None, rank=None) -> KeysetPage:
+    """Page de `query` ordonnée par (date_col, id_col) décroissants.
+
+    `after` : curseur de la dernière ligne de la page précédente (page
+    suivante) ; `before` : curseur de la première ligne de la page suivante
+    (page précédente). Un curseur illisible ramène à la première page.
+    `rank` (expression SQL exacte, voir item_search) passe devant la date :
+    les résultats d'une recherche sont paginés du plus pertinent au moins
+    pertinent, le rang entrant alors dans le curseur.
+    """
+    query_without_cursor = query
+    columns = (date_col, id_col) if rank is None else (rank, date_col, id_col)
+    if rank is not None:
+        query = query.add_columns(rank)
+    key = sa.tuple_(*columns)
+    backwards = False
+    cursor = decode_cursor(after)
+    if cursor is None:
+        cursor = decode_cursor(before)
+        backwards = cursor is not None
+    if cursor is not None and len(cursor) != len(columns):
+        cursor, backwards = None, False  # curseur d'une autre recherche
+    if cursor is not None:
+        bound = sa.tuple_(*(sa.literal(value) for value in cursor))
+        query = query.filter(key > bound if backwards else key < bound)
+    order = [column.asc() if backwards else column.desc() for column in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+    if not rows and cursor is not None:
+        # Curseur périmé (objets supprimés ou changés de statut entre-temps) :
+        # retour à la première page plutôt qu'une page vide.
+        return paginate(query_without_cursor, date_col, id_col, per_page=per_page, rank=rank)
+
+    if rank is None:
+        def row_key(row):
+            return getattr(row, date_col.key), getattr(row, id_col.key)
+    else:
+        def row_key(row):
+            item, value = row
+            return value, getattr(item, date_col.key), getattr(item, id_col.key)
+    rows, next_cursor, prev_cursor = page_bounds(
+        rows, per_page, backwards=backwards, has_cursor=cursor is not None, key=row_key)
+    items = rows if rank is None else [item for item, _ in rows]
+    return KeysetPage(items, next_cursor, prev_cursor)
+
+
+def bounded_count(query, cap: int) -> tuple[int, bool]:
+    """(nombre de lignes de `query` plafonné à `cap`, True si le compte est exact).
+
+    Le sous-select s'arrête à cap + 1 lignes lues sur l'index : le coût ne
+    grandit pas avec la liste.
+    """
+    limited = query.order_by(None).with_entities(sa.literal(1)).limit(cap + 1).subquery()
+    count = query.session.query(sa.func.count()).select_from(limited).scalar() or 0
+    return min(count, cap), count <= cap
@@ -0,0 +1,80 @@
+"""Pièces jointes des prêts de casques : signature de retour et photo de pièce d'identité.
+
+Les deux images étaient stockées en data URL base64 dans des colonnes Text de
+headphone_loans : un tiers plus lourdes que les octets, relues avec chaque
+prêt dès qu'on les « dé-différait » (tableau admin, export), et toutes
+recopiées dans le HTML de l'export des locations. Elles vivent désormais dans
+la table loan_attachments (migration 20261017_09) :
+
+* octets bruts, une ligne par prêt et par nature (`KINDS`) ;
+* l'empreinte SHA-256 du contenu, calculée à l'écriture, sert d'ETag : la
+  route /loans/<id>/attachments/<nature> répond 304 sans lire les octets ;
+* les pages n'affichent qu'un lien ou une image chargée à la demande.
+"""
+import base64
+import binascii
+import re
+from datetime import datetime, timezone
+
+from blob_store import blob_key
+
+SIGNATURE = 'signature'
+ID_CARD = 'id_card'
+KINDS = (SIGNATURE, ID_CARD)
+# La photo de pièce d'identité n'est montrée qu'à l'administration.
+ADMIN_ONLY_KINDS = frozenset({ID_CARD})
+
+_DATA_URL_RE = re.compile(r'data:(?P<mime>[\w.+-]+/[\w.+-]+);base64,(?P<payload>.*)', re.DOTALL)
+
+
+def decode_data_url(value: str | None) -> tuple[str, bytes] | None:
+    """(type MIME, octets) d'une data URL base64 ; None si elle est absente ou illisible."""
+    if not isinstance(value, str):
+        return None
+    match = _DATA_URL_RE.fullmatch(value.strip())
+    if match is None:
+        return None
+    try:
+        data = base64.b64decode(match['payload'], validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return (match['mime'].lower(), data) if data else None
+
+
+def data_url(mime_type: str, data: bytes) -> str:
+    """Inverse de `decode_data_url`, pour les documents qui doivent embarquer l'image."""
+    return f'data:{mime_type};base64,' + base64.b64encode(data).decode('ascii')
+
+
+def attach(loan, kind: str, mime_type: str, data: bytes):
+    """Rattache (ou remplace) l'image `kind` du prêt ; la session n'est pas committée."""
+    from models import LoanAttachment
+
+    if kind not in KINDS:
+        raise ValueError(f'Nature de pièce jointe inconnue : {kind}')
+    attachment = next((a for a in loan.attachments if a.kind == kind), None)
+    if attachment is None:
+        attachment = LoanAttachment(kind=kind)
+        loan.attachments.append(attachment)
+    # Remplacement sur place : la contrainte (loan_id, kind) interdit d'insérer
+    # la nouvelle ligne avant d'avoir supprimé l'ancienne dans le même flush.
+    attachment.mime_type = mime_type
+    attachment.data = data
+    attachment.size_bytes = len(data)
+    attachment.content_hash = blob_key(data)
+    attachment.created_at = datetime.now(timezone.utc)
+    return attachment
+
+
+def signatures_by_loan(loan_ids) -> dict[int, str]:
+    """id prêt → signature en data URL, pour un lot de prêts (export hors ligne)."""
+    from sqlalchemy.orm import undefer
+    from models import LoanAttachment
+
+    loan_ids = list(loan_ids)
+    if not loan_ids:
+        return {}
+    rows = (LoanAttachment.query.options(undefer(LoanAttachment.data))
+            .filter(LoanAttachment.loan_id.in_(loan_ids), LoanAttachment.kind == SIGNATURE)
+            .all())
+    return {row.loan_id: data_url(row.mime_type, bytes(row.data)) for row in rows}
@@ -0,0 +1,67 @@
+"""Recherche instantanée des prêts de casques par nom (/loans/search).
+
+La recherche en direct de /loans refaisait toute la page à chaque frappe :
+``first_name ILIKE '%q%' OR last_name ILIKE '%q%'`` (parcours complet), un
+COUNT pour la pagination et les signatures base64 de toutes les lignes
+affichées. Au rush des retours en fin de soirée, chaque lettre tapée coûtait
+plusieurs centaines de Ko.
+
+Désormais chaque prêt porte une clé de recherche normalisée, remplie à
+l'écriture (événements de models.py) : prénom et nom en minuscules, sans
+accents ni ponctuation, dans les deux ordres (« jean dupont | dupont jean »).
+La saisie, normalisée de la même façon, est cherchée d'un seul LIKE sur cette
+colonne, servi sur PostgreSQL par un index trigramme (migration 20261017_08) :
+« Dupont J », « jean dup » ou « Léa » trouvent la même ligne qu'une saisie
+exacte.
+"""
+import re
+
+from unidecode import unidecode
+
+RESULT_LIMIT = 25
+_SEPARATORS = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_name(text: str | None) -> str:
+    """Minuscules sans accents, tout caractère autre qu'une lettre ou un chiffre réduit à une espace."""
+    return _SEPARATORS.sub(' ', unidecode(text or '').lower()).strip()
+
+
+def search_key(first_name: str | None, last_name: str | None) -> str:
+    """Clé stockée dans headphone_loans.search_key : « prénom nom | nom prénom »."""
+    first, last = normalize_name(first_name), normalize_name(last_name)
+    return f'{first} {last}'.strip() + ' | ' + f'{last} {first}'.strip()
+
+
+def like_pattern(query: str | None) -> str | None:
+    """Motif LIKE de la saisie, None si elle ne contient rien de cherchable.
+
+    La saisie normalisée ne contient que [a-z0-9 ] : aucun joker LIKE à échapper.
+    """
+    normalized = normalize_name(query)
+    return f'%{normalized}%' if normalized else None
+
+
+def search(query: str | None, limit: int = RESULT_LIMIT) -> tuple[list[dict], bool]:
+    """Prêts correspondant à la saisie, en cours d'abord puis du plus récent au plus ancien.
+
+    Renvoie (lignes, tronqué) ; seules les colonnes utiles au comptoir des
+    retours sont lues, jamais la signature ni la photo de pièce d'identité.
+    """
+    from models import HeadphoneLoan, LoanStatus
+
+    pattern = like_pattern(query)
+    if pattern is None:
+        return [], False
+    rows = (HeadphoneLoan.query
+            .with_entities(HeadphoneLoan.id, HeadphoneLoan.first_name, HeadphoneLoan.last_name,
+                           HeadphoneLoan.phone, HeadphoneLoan.quantity, HeadphoneLoan.deposit_type,
+                           HeadphoneLoan.deposit_details, HeadphoneLoan.deposit_amount,
+                           HeadphoneLoan.loan_date, HeadphoneLoan.return_date, HeadphoneLoan.status,
+                           HeadphoneLoan.signature_present)
+            .filter(HeadphoneLoan.search_key.like(pattern),
+                    HeadphoneLoan.status != LoanStatus.PENDING_DELETION)
+            .order_by(HeadphoneLoan.return_date.isnot(None), HeadphoneLoan.loan_date.desc())
+            .limit(limit + 1)
+            .all())
+    return [row._asdict() for row in rows[:limit]], len(rows) > limit
@@ -0,0 +1,106 @@
+"""Génération de candidats (« blocking ») avant le score complet des paires.
+
+La plupart des paires perdu × trouvé sont sans espoir : familles différentes,
+aucun mot (racinisé) commun, aucune couleur ni marque commune. family_bonus les
+pénalise, mais seulement après le passage complet de rapidfuzz sur les trois
+champs texte. Ici, chaque objet reçoit un petit ensemble de clés — mots du
+titre et de la description, couleurs et marques (texte libre et champs
+structurés), famille de catégorie — et seules les paires qui partagent au moins
+une clé sont scorées.
+
+Garde-fou de rappel : un objet qui a trop peu de clés (titre d'un mot, pas de
+catégorie connue…) n'offre pas assez de prise au blocage ; il est comparé à
+toute la liste opposée, comme avant. Deux objets dont les photos se
+ressemblent (cosinus DINOv2 au moins `blocking_visual_similarity`) sont
+retenus même sans clé commune : un sac photographié mais décrit en deux mots
+différents reste candidat. Un seuil plutôt que les k plus proches voisins :
+la relation est symétrique, si bien que la page d'un perdu, celle d'un trouvé
+et la table match_candidates retiennent exactement les mêmes paires.
+`flask calibrate-matching` mesure la part des paires validées que le blocage
+aurait écartées.
+
+Module pur : il ne travaille que sur des matching.MatchFeatures.
+"""
+import numpy as np
+
+from matching import MATCH_CONFIG, NEUTRAL_COLORS
+
+
+def blocking_keys(features) -> frozenset:
+    """Clés de blocage d'un objet. Le préfixe évite qu'une marque et un mot se confondent."""
+    keys = set()
+    for field in ('title', 'comments'):
+        keys.update('t:' + token for token in (features.text.get(field) or '').split())
+    keys.update('c:' + color for color in features.descriptor_colors)
+    keys.update('c:' + color for color in features.colors - NEUTRAL_COLORS)
+    keys.update('b:' + brand for brand in features.descriptor_brands)
+    if features.brand and features.brand != 'inconnu':
+        keys.add('b:' + features.brand)
+    if features.family:
+        keys.add('f:' + features.family)
+    return frozenset(keys)
+
+
+class BlockIndex:
+    """Index inversé clé → identifiants, construit sur une liste d'objets (souvent les trouvés)."""
+
+    def __init__(self, features_by_id: dict, min_keys: int | None = None):
+        if min_keys is None:
+            min_keys = MATCH_CONFIG['blocking_min_keys']
+        self.min_keys = min_keys
+        self.ids = set(features_by_id)
+        self.guarded = set()   # trop peu de clés : toujours candidats
+        self._index: dict[str, set] = {}
+        for item_id, features in features_by_id.items():
+            keys = blocking_keys(features)
+            if len(keys) < min_keys:
+                self.guarded.add(item_id)
+            for key in keys:
+                self._index.setdefault(key, set()).add(item_id)
+
+    def candidates(self, features) -> set:
+        """Identifiants indexés à scorer face à cet objet."""
+        keys = blocking_keys(features)
+        if len(keys) < self.min_keys:
+            return set(self.ids)
+        result = set(self.guarded)
+        for key in keys:
+            result |= self._index.get(key, set())
+        return result
+
+
+def visual_pairs(lost_features: dict, found_features: dict, min_similarity: float | None = None) -> set:
+    """Paires dont les meilleures photos atteignent `min_similarity` (cosinus DINOv2)."""
+    from photo_embeddings import similarity_matrix
+    if min_similarity is None:
+        min_similarity = MATCH_CONFIG['blocking_visual_similarity']
+    lost = [(item_id, f.vectors) for item_id, f in lost_features.items() if len(f.vectors)]
+    found = [(item_id, f.vectors) for item_id, f in found_features.items() if len(f.vectors)]
+    pairs = set()
+    # Par tranches de perdus : la grille complète ne tient pas forcément en mémoire.
+    for start in range(0, len(lost) if found else 0, 256):
+        chunk = lost[start:start + 256]
+        similarity = similarity_matrix([v for _, v in chunk], [v for _, v in found])
+        rows, cols = np.nonzero(np.nan_to_num(similarity, nan=-1.0) >= min_similarity)
+        pairs.update((chunk[i][0], found[j][0]) for i, j in zip(rows.tolist(), cols.tolist()))
+    return pairs
+
+
+def candidate_pairs(lost_features: dict, found_features: dict, enabled: bool | None = None) -> set:
+    """Paires (lost_id, found_id) à scorer ; toutes si le blocage est désactivé.
+
+    Mêmes paires quel que soit le découpage : un perdu face à tous les trouvés
+    (sa page), tous les perdus face à un trouvé, ou les deux listes entières.
+    `enabled` force le blocage (calibrate-matching) au lieu de MATCH_CONFIG.
+    """
+    if enabled is None:
+        enabled = MATCH_CONFIG['blocking_enabled']
+    if not enabled:
+        return {(lost_id, found_id) for lost_id in lost_features for found_id in found_features}
+    index = BlockIndex(found_features)
+    pairs = {
+        (lost_id, found_id)
+        for lost_id, features in lost_features.items()
+        for found_id in index.candidates(features)
+    }
+    return pairs | visual_pairs(lost_features, found_features)
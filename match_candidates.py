@@ -0,0 +1,288 @@
+"""Scores des paires perdu↔trouvé, persistés et tenus à jour au fil de l'eau.
+
+/matches recalculait toutes les paires (perdus × trouvés) à chaque affichage,
+changement de page ou de seuil : au troisième jour d'un festival, plusieurs
+secondes par requête, worker gunicorn bloqué pendant tout ce temps. Les scores
+vivent désormais dans la table `match_candidates` et la page se résume à une
+requête indexée `ORDER BY score DESC LIMIT/OFFSET`.
+
+La table est rafraîchie objet par objet, dans la transaction même qui modifie
+l'objet : un `after_flush` note les objets dont un champ pris en compte par le
+score a changé, un `before_commit` recalcule leurs paires juste avant
+l'écriture. Un objet modifié coûte donc une passe sur la liste opposée — ce que
+coûtait déjà l'affichage de sa fiche — au lieu d'une passe complète à chaque
+visite de /matches.
+
+Chaque ligne porte la version du moteur (`engine_version`) : tout changement de
+MATCH_CONFIG, du vocabulaire ou du modèle d'image rend les lignes existantes
+obsolètes. La table `match_candidate_builds` retient la version de la
+dernière reconstruction complète. Tant qu'elle ne correspond pas au moteur
+courant, /matches sert le calcul à la volée ; la reconstruction elle-même
+revient à `flask rebuild-match-candidates` (lancé au déploiement) ou au worker
+photo quand il est inactif, jamais à une requête GET.
+
+Les lignes sont écrites par upsert (match_features.upsert) : deux
+transactions qui modifient l'une un perdu, l'autre un trouvé de la même paire
+écrivent toutes deux la ligne sans violer `uq_match_candidate_pair`. Les
+objets dont le rafraîchissement échoue malgré tout sont retentés aux commits
+suivants (`MAX_RETRIES` fois).
+"""
+import hashlib
+import json
+import logging
+import math
+import threading
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+from sqlalchemy import event
+
+import matching
+from app import db
+from match_blocking import candidate_pairs
+from match_features import load_features, upsert
+from models import Item, ItemPhoto, MatchCandidate, MatchCandidateBuild, PhotoEmbedding, Status
+
+_LOGGER = logging.getLogger(__name__)
+
+# À incrémenter quand la formule du score change sans que MATCH_CONFIG ni le
+# vocabulaire ne bougent (nouveau bonus, autre combinaison texte/image…).
+ENGINE_REVISION = 1
+
+# Champs d'Item qui entrent dans le score : modifier les coordonnées du
+# déclarant ou la restitution ne déclenche aucun recalcul.
+SCORED_FIELDS = (
+    'status', 'title', 'comments', 'location', 'found_location', 'category_id',
+    'date_reported', 'item_color', 'item_brand', 'item_distinctive',
+)
+
+_STALE_ITEMS = 'match_candidates_stale_items'
+_STALE_PHOTOS = 'match_candidates_stale_photos'
+
+# Objets dont le rafraîchissement a échoué → nombre d'échecs, pour tout le processus.
+MAX_RETRIES = 3
+_RETRY_ITEMS: dict[int, int] = {}
+_RETRY_LOCK = threading.Lock()
+
+
+def engine_version() -> str:
+    """Empreinte courte de tout ce qui détermine un score."""
+    from photo_embeddings import current_model_version
+    payload = json.dumps({
+        'revision': ENGINE_REVISION,
+        'config': matching.MATCH_CONFIG,
+        'synonyms': matching.SYNONYMS,
+        'colors': sorted(matching.COLORS),
+        'brands': sorted(matching.BRANDS),
+        'stopwords': sorted(matching.STOPWORDS),
+        'image_model': current_model_version(),
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _score_rows(pairs, features, version):
+    """Lignes à insérer pour les paires atteignant le plancher de stockage.
+
+    Seules ces paires sont scorées (matching.pair_scores), chaque perdu face à
+    ses propres candidats : jamais la grille perdus × trouvés entière.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return []
+    lost_ids = sorted({lost.id for lost, _ in pairs})
+    found_ids = sorted({found.id for _, found in pairs})
+    row_of = {item_id: i for i, item_id in enumerate(lost_ids)}
+    col_of = {item_id: j for j, item_id in enumerate(found_ids)}
+    scores, base, bonus, image = matching.pair_scores(
+        [features[i] for i in lost_ids], [features[j] for j in found_ids],
+        [(row_of[lost.id], col_of[found.id]) for lost, found in pairs])
+
+    floor = matching.MATCH_CONFIG['candidate_floor']
+    now = datetime.now(timezone.utc)
+    rows = []
+    for k, (lost, found) in enumerate(pairs):
+        score = float(scores[k])
+        if score >= floor:
+            img = float(image[k])
+            rows.append({
+                'lost_id': lost.id, 'found_id': found.id, 'score': score,
+                'components': {'base': float(base[k]), 'bonus': round(float(bonus[k]), 2),
+                               'image': None if math.isnan(img) else img},
+                'engine_version': version,
+                'updated_at': now,
+            })
+    return rows
+
+
+def _by_id(items, features) -> dict:
+    return {item.id: features[item.id] for item in items}
+
+
+def _insert_rows(session, rows) -> None:
+    upsert(session, MatchCandidate.__table__, rows, ('lost_id', 'found_id'))
+
+
+def refresh_items(session, item_ids) -> int:
+    """Recalcule toutes les paires impliquant ces objets ; renvoie le nombre de lignes écrites.
+
+    Un objet qui n'est plus perdu ni trouvé (rendu, en attente de suppression,
+    supprimé) perd simplement ses lignes.
+    """
+    ids = {i for i in item_ids if i is not None}
+    if not ids:
+        return 0
+    table = MatchCandidate.__table__
+    session.execute(sa.delete(table).where(
+        sa.or_(table.c.lost_id.in_(ids), table.c.found_id.in_(ids))))
+    # populate_existing : relire les valeurs telles qu'elles sont stockées. Un
+    # objet juste créé porte encore en mémoire un date_reported avec fuseau,
+    # relu ensuite sans ; le bonus de date serait calculé différemment ici et
+    # sur la fiche objet.
+    changed = session.query(Item).populate_existing().filter(
+        Item.id.in_(ids), Item.status.in_([Status.LOST, Status.FOUND])).all()
+    if not changed:
+        return 0
+
+    opposites = {}
+    for status in (Status.LOST, Status.FOUND):
+        if any(item.status != status for item in changed):
+            opposites[status] = session.query(Item).populate_existing().filter_by(status=status).all()
+
+    involved = {item.id: item for item in changed}
+    for others in opposites.values():
+        involved.update((item.id, item) for item in others)
+    features = load_features(session, involved.values(), persist=True)
+
+    # Un set de paires : deux objets modifiés dans la même transaction ne
+    # produisent qu'une ligne.
+    pairs = set()
+    for status, others in opposites.items():
+        mine = [item for item in changed if item.status != status]
+        if status == Status.FOUND:
+            pairs |= candidate_pairs(_by_id(mine, features), _by_id(others, features))
+        else:
+            pairs |= candidate_pairs(_by_id(others, features), _by_id(mine, features))
+    rows = _score_rows(((involved[lost_id], involved[found_id]) for lost_id, found_id in pairs),
+                       features, engine_version())
+    _insert_rows(session, rows)
+    return len(rows)
+
+
+def rebuild_all(session) -> int:
+    """Vide la table et recalcule toutes les paires (premier usage, changement de moteur)."""
+    session.execute(sa.delete(MatchCandidate.__table__))
+    lost_items = session.query(Item).filter_by(status=Status.LOST).all()
+    found_items = session.query(Item).filter_by(status=Status.FOUND).all()
+    features = load_features(session, lost_items + found_items, persist=True)
+    items = {item.id: item for item in lost_items + found_items}
+    pairs = candidate_pairs(_by_id(lost_items, features), _by_id(found_items, features))
+    version = engine_version()
+    rows = _score_rows(((items[lost_id], items[found_id]) for lost_id, found_id in pairs),
+                       features, version)
+    _insert_rows(session, rows)
+    builds = MatchCandidateBuild.__table__
+    session.execute(sa.delete(builds).where(builds.c.engine_version != version))
+    upsert(session, builds, [{'engine_version': version, 'pair_count': len(rows),
+                              'built_at': datetime.now(timezone.utc)}], ('engine_version',))
+    return len(rows)
+
+
+def is_current(session) -> bool:
+    """Vrai si la table a été reconstruite pour le moteur courant.
+
+    Une seule lecture par clé primaire, quel que soit le nombre de paires ;
+    entre deux reconstructions, `refresh_items` écrit déjà à la version courante.
+    """
+    builds = MatchCandidateBuild.__table__
+    return session.execute(sa.select(builds.c.engine_version).where(
+        builds.c.engine_version == engine_version())).first() is not None
+
+
+def ensure_current(session) -> bool:
+    """Reconstruit la table si sa dernière reconstruction date d'une autre version du moteur.
+
+    Appelée par le worker photo, jamais depuis une requête. Vrai si elle a reconstruit.
+    """
+    if is_current(session):
+        return False
+    count = rebuild_all(session)
+    session.commit()
+    _LOGGER.info("Table match_candidates reconstruite : %s paire(s)", count)
+    return True
+
+
+# ── Suivi des objets modifiés ─────────────────────────────────────────────────
+
+def _scored_fields_changed(item) -> bool:
+    state = sa.inspect(item)
+    return any(state.attrs[field].history.has_changes() for field in SCORED_FIELDS)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_stale_items(session, flush_context):
+    stale_items = session.info.setdefault(_STALE_ITEMS, set())
+    stale_photos = session.info.setdefault(_STALE_PHOTOS, set())
+    for obj in session.new:
+        if isinstance(obj, Item):
+            stale_items.add(obj.id)
+        elif isinstance(obj, PhotoEmbedding):
+            stale_photos.add(obj.item_photo_id)
+    for obj in session.dirty:
+        if isinstance(obj, Item) and _scored_fields_changed(obj):
+            stale_items.add(obj.id)
+        elif isinstance(obj, PhotoEmbedding) and sa.inspect(obj).attrs.status.history.has_changes():
+            # Un vecteur qui devient prêt (ou invalide) change le terme image.
+            stale_photos.add(obj.item_photo_id)
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            stale_items.add(obj.id)
+        elif isinstance(obj, ItemPhoto):
+            stale_items.add(obj.item_id)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _refresh_stale_items(session):
+    # Vide les modifications en attente pour que _collect_stale_items les voie.
+    session.flush()
+    stale_items = session.info.pop(_STALE_ITEMS, set())
+    stale_photos = session.info.pop(_STALE_PHOTOS, set())
+    with _RETRY_LOCK:
+        retried = dict(_RETRY_ITEMS)
+        _RETRY_ITEMS.clear()
+    if not stale_items and not stale_photos and not retried:
+        return
+    stale_items |= set(retried)
+    try:
+        # Point de sauvegarde : un échec ici (table absente d'une base pas
+        # encore migrée…) ne doit jamais faire échouer l'enregistrement de
+        # l'objet. Le DELETE est annulé avec le reste : les objets sont notés
+        # pour être retentés au prochain commit.
+        with session.begin_nested():
+            if stale_photos:
+                rows = session.query(ItemPhoto.item_id).filter(ItemPhoto.id.in_(stale_photos)).all()
+                stale_items |= {row.item_id for row in rows}
+            refresh_items(session, stale_items)
+    except Exception:
+        _LOGGER.exception("Rafraîchissement des paires impossible pour les objets %s", sorted(stale_items))
+        _retry_later(stale_items - {None}, retried)
+
+
+def _retry_later(item_ids, retried) -> None:
+    abandoned = []
+    with _RETRY_LOCK:
+        for item_id in item_ids:
+            failures = retried.get(item_id, 0) + 1
+            if failures < MAX_RETRIES:
+                _RETRY_ITEMS[item_id] = max(_RETRY_ITEMS.get(item_id, 0), failures)
+            else:
+                abandoned.append(item_id)
+    if abandoned:
+        _LOGGER.error("Paires non rafraîchies après %s essais pour les objets %s ; "
+                      "lancer `flask rebuild-match-candidates`", MAX_RETRIES, sorted(abandoned))
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_stale_items(session, previous_transaction):
+    # Les objets d'une transaction annulée n'ont jamais été écrits.
+    session.info.pop(_STALE_ITEMS, None)
+    session.info.pop(_STALE_PHOTOS, None)
@@ -0,0 +1,108 @@
+"""Caractéristiques de score par objet (matching.MatchFeatures), persistées et chargées en lot.
+
+Le score d'une paire n'a besoin que de faits propres à chaque objet : texte
+normalisé, couleurs et marques citées, champs structurés, famille de
+catégorie, vecteurs d'image. Les recalculer pour chaque paire revenait à
+relancer synonymes, stemming et regex des milliers de fois par page, et à
+déclencher deux chargements paresseux (photos, embeddings) par objet et par
+paire.
+
+`load_features` charge tout cela pour une liste d'objets en trois requêtes
+(caractéristiques persistées, familles, vecteurs). Une ligne absente ou dont
+l'empreinte ne correspond plus à l'objet est recalculée ; avec `persist=True`
+(transaction d'écriture, voir match_candidates.py) le résultat est enregistré
+par `upsert` : deux transactions qui recalculent le même objet ne se heurtent
+pas à la clé primaire.
+"""
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+
+import matching
+from models import Category, ItemMatchFeatures
+from photo_embeddings import ready_vectors_by_item
+
+# SQLite limite le nombre de paramètres liés par requête.
+_IN_CHUNK = 500
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), _IN_CHUNK):
+        yield values[start:start + _IN_CHUNK]
+
+
+def upsert(session, table, rows, keys) -> None:
+    """INSERT … ON CONFLICT (keys) DO UPDATE des lignes `rows` (PostgreSQL, SQLite).
+
+    Une ligne écrite entre-temps par une autre transaction est remplacée au lieu
+    de faire échouer la nôtre sur la contrainte d'unicité.
+    """
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # Autres bases : pas d'upsert portable, simple INSERT.
+        session.execute(sa.insert(table), rows)
+        return
+    statement = insert(table)
+    updated = {name: statement.excluded[name] for name in rows[0] if name not in keys}
+    session.execute(statement.on_conflict_do_update(index_elements=list(keys), set_=updated), rows)
+
+
+def category_families(session) -> dict:
+    """{category_id: famille} ; la table des catégories reste petite, on la lit entière."""
+    return {
+        category_id: (family or '').strip() or None
+        for category_id, family in session.query(Category.id, Category.family)
+    }
+
+
+def load_features(session, items, *, persist: bool = False, with_vectors: bool = True) -> dict:
+    """{item_id: MatchFeatures} pour ces objets, sans chargement paresseux par objet.
+
+    `with_vectors=False` pour les appelants qui ne comparent pas les images
+    (détection de doublons à la déclaration).
+    """
+    items = [item for item in items if item.id is not None]
+    ids = [item.id for item in items]
+    stored = {}
+    for chunk in _chunks(ids):
+        rows = session.query(
+            ItemMatchFeatures.item_id, ItemMatchFeatures.fingerprint, ItemMatchFeatures.data,
+        ).filter(ItemMatchFeatures.item_id.in_(chunk))
+        stored.update({item_id: (fingerprint, data) for item_id, fingerprint, data in rows})
+    families = category_families(session)
+    vectors = {}
+    if with_vectors:
+        # persist=True : appel depuis la transaction qui modifie les objets
+        # (match_candidates.py), qui doit voir ses propres embeddings non encore
+        # validés ; l'index en mémoire ne contient que des lignes validées.
+        vectors = ready_vectors_by_item(ids, session if persist else None)
+
+    result = {}
+    fresh_rows = []
+    for item in items:
+        family = families.get(item.category_id)
+        fingerprint = matching.features_fingerprint(item)
+        row = stored.get(item.id)
+        if row is not None and row[0] == fingerprint:
+            features = matching.MatchFeatures.from_dict(
+                row[1], category_id=item.category_id, family=family,
+                date_reported=item.date_reported)
+        else:
+            features = matching.extract_features(item, family=family)
+            fresh_rows.append({
+                'item_id': item.id, 'fingerprint': fingerprint,
+                'data': features.to_dict(), 'updated_at': datetime.now(timezone.utc),
+            })
+        features.vectors = vectors.get(item.id, ())
+        result[item.id] = features
+
+    if persist:
+        upsert(session, ItemMatchFeatures.__table__, fresh_rows, ('item_id',))
+    return result
@@ -1,7 +1,12 @@
+import hashlib
+import heapq
+import json
 import re
+from datetime import datetime, timedelta, timezone
 from functools import lru_cache
 import nltk
-from rapidfuzz import fuzz
+import numpy as np
+from rapidfuzz import fuzz, process
 from unidecode import unidecode
 
 try:
@@ -43,6 +48,17 @@ MATCH_CONFIG = {
     'threshold_default':        85,
     'threshold_structured_low': 70,  # seuil si signal structuré fort (≥15 pts)
     'threshold_duplicate':      75,  # détection de doublons (find_similar_items)
+    # Score minimal d'une paire conservée dans la table match_candidates. Un
+    # seuil plus bas demandé sur /matches repasse par le calcul complet.
+    'candidate_floor':          50,
+    # ── Blocage (match_blocking.py) ───────────────────────────────────────────
+    # Seules les paires partageant un mot, une couleur, une marque ou une
+    # famille sont scorées ; un objet avec moins de `blocking_min_keys` clés est
+    # comparé à tout (garde-fou de rappel).
+    'blocking_enabled':         True,
+    'blocking_min_keys':        3,
+    # Cosinus DINOv2 à partir duquel deux photos suffisent à retenir la paire.
+    'blocking_visual_similarity': 0.75,
     # Échelle de conversion des bonus : un bonus de cette valeur consomme toute
     # la marge restante jusqu'à 100. Empêche les scores de s'empiler au plafond.
     'bonus_full_scale':         55,
@@ -149,10 +165,59 @@ for _main, _syns in SYNONYMS.items():
 _SYNONYM_FLAT.sort(key=lambda x: -len(x[0]))  # plus long en premier
 
 
+def _word_alternation(words) -> re.Pattern:
+    """Une seule regex `\b(?:mot1|mot2|…)\b`, les plus longs d'abord.
+
+    Remplace une recherche par mot pour les descripteurs : couleurs et marques
+    sont des mots entiers qui ne se chevauchent pas, finditer les trouve tous."""
+    ordered = sorted(set(words), key=lambda w: (-len(w), w))
+    return re.compile(r'\b(?:' + '|'.join(re.escape(w) for w in ordered) + r')\b')
+
+
+# Moteur de synonymes : l'ancienne boucle appliquait ~100 re.sub à chaque texte,
+# alors qu'un titre n'en contient en général aucun ou un seul. Les étapes
+# (synonyme → principal, plus longs d'abord) restent les mêmes et s'appliquent
+# dans le même ordre, mais seules celles dont tous les mots figurent dans le
+# texte sont essayées. Une simple alternance en une passe ne suffit pas : un
+# remplacement peut former un synonyme avec le mot voisin (« batterie externe
+# usb » → « chargeur usb » → « chargeur »), d'où le suivi des mots produits.
+# tests/test_matching.py vérifie l'équivalence avec l'ancien algorithme.
+_WORD_RE = re.compile(r'\w+')
+_SYNONYM_STEPS = [
+    (re.compile(r'\b' + re.escape(_syn) + r'\b'), _main,
+     frozenset(_WORD_RE.findall(_syn)), frozenset(_WORD_RE.findall(_main)))
+    for _syn, _main in _SYNONYM_FLAT
+]
+_STEPS_BY_WORD: dict[str, list[int]] = {}
+for _i, (_pattern, _main, _needed, _produced) in enumerate(_SYNONYM_STEPS):
+    for _word in _needed:
+        _STEPS_BY_WORD.setdefault(_word, []).append(_i)
+
+_COLOR_RE = _word_alternation(COLORS)
+_BRAND_RE = _word_alternation(BRANDS)
+
+
 def _replace_synonyms(text: str) -> str:
-    for syn, main in _SYNONYM_FLAT:
-        pattern = r'\b' + re.escape(syn) + r'\b'
-        text = re.sub(pattern, main, text)
+    words = set(_WORD_RE.findall(text))
+    queue = list({i for w in words for i in _STEPS_BY_WORD.get(w, ())})
+    heapq.heapify(queue)
+    seen = set()
+    while queue:
+        i = heapq.heappop(queue)
+        if i in seen:
+            continue
+        seen.add(i)
+        pattern, main, needed, produced = _SYNONYM_STEPS[i]
+        if not needed <= words:
+            continue
+        text, count = pattern.subn(main, text)
+        if count:
+            # Les mots du principal peuvent déclencher une étape suivante ; une
+            # étape déjà passée ne s'applique plus, comme dans la boucle d'origine.
+            for word in produced - words:
+                queue.extend(j for j in _STEPS_BY_WORD.get(word, ()) if j > i)
+            heapq.heapify(queue)
+            words |= produced
     return text
 
 
@@ -176,12 +241,13 @@ def normalize_text(text: str) -> str:
 def _extract_descriptors(raw_text: str) -> tuple[frozenset, frozenset]:
     """Retourne (couleurs, marques) trouvées dans le texte brut (lowercased + unidecode).
 
-    Mémoïsée : ~70 regex par appel, et la boucle O(perdus × trouvés) de /matches
-    repasse en permanence sur les mêmes textes. Les frozensets évitent qu'un
+    Mémoïsée : la boucle O(perdus × trouvés) de /matches repasse en permanence
+    sur les mêmes textes. Une regex compilée par vocabulaire (couleurs, marques)
+    remplace les ~70 recherches individuelles. Les frozensets évitent qu'un
     appelant modifie par erreur une valeur partagée par le cache."""
     text = unidecode(raw_text.lower())
-    found_colors = frozenset(c for c in COLORS if re.search(r'\b' + re.escape(c) + r'\b', text))
-    found_brands = frozenset(b for b in BRANDS if re.search(r'\b' + re.escape(b) + r'\b', text))
+    found_colors = frozenset(m.group(0) for m in _COLOR_RE.finditer(text))
+    found_brands = frozenset(m.group(0) for m in _BRAND_RE.finditer(text))
     return found_colors, found_brands
 
 
@@ -194,6 +260,10 @@ def descriptor_bonus(raw1: str, raw2: str) -> float:
     """
     colors1, brands1 = _extract_descriptors(raw1)
     colors2, brands2 = _extract_descriptors(raw2)
+    return _descriptor_bonus(colors1, brands1, colors2, brands2)
+
+
+def _descriptor_bonus(colors1, brands1, colors2, brands2) -> float:
     bonus = 0.0
     bonus += 8.0 * len(colors1 & colors2)
     bonus += 8.0 * len(brands1 & brands2)
@@ -244,15 +314,22 @@ def match_score(item1, item2, fields_weights=None):
     """
     Calcule un score de similarité pondéré entre deux objets.
     fields_weights: dict, ex: {'title':0.55, 'comments':0.25, 'location':0.20}
+
+    Pour scorer un même objet contre beaucoup d'autres, extraire ses
+    caractéristiques une fois (extract_features) et appeler score_features.
     """
+    return score_features(extract_features(item1, family=None),
+                          extract_features(item2, family=None), fields_weights)
+
+
+def score_features(features1, features2, fields_weights=None) -> float:
+    """Score texte + descripteurs d'une paire, à partir de caractéristiques précalculées."""
     if fields_weights is None:
         fields_weights = MATCH_CONFIG['fields_weights']
     score = 0.0
     total = 0.0
     for field, weight in fields_weights.items():
-        v1 = normalize_text(_get_field(item1, field))
-        v2 = normalize_text(_get_field(item2, field))
-        s = _text_field_score(v1, v2)
+        s = _text_field_score(features1.text[field], features2.text[field])
         # None = champ non comparable (vide d'au moins un côté) : on le retire de
         # la pondération au lieu de le compter comme une divergence.
         if s is None:
@@ -262,9 +339,8 @@ def match_score(item1, item2, fields_weights=None):
     base = round(score / total, 2) if total > 0 else 0.0
 
     # Bonus descripteurs sur titre + commentaires
-    raw1 = (getattr(item1, 'title', '') or '') + ' ' + (getattr(item1, 'comments', '') or '')
-    raw2 = (getattr(item2, 'title', '') or '') + ' ' + (getattr(item2, 'comments', '') or '')
-    desc_b = descriptor_bonus(raw1, raw2)
+    desc_b = _descriptor_bonus(features1.descriptor_colors, features1.descriptor_brands,
+                               features2.descriptor_colors, features2.descriptor_brands)
 
     return apply_bonus(base, desc_b)
 
@@ -335,6 +411,10 @@ def _parse_csv_field(value: str) -> set:
     return {v.strip() for v in value.split(',') if v.strip()}
 
 
+def _normalize_brand(value: str) -> str:
+    return unidecode((value or '').lower().strip())
+
+
 def structured_field_bonus(item1, item2) -> float:
     """
     Bonus/malus basé sur les champs structurés item_color, item_brand, item_distinctive.
@@ -342,12 +422,27 @@ def structured_field_bonus(item1, item2) -> float:
 
     Retourne un float (peut être négatif en cas de conflit couleur).
     """
+    return _structured_bonus(
+        _parse_csv_field(getattr(item1, 'item_color', '') or ''),
+        _normalize_brand(getattr(item1, 'item_brand', '') or ''),
+        _parse_csv_field(getattr(item1, 'item_distinctive', '') or ''),
+        _parse_csv_field(getattr(item2, 'item_color', '') or ''),
+        _normalize_brand(getattr(item2, 'item_brand', '') or ''),
+        _parse_csv_field(getattr(item2, 'item_distinctive', '') or ''),
+    )
+
+
+def structured_bonus(features1, features2) -> float:
+    """structured_field_bonus sur des caractéristiques précalculées."""
+    return _structured_bonus(features1.colors, features1.brand, features1.distinctive,
+                             features2.colors, features2.brand, features2.distinctive)
+
+
+def _structured_bonus(colors1, brand1, dist1, colors2, brand2, dist2) -> float:
     cfg = MATCH_CONFIG
     bonus = 0.0
 
     # ── Couleurs ──────────────────────────────────────────────────────────────
-    colors1 = _parse_csv_field(getattr(item1, 'item_color', '') or '')
-    colors2 = _parse_csv_field(getattr(item2, 'item_color', '') or '')
     # Une couleur commune reste un signal, y compris 'multicolore' des deux côtés.
     shared_colors = (colors1 & colors2) - NEUTRAL_COLORS
     # Seules les couleurs discriminantes peuvent prouver une divergence :
@@ -361,16 +456,12 @@ def structured_field_bonus(item1, item2) -> float:
         bonus -= cfg['malus_color_conflict']
 
     # ── Marque ────────────────────────────────────────────────────────────────
-    brand1 = unidecode((getattr(item1, 'item_brand', '') or '').lower().strip())
-    brand2 = unidecode((getattr(item2, 'item_brand', '') or '').lower().strip())
     if brand1 and brand2 and brand1 != 'inconnu' and brand2 != 'inconnu':
         # Correspondance exacte ou très proche (fuzz ≥ 85)
         if brand1 == brand2 or fuzz.ratio(brand1, brand2) >= 85:
             bonus += cfg['bonus_brand_match']
 
     # ── Signes distinctifs ────────────────────────────────────────────────────
-    dist1 = _parse_csv_field(getattr(item1, 'item_distinctive', '') or '')
-    dist2 = _parse_csv_field(getattr(item2, 'item_distinctive', '') or '')
     shared_dist = dist1 & dist2
     if shared_dist:
         bonus += cfg['bonus_distinctive_match'] * len(shared_dist)
@@ -416,14 +507,17 @@ def family_bonus(item1, item2) -> float:
     la devinette n'a rien donné) est neutre : mieux vaut ne rien affirmer que
     pénaliser à tort.
     """
-    cfg = MATCH_CONFIG
     cat1 = getattr(item1, 'category_id', None)
     cat2 = getattr(item2, 'category_id', None)
     if cat1 and cat2 and cat1 == cat2:
-        return float(cfg['bonus_same_category'])
+        return float(MATCH_CONFIG['bonus_same_category'])
+    return _family_bonus(cat1, cat2, _category_family(item1), _category_family(item2))
 
-    fam1 = _category_family(item1)
-    fam2 = _category_family(item2)
+
+def _family_bonus(cat1, cat2, fam1, fam2) -> float:
+    cfg = MATCH_CONFIG
+    if cat1 and cat2 and cat1 == cat2:
+        return float(cfg['bonus_same_category'])
     if fam1 is None or fam2 is None:
         return 0.0
     if fam1 == fam2:
@@ -431,6 +525,128 @@ def family_bonus(item1, item2) -> float:
     return -float(cfg['malus_other_family'])
 
 
+def pair_bonus(features1, features2) -> float:
+    """Bonus/malus catégorie + date + champs structurés d'une paire perdu↔trouvé."""
+    cfg = MATCH_CONFIG
+    bonus = _family_bonus(features1.category_id, features2.category_id,
+                          features1.family, features2.family)
+    date1, date2 = features1.date_reported, features2.date_reported
+    try:
+        if date1 and date2:
+            days = abs((date1 - date2).total_seconds()) / 86400.0
+            if days <= 2:
+                bonus += cfg['bonus_date_close']
+            elif days > 14:
+                bonus -= cfg['malus_date_far']
+    except Exception:
+        pass
+    bonus += structured_bonus(features1, features2)
+    return bonus
+
+
+# ── Caractéristiques précalculées ─────────────────────────────────────────────
+# Chaque évaluation de paire redérivait les mêmes faits sur chaque objet : texte
+# normalisé (synonymes, stemming), couleurs et marques du texte libre, CSV des
+# champs structurés. Sur /matches, un objet est comparé à toute la liste
+# opposée : ces faits sont désormais extraits une fois par objet, et le score
+# d'une paire (score_features, pair_bonus) ne lance plus aucune regex.
+TEXT_FIELDS = ('title', 'comments', 'location')
+
+# À incrémenter quand extract_features change sans que le vocabulaire bouge.
+FEATURES_REVISION = 1
+
+
+@lru_cache(maxsize=1)
+def features_version() -> str:
+    """Empreinte de tout ce qui détermine extract_features (vocabulaire compris)."""
+    payload = json.dumps({
+        'revision': FEATURES_REVISION,
+        'synonyms': SYNONYMS,
+        'colors': sorted(COLORS),
+        'brands': sorted(BRANDS),
+        'stopwords': sorted(STOPWORDS),
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class MatchFeatures:
+    """Ce que le score retient d'un objet.
+
+    `text`, les descripteurs et les champs structurés sont persistés (table
+    item_match_features) ; `category_id`, `family`, `date_reported` et
+    `vectors` (embeddings d'image prêts) sont rattachés au chargement, car ils
+    vivent déjà ailleurs et changent indépendamment du texte.
+    """
+    __slots__ = ('text', 'descriptor_colors', 'descriptor_brands', 'colors', 'brand',
+                 'distinctive', 'category_id', 'family', 'date_reported', 'vectors')
+
+    def __init__(self, text, descriptor_colors=frozenset(), descriptor_brands=frozenset(),
+                 colors=frozenset(), brand='', distinctive=frozenset(), *,
+                 category_id=None, family=None, date_reported=None, vectors=()):
+        self.text = text
+        self.descriptor_colors = frozenset(descriptor_colors)
+        self.descriptor_brands = frozenset(descriptor_brands)
+        self.colors = frozenset(colors)
+        self.brand = brand
+        self.distinctive = frozenset(distinctive)
+        self.category_id = category_id
+        self.family = family
+        self.date_reported = date_reported
+        self.vectors = vectors
+
+    def to_dict(self) -> dict:
+        """Partie persistée, sérialisable en JSON."""
+        return {
+            'text': dict(self.text),
+            'descriptor_colors': sorted(self.descriptor_colors),
+            'descriptor_brands': sorted(self.descriptor_brands),
+            'colors': sorted(self.colors),
+            'brand': self.brand,
+            'distinctive': sorted(self.distinctive),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, **context) -> 'MatchFeatures':
+        return cls(
+            data['text'], data['descriptor_colors'], data['descriptor_brands'],
+            data['colors'], data['brand'], data['distinctive'], **context,
+        )
+
+
+_UNSET = object()
+
+
+def features_fingerprint(item) -> str:
+    """Empreinte des champs sources d'extract_features, pour détecter une ligne périmée."""
+    payload = '\x1f'.join([features_version()] + [
+        getattr(item, field, None) or ''
+        for field in ('title', 'comments', 'location', 'found_location',
+                      'item_color', 'item_brand', 'item_distinctive')
+    ])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def extract_features(item, family=_UNSET) -> MatchFeatures:
+    """Extrait les caractéristiques de score d'un objet (Item ou double léger).
+
+    `family` évite de charger la catégorie quand l'appelant la connaît déjà
+    (ou n'en a pas besoin : None).
+    """
+    raw = (getattr(item, 'title', '') or '') + ' ' + (getattr(item, 'comments', '') or '')
+    descriptor_colors, descriptor_brands = _extract_descriptors(raw)
+    return MatchFeatures(
+        {field: normalize_text(_get_field(item, field)) for field in TEXT_FIELDS},
+        descriptor_colors,
+        descriptor_brands,
+        _parse_csv_field(getattr(item, 'item_color', '') or ''),
+        _normalize_brand(getattr(item, 'item_brand', '') or ''),
+        _parse_csv_field(getattr(item, 'item_distinctive', '') or ''),
+        category_id=getattr(item, 'category_id', None),
+        family=_category_family(item) if family is _UNSET else family,
+        date_reported=getattr(item, 'date_reported', None),
+    )
+
+
 def apply_bonus(base: float, bonus: float) -> float:
     """
     Applique un bonus/malus à un score de base sans jamais saturer.
@@ -453,6 +669,247 @@ def apply_bonus(base: float, bonus: float) -> float:
     return round(max(0.0, min(100.0, score)), 2)
 
 
+# ── Score matriciel ───────────────────────────────────────────────────────────
+# Les boucles O(perdus × trouvés) appelaient les fonctions ci-dessus paire par
+# paire depuis Python. rapidfuzz.process.cdist calcule des matrices entières de
+# token_sort_ratio / token_set_ratio en C, sur tous les cœurs ; le reste
+# (pondération, champs vides exclus, bonus) s'applique en opérations NumPy. Les
+# opérations sont faites dans le même ordre que dans le code scalaire, et
+# l'arrondi est aligné sur round() : le résultat est identique à match_score et
+# pair_bonus, ce que vérifie tests/test_matching.py.
+
+def _as_features(items) -> list:
+    return [item if isinstance(item, MatchFeatures) else extract_features(item, family=None)
+            for item in items]
+
+
+def round2_array(values: np.ndarray) -> np.ndarray:
+    """round(x, 2) élément par élément, identique au round() de Python.
+
+    np.round passe par x * 100 et peut trancher autrement qu'un arrondi décimal
+    exact quand x * 100 tombe à un cheveu de ,5 : ces rares cases sont
+    arrondies par Python."""
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values, 2)
+    scaled = values * 100.0
+    ambiguous = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if ambiguous.any():
+        rounded[ambiguous] = [round(float(v), 2) for v in values[ambiguous]]
+    return rounded
+
+
+def apply_bonus_array(base: np.ndarray, bonus: np.ndarray) -> np.ndarray:
+    """apply_bonus sur des matrices."""
+    scale = MATCH_CONFIG['bonus_full_scale']
+    positive = base + (100.0 - base) * np.minimum(1.0, bonus / scale)
+    score = np.where(bonus > 0, positive, base + bonus)
+    return round2_array(np.clip(score, 0.0, 100.0))
+
+
+def _overlap_counts(sets1, sets2) -> np.ndarray:
+    """Nombre d'éléments communs entre chaque ensemble de sets1 et de sets2."""
+    vocabulary = sorted(set().union(*sets1, *sets2))
+    if not vocabulary:
+        return np.zeros((len(sets1), len(sets2)))
+    position = {value: i for i, value in enumerate(vocabulary)}
+
+    def one_hot(sets):
+        matrix = np.zeros((len(sets), len(vocabulary)))
+        for row, values in enumerate(sets):
+            matrix[row, [position[v] for v in values]] = 1.0
+        return matrix
+
+    return one_hot(sets1) @ one_hot(sets2).T
+
+
+def _flags(values) -> np.ndarray:
+    return np.array([bool(v) for v in values], dtype=bool)
+
+
+def score_matrix(items1, items2, fields_weights=None, workers: int = -1) -> np.ndarray:
+    """Matrice des match_score(items1[i], items2[j]).
+
+    Accepte des objets (Item ou doubles légers) ou des MatchFeatures déjà
+    extraites ; ces dernières évitent toute regex. `workers` est passé à
+    cdist (-1 : tous les cœurs ; 1 dans un processus déjà parallélisé).
+    """
+    if fields_weights is None:
+        fields_weights = MATCH_CONFIG['fields_weights']
+    features1, features2 = _as_features(items1), _as_features(items2)
+    shape = (len(features1), len(features2))
+    if not features1 or not features2:
+        return np.zeros(shape)
+
+    score = np.zeros(shape)
+    total = np.zeros(shape)
+    for field, weight in fields_weights.items():
+        texts1 = [f.text[field] for f in features1]
+        texts2 = [f.text[field] for f in features2]
+        # Champ vide d'un côté : non comparable, retiré de la pondération.
+        comparable = np.outer(_flags(texts1), _flags(texts2))
+        if not comparable.any():
+            continue
+        sort_ratio = process.cdist(texts1, texts2, scorer=fuzz.token_sort_ratio,
+                                   dtype=np.float64, workers=workers)
+        set_ratio = process.cdist(texts1, texts2, scorer=fuzz.token_set_ratio,
+                                  dtype=np.float64, workers=workers)
+        field_score = 0.65 * sort_ratio + 0.35 * set_ratio
+        score = np.where(comparable, score + field_score * weight, score)
+        total = np.where(comparable, total + weight, total)
+    base = round2_array(np.divide(score, total, out=np.zeros(shape), where=total > 0))
+
+    colors1 = [f.descriptor_colors for f in features1]
+    colors2 = [f.descriptor_colors for f in features2]
+    descriptor = (8.0 * _overlap_counts(colors1, colors2)
+                  + 8.0 * _overlap_counts([f.descriptor_brands for f in features1],
+                                          [f.descriptor_brands for f in features2]))
+    one_sided = np.logical_xor.outer(_flags(colors1), _flags(colors2))
+    descriptor = np.where(one_sided, descriptor - 5.0, descriptor)
+    return apply_bonus_array(base, descriptor)
+
+
+def _date_keys(features) -> tuple[np.ndarray, np.ndarray]:
+    """(nature, microsecondes) par date : 0 absente, 1 naïve, 2 avec fuseau.
+
+    Une paire naïve/avec fuseau lève une exception dans pair_bonus, qui
+    l'ignore : elle ne reçoit ici aucun bonus de date non plus."""
+    naive_epoch = datetime(1970, 1, 1)
+    aware_epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    kinds = np.zeros(len(features), dtype=np.int8)
+    micros = np.zeros(len(features), dtype=np.int64)
+    for i, f in enumerate(features):
+        date = f.date_reported
+        if not date:
+            continue
+        aware = date.tzinfo is not None and date.utcoffset() is not None
+        kinds[i] = 2 if aware else 1
+        micros[i] = (date - (aware_epoch if aware else naive_epoch)) // timedelta(microseconds=1)
+    return kinds, micros
+
+
+def bonus_matrix(features1, features2, workers: int = -1) -> np.ndarray:
+    """Matrice des pair_bonus(features1[i], features2[j])."""
+    cfg = MATCH_CONFIG
+    shape = (len(features1), len(features2))
+    if not features1 or not features2:
+        return np.zeros(shape)
+
+    # ── Catégorie & famille ───────────────────────────────────────────────────
+    cats1 = np.array([f.category_id or 0 for f in features1])
+    cats2 = np.array([f.category_id or 0 for f in features2])
+    same_category = (cats1[:, None] == cats2[None, :]) & (cats1[:, None] != 0)
+    codes = {}
+    fams1 = np.array([codes.setdefault(f.family, len(codes)) if f.family is not None else -1
+                      for f in features1])
+    fams2 = np.array([codes.setdefault(f.family, len(codes)) if f.family is not None else -1
+                      for f in features2])
+    known = (fams1[:, None] >= 0) & (fams2[None, :] >= 0)
+    same_family = fams1[:, None] == fams2[None, :]
+    bonus = np.where(same_category, float(cfg['bonus_same_category']),
+                     np.where(~known, 0.0,
+                              np.where(same_family, -float(cfg['malus_other_category']),
+                                       -float(cfg['malus_other_family']))))
+
+    # ── Date ──────────────────────────────────────────────────────────────────
+    kinds1, micros1 = _date_keys(features1)
+    kinds2, micros2 = _date_keys(features2)
+    comparable = (kinds1[:, None] == kinds2[None, :]) & (kinds1[:, None] != 0)
+    seconds = np.abs(micros1[:, None] - micros2[None, :]).astype(np.float64) / 1e6
+    days = seconds / 86400.0
+    bonus = np.where(comparable & (days <= 2), bonus + cfg['bonus_date_close'],
+                     np.where(comparable & (days > 14), bonus - cfg['malus_date_far'], bonus))
+
+    # ── Champs structurés ─────────────────────────────────────────────────────
+    shared_colors = _overlap_counts([f.colors - NEUTRAL_COLORS for f in features1],
+                                    [f.colors - NEUTRAL_COLORS for f in features2])
+    discriminant = np.outer(
+        _flags(f.colors - NEUTRAL_COLORS - WILDCARD_COLORS for f in features1),
+        _flags(f.colors - NEUTRAL_COLORS - WILDCARD_COLORS for f in features2))
+    structured = np.where(shared_colors > 0, 0.0 + cfg['bonus_color_match'] * shared_colors,
+                          np.where(discriminant, 0.0 - cfg['malus_color_conflict'], 0.0))
+    brands1 = [f.brand if f.brand != 'inconnu' else '' for f in features1]
+    brands2 = [f.brand if f.brand != 'inconnu' else '' for f in features2]
+    branded = np.outer(_flags(brands1), _flags(brands2))
+    if branded.any():
+        similar = process.cdist(brands1, brands2, scorer=fuzz.ratio,
+                                dtype=np.float64, workers=workers) >= 85
+        structured = np.where(branded & similar, structured + cfg['bonus_brand_match'], structured)
+    shared_distinctive = _overlap_counts([f.distinctive for f in features1],
+                                         [f.distinctive for f in features2])
+    structured = np.where(shared_distinctive > 0,
+                          structured + cfg['bonus_distinctive_match'] * shared_distinctive,
+                          structured)
+    return bonus + round2_array(structured)
+
+
+def pair_score_matrix(lost_features, found_features, workers: int = -1):
+    """Score final de toute une grille perdus × trouvés (texte, image, bonus).
+
+    Renvoie (score, base, bonus, image) : quatre matrices, `image` (en %)
+    valant NaN là où la comparaison d'images n'est pas disponible. Le texte
+    garde alors 100 % de son poids, comme pour une paire isolée.
+    """
+    from photo_embeddings import similarity_matrix
+    cfg = MATCH_CONFIG
+    base = score_matrix(lost_features, found_features, workers=workers)
+    bonus = bonus_matrix(lost_features, found_features, workers=workers)
+    similarity = similarity_matrix([f.vectors for f in lost_features],
+                                   [f.vectors for f in found_features])
+    image = np.where(np.isnan(similarity), np.nan,
+                     round2_array(100.0 * np.maximum(0.0, np.nan_to_num(similarity))))
+    combined = np.where(np.isnan(image), base,
+                        cfg['text_weight'] * base + cfg['img_img_weight'] * np.nan_to_num(image))
+    return apply_bonus_array(combined, bonus), base, bonus, image
+
+
+def pair_scores(lost_features, found_features, pairs, workers: int = -1):
+    """pair_score_matrix restreint aux paires (i, j) retenues par le blocage.
+
+    Chaque perdu n'est comparé qu'à ses propres candidats trouvés : le coût
+    suit le nombre de paires retenues et non plus la grille perdus × trouvés
+    entière. Renvoie (score, base, bonus, image), quatre vecteurs alignés sur
+    `pairs` et identiques aux cases correspondantes de la grille complète.
+    """
+    pairs = list(pairs)
+    result = np.zeros((4, len(pairs)))
+    by_lost = {}
+    for position, (i, j) in enumerate(pairs):
+        by_lost.setdefault(i, []).append((position, j))
+    for i, entries in by_lost.items():
+        positions = [position for position, _ in entries]
+        matrices = pair_score_matrix([lost_features[i]], [found_features[j] for _, j in entries],
+                                     workers=workers)
+        for row, matrix in zip(result, matrices):
+            row[positions] = matrix[0]
+    return tuple(result)
+
+
+def top_k(scored, k: int, threshold: float | None = None) -> list:
+    """Les `k` meilleurs (clé, score) d'un flux de (score, clé), du meilleur au moins bon.
+
+    Les suggestions construisaient un dictionnaire d'affichage (url_for, icône
+    de catégorie…) pour chaque candidat, triaient le tout et n'en gardaient que
+    dix. Ici un tas borné à `k` entrées suit le flux des scores : seuls les
+    gagnants sortent, et l'affichage n'est préparé que pour eux.
+
+    À score égal, le premier arrivé l'emporte — même ordre qu'un tri stable
+    décroissant de tout le flux.
+    """
+    if k <= 0:
+        return []
+    heap = []
+    for order, (score, key) in enumerate(scored):
+        if threshold is not None and score < threshold:
+            continue
+        # -order : départage sans jamais comparer les clés entre elles.
+        entry = (score, -order, key)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return [(key, score) for score, _, key in sorted(heap, reverse=True)]
+
+
 # ── Affichage de la confiance ─────────────────────────────────────────────────
 # Le score brut cumule bonus catégorie, date, couleur, marque et signes
 # distinctifs, puis est borné à 100 : de nombreuses paires sans rapport
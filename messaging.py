@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from datetime import datetime, timezone
 from app import db, limiter
 import sqlalchemy as sa
+import counters
 from models import (User, Conversation, ConversationParticipant, Message,
                     ConvType, ParticipantRole)
 
@@ -472,7 +473,9 @@ def delete_conversation(conv_id):
 @bp_msg.route('/api/unread')
 @login_required
 def api_unread():
-    return jsonify({'unread': total_unread(current_user.id)})
+    user_id = current_user.id
+    return jsonify({'unread': counters.counter_cache().get_or_compute(
+        counters.UNREAD, user_id, lambda: total_unread(user_id))})
 
 
 # ── API nouveaux messages (polling) ──────────────────────────────────────────
@@ -11,12 +11,18 @@ down_revision = '20260724_01'
 branch_labels = ('optional_pgvector',)
 depends_on = None
 
+# ivfflat n'indexe qu'une colonne de dimension fixe : celle de
+# facebook/dinov2-small. Un modèle d'une autre dimension demande de recréer la
+# colonne ; en attendant, ses vecteurs ne sont pas copiés et la recherche
+# retombe sur NumPy (photo_embeddings.pgvector_dimension).
+DIMENSION = 384
+
 
 def upgrade():
     op.execute('CREATE EXTENSION IF NOT EXISTS vector')
     # Keep bytea as the source of truth. Populate this column with a controlled
     # backfill before using it for ANN queries in production.
-    op.execute('ALTER TABLE photo_embeddings ADD COLUMN embedding_vector vector')
+    op.execute(f'ALTER TABLE photo_embeddings ADD COLUMN embedding_vector vector({DIMENSION})')
     op.execute("CREATE INDEX ix_photo_embeddings_vector_cosine ON photo_embeddings USING ivfflat (embedding_vector vector_cosine_ops) WITH (lists = 100) WHERE status = 'ready'")
 
 
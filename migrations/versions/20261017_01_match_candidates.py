@@ -0,0 +1,37 @@
+"""add match_candidates (scores des paires perdu↔trouvé persistés)
+
+Revision ID: 20261017_01
+Revises: 20260803_01
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017_01'
+down_revision = '20260803_01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'match_candidates',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('lost_id', sa.Integer(), sa.ForeignKey('items.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('found_id', sa.Integer(), sa.ForeignKey('items.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('components', sa.JSON(), nullable=True),
+        sa.Column('engine_version', sa.String(length=40), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.UniqueConstraint('lost_id', 'found_id', name='uq_match_candidate_pair'),
+    )
+    op.create_index('ix_match_candidates_lost_id', 'match_candidates', ['lost_id'])
+    op.create_index('ix_match_candidates_found_id', 'match_candidates', ['found_id'])
+    op.create_index('ix_match_candidates_version_score', 'match_candidates', ['engine_version', 'score'])
+
+
+def downgrade():
+    op.drop_index('ix_match_candidates_version_score', table_name='match_candidates')
+    op.drop_index('ix_match_candidates_found_id', table_name='match_candidates')
+    op.drop_index('ix_match_candidates_lost_id', table_name='match_candidates')
+    op.drop_table('match_candidates')
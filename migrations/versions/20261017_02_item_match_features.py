@@ -0,0 +1,27 @@
+"""add item_match_features (caractéristiques de score précalculées par objet)
+
+Revision ID: 20261017_02
+Revises: 20261017_01
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017_02'
+down_revision = '20261017_01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'item_match_features',
+        sa.Column('item_id', sa.Integer(), sa.ForeignKey('items.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('fingerprint', sa.String(length=40), nullable=False),
+        sa.Column('data', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+
+
+def downgrade():
+    op.drop_table('item_match_features')
@@ -0,0 +1,51 @@
+"""add photo_blob_refs (nom de fichier → empreinte SHA-256 du contenu)
+
+Revision ID: 20261017_03
+Revises: 20261017_02
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017_03'
+down_revision = '20261017_02'
+branch_labels = None
+depends_on = None
+
+# Même ordre que l'ancienne recherche de /uploads : à nom égal, la première
+# source l'emporte (ON CONFLICT DO NOTHING).
+_SOURCES = (
+    ('item_photo', 'item_photos', 'filename', 'data', 'mime_type'),
+    ('item', 'items', 'photo_filename', 'photo_data', 'photo_mime_type'),
+    ('item_return', 'items', 'return_photo_filename', 'return_photo_data', 'return_photo_mime_type'),
+    ('product', 'products', 'image_filename', 'image_data', 'image_mime_type'),
+)
+
+
+def upgrade():
+    op.create_table(
+        'photo_blob_refs',
+        sa.Column('filename', sa.String(length=200), primary_key=True),
+        sa.Column('blob_key', sa.String(length=64), nullable=False),
+        sa.Column('mime_type', sa.String(length=100), nullable=True),
+        sa.Column('source', sa.String(length=20), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        sa.Column('size_bytes', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+    op.create_index('ix_photo_blob_refs_blob_key', 'photo_blob_refs', ['blob_key'])
+    # Les lignes sont sinon créées à la première lecture de chaque fichier ;
+    # PostgreSQL sait calculer l'empreinte lui-même, autant tout remplir ici.
+    if op.get_bind().dialect.name == 'postgresql':
+        for source, table, filename, data, mime in _SOURCES:
+            op.execute(
+                f"INSERT INTO photo_blob_refs (filename, blob_key, mime_type, source, source_id, size_bytes, created_at) "
+                f"SELECT {filename}, encode(sha256({data}), 'hex'), {mime}, '{source}', id, octet_length({data}), now() "
+                f"FROM {table} WHERE {filename} IS NOT NULL AND {data} IS NOT NULL "
+                f"ON CONFLICT (filename) DO NOTHING"
+            )
+
+
+def downgrade():
+    op.drop_index('ix_photo_blob_refs_blob_key', table_name='photo_blob_refs')
+    op.drop_table('photo_blob_refs')
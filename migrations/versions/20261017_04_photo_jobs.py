@@ -0,0 +1,37 @@
+"""add photo_jobs (file de travaux photo traitée par `flask photo-worker`)
+
+Revision ID: 20261017_04
+Revises: 20261017_03
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017_04'
+down_revision = '20261017_03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'photo_jobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('item_photo_id', sa.Integer(), sa.ForeignKey('item_photos.id', ondelete='CASCADE'),
+                  nullable=False, unique=True),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('run_after', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+    op.create_index('ix_photo_jobs_status', 'photo_jobs', ['status'])
+    op.create_index('ix_photo_jobs_run_after', 'photo_jobs', ['run_after'])
+
+
+def downgrade():
+    op.drop_index('ix_photo_jobs_run_after', table_name='photo_jobs')
+    op.drop_index('ix_photo_jobs_status', table_name='photo_jobs')
+    op.drop_table('photo_jobs')
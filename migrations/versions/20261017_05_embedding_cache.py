@@ -0,0 +1,45 @@
+"""add embedding_cache (vecteur DINOv2 par empreinte d'image et version de modèle)
+
+Revision ID: 20261017_05
+Revises: 20261017_04
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017_05'
+down_revision = '20261017_04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'embedding_cache',
+        sa.Column('image_hash', sa.String(length=64), nullable=False),
+        sa.Column('model_version', sa.String(length=100), nullable=False),
+        sa.Column('perceptual_hash', sa.String(length=64), nullable=True),
+        sa.Column('embedding', sa.LargeBinary(), nullable=False),
+        sa.Column('embedding_dimension', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('image_hash', 'model_version'),
+    )
+    op.create_index('ix_embedding_cache_phash_model', 'embedding_cache', ['perceptual_hash', 'model_version'])
+    # Les vecteurs déjà calculés amorcent le cache : une image déjà vue ne
+    # repassera jamais par le modèle.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "INSERT INTO embedding_cache (image_hash, model_version, perceptual_hash, embedding, "
+            "embedding_dimension, created_at) "
+            "SELECT DISTINCT ON (pe.image_hash, pe.model_version) pe.image_hash, pe.model_version, "
+            "ip.perceptual_hash, pe.embedding, pe.embedding_dimension, now() "
+            "FROM photo_embeddings pe JOIN item_photos ip ON ip.id = pe.item_photo_id "
+            "WHERE pe.status = 'ready' AND pe.embedding IS NOT NULL AND pe.embedding_dimension IS NOT NULL "
+            "ORDER BY pe.image_hash, pe.model_version, pe.updated_at DESC "
+            "ON CONFLICT DO NOTHING"
+        )
+
+
+def downgrade():
+    op.drop_index('ix_embedding_cache_phash_model', table_name='embedding_cache')
+    op.drop_table('embedding_cache')
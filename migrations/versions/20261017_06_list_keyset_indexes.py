@@ -0,0 +1,25 @@
+"""add index (status, date_reported, id) sur items et item_id sur item_photos (pagination par curseur)
+
+Revision ID: 20261017_06
+Revises: 20261017_05
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = '20261017_06'
+down_revision = '20261017_05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Une page de liste devient une simple lecture d'index à partir du curseur.
+    op.create_index('ix_items_status_date_reported_id', 'items', ['status', 'date_reported', 'id'])
+    # Photos des cartes chargées par item_id IN (...) : sans index, un parcours
+    # complet de item_photos par page affichée.
+    op.create_index('ix_item_photos_item_id', 'item_photos', ['item_id'])
+
+
+def downgrade():
+    op.drop_index('ix_item_photos_item_id', table_name='item_photos')
+    op.drop_index('ix_items_status_date_reported_id', table_name='items')
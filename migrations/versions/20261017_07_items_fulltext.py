@@ -0,0 +1,45 @@
+"""add recherche plein texte sur items (tsvector français sans accents + trigrammes sur le titre)
+
+Revision ID: 20261017_07
+Revises: 20261017_06
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = '20261017_07'
+down_revision = '20261017_06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # PostgreSQL uniquement : ailleurs, item_search.py garde la recherche ILIKE.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Configuration française dont les mots passent par unaccent avant la
+    # racinisation : « téléphone » et « telephone » donnent le même lexème.
+    op.execute("CREATE TEXT SEARCH CONFIGURATION lf_french (COPY = french)")
+    op.execute("ALTER TEXT SEARCH CONFIGURATION lf_french "
+               "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem")
+    # Colonne générée : toujours à jour, sans trigger ni code applicatif.
+    op.execute(
+        "ALTER TABLE items ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('lf_french'::regconfig, coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('lf_french'::regconfig, coalesce(item_brand, '') || ' ' || "
+        "coalesce(item_color, '')), 'B') || "
+        "setweight(to_tsvector('lf_french'::regconfig, coalesce(comments, '')), 'C')"
+        ") STORED"
+    )
+    op.execute("CREATE INDEX ix_items_search_vector ON items USING gin (search_vector)")
+    op.execute("CREATE INDEX ix_items_title_trgm ON items USING gin (title gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_items_title_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_items_search_vector")
+    op.execute("ALTER TABLE items DROP COLUMN IF EXISTS search_vector")
+    op.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS lf_french")
@@ -0,0 +1,52 @@
+"""add headphone_loans.search_key (nom normalisé, index trigramme pour la recherche instantanée)
+
+Revision ID: 20261017_08
+Revises: 20261017_07
+Create Date: 2026-10-17
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+from unidecode import unidecode
+
+revision = '20261017_08'
+down_revision = '20261017_07'
+branch_labels = None
+depends_on = None
+
+
+def _normalize(text):
+    return re.sub(r'[^a-z0-9]+', ' ', unidecode(text or '').lower()).strip()
+
+
+def search_key(first_name, last_name):
+    """Copie figée de loan_search.search_key au moment de la migration."""
+    first, last = _normalize(first_name), _normalize(last_name)
+    return f'{first} {last}'.strip() + ' | ' + f'{last} {first}'.strip()
+
+
+def upgrade():
+    op.add_column('headphone_loans', sa.Column('search_key', sa.String(length=410), nullable=True))
+    # Clés des prêts existants : la normalisation (unidecode) vit côté Python,
+    # les nouvelles lignes sont remplies par les événements de models.py.
+    bind = op.get_bind()
+    loans = sa.table('headphone_loans', sa.column('id', sa.Integer), sa.column('first_name', sa.String),
+                     sa.column('last_name', sa.String), sa.column('search_key', sa.String))
+    rows = bind.execute(sa.select(loans.c.id, loans.c.first_name, loans.c.last_name)).fetchall()
+    for start in range(0, len(rows), 500):
+        bind.execute(
+            loans.update().where(loans.c.id == sa.bindparam('loan_id')).values(search_key=sa.bindparam('key')),
+            [{'loan_id': row.id, 'key': search_key(row.first_name, row.last_name)}
+             for row in rows[start:start + 500]],
+        )
+    if bind.dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX ix_headphone_loans_search_key_trgm ON headphone_loans "
+                   "USING gin (search_key gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_headphone_loans_search_key_trgm")
+    op.drop_column('headphone_loans', 'search_key')
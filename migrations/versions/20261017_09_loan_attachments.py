@@ -0,0 +1,119 @@
+"""add loan_attachments (signature et pièce d'identité des prêts de casques en octets bruts)
+
+Revision ID: 20261017_09
+Revises: 20261017_08
+Create Date: 2026-10-17
+"""
+import base64
+import binascii
+import hashlib
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017_09'
+down_revision = '20261017_08'
+branch_labels = None
+depends_on = None
+
+BATCH = 200
+# Colonne d'origine → nature de la pièce jointe (loan_attachments.KINDS).
+COLUMNS = (('signature', 'signature'), ('id_card_photo', 'id_card'))
+_DATA_URL_RE = re.compile(r'data:(?P<mime>[\w.+-]+/[\w.+-]+);base64,(?P<payload>.*)', re.DOTALL)
+
+
+def decode_data_url(value):
+    """Copie figée de loan_attachments.decode_data_url au moment de la migration."""
+    if not isinstance(value, str):
+        return None
+    match = _DATA_URL_RE.fullmatch(value.strip())
+    if match is None:
+        return None
+    try:
+        data = base64.b64decode(match['payload'], validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return (match['mime'].lower(), data) if data else None
+
+
+def _loans_table(*columns):
+    return sa.table('headphone_loans', sa.column('id', sa.Integer), *(sa.column(c, sa.Text) for c in columns))
+
+
+_attachments = sa.table(
+    'loan_attachments', sa.column('id', sa.Integer), sa.column('loan_id', sa.Integer),
+    sa.column('kind', sa.String), sa.column('mime_type', sa.String), sa.column('data', sa.LargeBinary),
+    sa.column('size_bytes', sa.Integer), sa.column('content_hash', sa.String),
+)
+
+
+def upgrade():
+    op.create_table(
+        'loan_attachments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('loan_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('mime_type', sa.String(length=100), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('size_bytes', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.ForeignKeyConstraint(['loan_id'], ['headphone_loans.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('loan_id', 'kind', name='uq_loan_attachment_kind'),
+    )
+    op.create_index('ix_loan_attachments_loan_id', 'loan_attachments', ['loan_id'])
+
+    # Lots parcourus par id croissant : seules BATCH paires d'images base64
+    # sont en mémoire à la fois, même sur une table de plusieurs centaines de Mo.
+    bind = op.get_bind()
+    loans = _loans_table(*(column for column, _ in COLUMNS))
+    has_image = sa.or_(*(loans.c[column].isnot(None) for column, _ in COLUMNS))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(loans).where(loans.c.id > last_id, has_image).order_by(loans.c.id).limit(BATCH)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        values = []
+        for row in rows:
+            for column, kind in COLUMNS:
+                decoded = decode_data_url(getattr(row, column))
+                if decoded is None:
+                    continue
+                mime_type, data = decoded
+                values.append({'loan_id': row.id, 'kind': kind, 'mime_type': mime_type, 'data': data,
+                               'size_bytes': len(data), 'content_hash': hashlib.sha256(data).hexdigest()})
+        if values:
+            bind.execute(_attachments.insert(), values)
+
+    with op.batch_alter_table('headphone_loans') as batch:
+        batch.drop_column('signature')
+        batch.drop_column('id_card_photo')
+
+
+def downgrade():
+    with op.batch_alter_table('headphone_loans') as batch:
+        batch.add_column(sa.Column('signature', sa.Text(), nullable=True))
+        batch.add_column(sa.Column('id_card_photo', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    loans = _loans_table(*(column for column, _ in COLUMNS))
+    kinds = {kind: column for column, kind in COLUMNS}
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(_attachments).where(_attachments.c.id > last_id).order_by(_attachments.c.id).limit(BATCH)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        for row in rows:
+            url = f'data:{row.mime_type};base64,' + base64.b64encode(row.data).decode('ascii')
+            bind.execute(loans.update().where(loans.c.id == row.loan_id).values({kinds[row.kind]: url}))
+
+    op.drop_index('ix_loan_attachments_loan_id', table_name='loan_attachments')
+    op.drop_table('loan_attachments')
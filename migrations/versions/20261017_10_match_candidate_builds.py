@@ -0,0 +1,28 @@
+"""add match_candidate_builds (version du moteur de la dernière reconstruction de match_candidates)
+
+Revision ID: 20261017_10
+Revises: 20261017_09
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017_10'
+down_revision = '20261017_09'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Table vide : /matches calcule à la volée jusqu'à ce que `flask
+    # rebuild-match-candidates` ou le worker photo reconstruise et l'enregistre.
+    op.create_table(
+        'match_candidate_builds',
+        sa.Column('engine_version', sa.String(length=40), primary_key=True),
+        sa.Column('pair_count', sa.Integer(), nullable=False),
+        sa.Column('built_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+
+
+def downgrade():
+    op.drop_table('match_candidate_builds')
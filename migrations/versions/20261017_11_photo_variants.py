@@ -0,0 +1,33 @@
+"""add photo_variants (variantes réduites des photos, gardées en base derrière le cache disque)
+
+Revision ID: 20261017_11
+Revises: 20261017_10
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '20261017_11'
+down_revision = '20261017_10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Table vide : chaque variante est écrite à sa première demande.
+    op.create_table(
+        'photo_variants',
+        sa.Column('key', sa.String(length=100), primary_key=True),
+        sa.Column('source_key', sa.String(length=64), nullable=False),
+        sa.Column('width', sa.Integer(), nullable=False),
+        sa.Column('format', sa.String(length=10), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('size_bytes', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+    op.create_index('ix_photo_variants_source_key', 'photo_variants', ['source_key'])
+
+
+def downgrade():
+    op.drop_index('ix_photo_variants_source_key', table_name='photo_variants')
+    op.drop_table('photo_variants')
@@ -0,0 +1,320 @@
+"""Serveur d'inférence DINOv2 partagé, sur socket Unix (optionnel).
+
+Chaque worker gunicorn chargeait sa propre copie de DINOv2 (plusieurs
+centaines de Mo par processus). Quand ``VISUAL_MATCHER_SOCKET`` est défini,
+visual_matcher ne charge plus rien : il envoie les images à ce processus
+unique, lancé par gunicorn.conf.py (ou à la main : ``python -m model_server
+--socket /tmp/dinov2.sock``), qui les regroupe en lots.
+
+* Les requêtes entrent dans une file bornée (``max_queue``) ; une file pleine
+  est refusée tout de suite plutôt que d'accumuler du retard.
+* Un seul thread d'inférence vide la file : il attend au plus ``max_wait``
+  secondes de quoi remplir un lot de ``max_batch`` images, puis appelle
+  ``visual_matcher.embed_images_bytes`` une fois pour tout le lot.
+* Côté client, toute panne (socket absent, serveur arrêté, délai dépassé)
+  lève ``ModelServerUnavailable`` ; visual_matcher la traduit en modèle
+  « unavailable », exactement comme un échec de chargement local.
+
+Protocole : des trames préfixées par leur longueur (4 octets, gros-boutiste).
+Une requête est une trame JSON (``{"op": "embed", "count": n}`` ou
+``{"op": "status"}``) suivie, pour ``embed``, de n trames d'image. La réponse
+est une trame JSON, suivie pour ``embed`` d'une trame de n x dim float32.
+Ce module n'importe ni torch ni Flask : seul le processus serveur charge le
+modèle.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+_LOGGER = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct('>I')
+MAX_FRAME = 64 * 1024 * 1024  # une photo acceptée fait au plus 30 Mo
+
+
+class ModelServerUnavailable(RuntimeError):
+    """Le serveur de modèle est injoignable, saturé ou trop lent."""
+
+
+def send_frame(sock, payload: bytes) -> None:
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size: int) -> bytes | None:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock) -> bytes | None:
+    """Trame suivante, ou None si le pair a fermé la connexion entre deux trames."""
+    header = _recv_exact(sock, _LENGTH.size)
+    if header is None:
+        return None
+    (size,) = _LENGTH.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"trame de {size} octets refusée (maximum {MAX_FRAME})")
+    payload = _recv_exact(sock, size) if size else b''
+    if payload is None:
+        raise ConnectionError("connexion fermée au milieu d'une trame")
+    return payload
+
+
+def send_json(sock, message: dict) -> None:
+    send_frame(sock, json.dumps(message).encode('utf-8'))
+
+
+def recv_json(sock) -> dict | None:
+    frame = recv_frame(sock)
+    return None if frame is None else json.loads(frame.decode('utf-8'))
+
+
+class _Pending:
+    """Une requête embed en attente du thread d'inférence."""
+
+    def __init__(self, images: list[bytes]):
+        self.images = images
+        self.vectors = None
+        self.failed = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class ModelServer:
+    """Accepte les connexions et regroupe les images de toutes les requêtes en lots.
+
+    `embed` reçoit une liste d'octets et renvoie ``(vecteurs (N, D), masque
+    d'échec (N,))`` ; `status` renvoie le dictionnaire de
+    ``visual_matcher.model_status``.
+    """
+
+    def __init__(self, path: str, embed, status, *, max_batch: int = 16, max_wait: float = 0.02,
+                 max_queue: int = 64, request_timeout: float = 60.0):
+        self.path = path
+        self.embed = embed
+        self.status = status
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.request_timeout = request_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._listener = None
+        self.batches = 0
+
+    def start(self) -> None:
+        """Ouvre le socket et lance les threads d'acceptation et d'inférence."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # socket laissé par un arrêt brutal
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        os.chmod(self.path, 0o660)
+        listener.listen(64)
+        listener.settimeout(0.5)
+        self._listener = listener
+        threading.Thread(target=self._batch_loop, name='model-server-batch', daemon=True).start()
+        threading.Thread(target=self._accept_loop, name='model-server-accept', daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._queue.put(None)
+        if self._listener is not None:
+            self._listener.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def serve_forever(self) -> None:
+        self.start()
+        while not self._stopping.is_set():
+            self._stopping.wait(1.0)
+
+    def _accept_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                conn, _ = self._listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn) -> None:
+        with conn:
+            conn.settimeout(self.request_timeout)
+            try:
+                while True:
+                    request = recv_json(conn)
+                    if request is None:
+                        return
+                    if request.get('op') == 'status':
+                        send_json(conn, {'ok': True, 'status': self.status()})
+                    elif request.get('op') == 'embed':
+                        images = [recv_frame(conn) or b'' for _ in range(int(request.get('count', 0)))]
+                        self._reply_embed(conn, images)
+                    else:
+                        send_json(conn, {'ok': False, 'error': f"opération inconnue : {request.get('op')!r}"})
+            except (OSError, ValueError) as exc:
+                _LOGGER.warning("Connexion au serveur de modèle interrompue : %s", exc)
+
+    def _reply_embed(self, conn, images: list[bytes]) -> None:
+        pending = _Pending(images)
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            send_json(conn, {'ok': False, 'error': "file d'attente pleine"})
+            return
+        if not pending.done.wait(self.request_timeout):
+            send_json(conn, {'ok': False, 'error': 'délai dépassé'})
+            return
+        if pending.error:
+            send_json(conn, {'ok': False, 'error': pending.error})
+            return
+        vectors = np.ascontiguousarray(pending.vectors, dtype=np.float32)
+        send_json(conn, {'ok': True, 'count': len(images), 'dim': int(vectors.shape[1]),
+                         'failed': [int(i) for i in np.flatnonzero(pending.failed)]})
+        send_frame(conn, vectors.tobytes())
+
+    def _batch_loop(self) -> None:
+        while not self._stopping.is_set():
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, count = [first], len(first.images)
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if pending is None:
+                    self._stopping.set()
+                    break
+                batch.append(pending)
+                count += len(pending.images)
+            self._run(batch)
+
+    def _run(self, batch: list[_Pending]) -> None:
+        self.batches += 1
+        try:
+            vectors, failed = self.embed([image for pending in batch for image in pending.images])
+        except Exception as exc:
+            _LOGGER.exception("Échec d'un lot d'inférence")
+            for pending in batch:
+                pending.error = f'{type(exc).__name__}: {exc}'
+                pending.done.set()
+            return
+        offset = 0
+        for pending in batch:
+            size = len(pending.images)
+            pending.vectors = vectors[offset:offset + size]
+            pending.failed = failed[offset:offset + size]
+            offset += size
+            pending.done.set()
+
+
+class ModelClient:
+    """Client du serveur de modèle : une connexion par appel, délai borné."""
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as exc:
+            sock.close()
+            raise ModelServerUnavailable(f"serveur de modèle injoignable ({self.path}) : {exc}") from exc
+        return sock
+
+    def _request(self, sock, header: dict, frames=()) -> dict:
+        try:
+            send_json(sock, header)
+            for frame in frames:
+                send_frame(sock, frame)
+            reply = recv_json(sock)
+        except (OSError, ValueError) as exc:
+            raise ModelServerUnavailable(f"serveur de modèle : {exc}") from exc
+        if reply is None:
+            raise ModelServerUnavailable("serveur de modèle : connexion fermée")
+        if not reply.get('ok'):
+            raise ModelServerUnavailable(f"serveur de modèle : {reply.get('error')}")
+        return reply
+
+    def embed(self, images: list[bytes]) -> tuple[np.ndarray, np.ndarray]:
+        """Mêmes sorties que ``visual_matcher.embed_images_bytes``."""
+        with self._connect() as sock:
+            reply = self._request(sock, {'op': 'embed', 'count': len(images)}, images)
+            try:
+                raw = recv_frame(sock)
+            except (OSError, ValueError) as exc:
+                raise ModelServerUnavailable(f"serveur de modèle : {exc}") from exc
+        if raw is None:
+            raise ModelServerUnavailable("serveur de modèle : réponse incomplète")
+        vectors = np.frombuffer(raw, dtype=np.float32).reshape(reply['count'], reply['dim']).copy()
+        failed = np.zeros(reply['count'], dtype=bool)
+        failed[reply['failed']] = True
+        return vectors, failed
+
+    def status(self) -> dict:
+        with self._connect() as sock:
+            return self._request(sock, {'op': 'status'})['status']
+
+
+def serve(path: str, *, max_batch: int, max_wait: float, max_queue: int) -> None:
+    """Charge le modèle une fois dans ce processus puis sert les requêtes jusqu'à SIGTERM."""
+    # Le processus hérite de l'environnement des workers : sans ce retrait,
+    # visual_matcher s'enverrait ses propres requêtes.
+    os.environ.pop('VISUAL_MATCHER_SOCKET', None)
+    import visual_matcher
+
+    visual_matcher.load_model()
+    server = ModelServer(
+        path,
+        lambda images: visual_matcher.embed_images_bytes(images, batch_size=max_batch),
+        visual_matcher.model_status,
+        max_batch=max_batch, max_wait=max_wait, max_queue=max_queue,
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    _LOGGER.info("Serveur de modèle à l'écoute sur %s (état : %s)", path, visual_matcher.model_status()['state'])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serveur d'inférence DINOv2 partagé (socket Unix).")
+    parser.add_argument('--socket', default=os.environ.get('VISUAL_MATCHER_SOCKET'), required=False)
+    parser.add_argument('--max-batch', type=int, default=int(os.environ.get('VISUAL_MATCHER_BATCH_SIZE', '16')))
+    parser.add_argument('--max-wait-ms', type=float, default=20.0)
+    parser.add_argument('--max-queue', type=int, default=64)
+    args = parser.parse_args(argv)
+    if not args.socket:
+        parser.error('--socket ou VISUAL_MATCHER_SOCKET requis')
+    logging.basicConfig(level=logging.INFO, format='[model-server] %(levelname)s %(message)s')
+    serve(args.socket, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000.0, max_queue=args.max_queue)
+
+
+if __name__ == '__main__':
+    main()
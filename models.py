@@ -1,11 +1,20 @@
 import enum
 from datetime import datetime, timezone
+import loan_search
 import password_reset
 from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import event, inspect
 
+# Colonnes binaires (photos, icônes, signatures, PDF) : jamais chargées avec la
+# ligne. Une liste d'objets, une boucle de matching ou un tableau de prêts n'en
+# lisent aucune, et chacune pèse de quelques Ko à plusieurs Mo. Les routes qui
+# servent ces octets les demandent explicitement (undefer) ;
+# ailleurs, un accès isolé les charge à la demande.
+BLOB_GROUP = 'blobs'
+
+
 class DepositType(enum.Enum):
     ID_CARD = 'id_card'
     CASH = 'cash'
@@ -27,14 +36,51 @@ class HeadphoneLoan(db.Model):
     deposit_amount = db.Column(db.Numeric(10, 2), nullable=True)
     loan_date = db.Column(db.DateTime, nullable=False, default=db.func.now())
     return_date = db.Column(db.DateTime, nullable=True)
-    signature = db.Column(db.Text, nullable=True)  # Image base64 de la signature
-    id_card_photo = db.Column(db.Text, nullable=True)  # Image base64 de la CI
     status = db.Column(db.Enum(LoanStatus), nullable=False, default=LoanStatus.ACTIVE, index=True)
     previous_status = db.Column(db.Enum(LoanStatus), nullable=True)
+    # « prénom nom | nom prénom » normalisé, tenu à jour par les événements en
+    # fin de module ; indexé en trigrammes sur PostgreSQL (voir loan_search.py).
+    search_key = db.Column(db.String(410), nullable=True)
+    # Signature et pièce d'identité vivent dans loan_attachments (octets bruts) ;
+    # `signature_present` et `id_card_present` sont définis après LoanAttachment.
+    attachments = db.relationship('LoanAttachment', backref='loan', lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<HeadphoneLoan {self.first_name} {self.last_name} ({self.status.value})>'
 
+
+class LoanAttachment(db.Model):
+    """Image rattachée à un prêt de casque : signature de retour ou pièce d'identité.
+
+    Stockées auparavant en data URL base64 dans headphone_loans (un tiers plus
+    lourdes, relues avec chaque prêt) ; ici en octets bruts, une ligne par
+    prêt et par nature, servies par /loans/<id>/attachments/<nature>.
+    """
+    __tablename__ = 'loan_attachments'
+    id = db.Column(db.Integer, primary_key=True)
+    loan_id = db.Column(db.Integer, db.ForeignKey('headphone_loans.id', ondelete='CASCADE'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # voir loan_attachments.KINDS
+    mime_type = db.Column(db.String(100), nullable=False)
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False), group=BLOB_GROUP)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    # SHA-256 du contenu, ETag de la route : un 304 ne lit pas `data`.
+    content_hash = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    __table_args__ = (db.UniqueConstraint('loan_id', 'kind', name='uq_loan_attachment_kind'),)
+
+    def __repr__(self):
+        return f'<LoanAttachment {self.kind} loan={self.loan_id}>'
+
+
+# Présence des pièces jointes calculée en SQL : les tableaux de prêts n'en lisent pas les octets.
+HeadphoneLoan.signature_present = db.column_property(
+    db.exists().where(LoanAttachment.loan_id == HeadphoneLoan.id, LoanAttachment.kind == 'signature')
+)
+HeadphoneLoan.id_card_present = db.column_property(
+    db.exists().where(LoanAttachment.loan_id == HeadphoneLoan.id, LoanAttachment.kind == 'id_card')
+)
+
+
 class Category(db.Model):
     __tablename__ = 'categories'
     id = db.Column(db.Integer, primary_key=True)
@@ -47,7 +93,9 @@ class Category(db.Model):
     
     # Système hybride d'icônes
     icon_class = db.Column(db.String(50), nullable=True)  # Classe Bootstrap Icon (ex: 'bi bi-wallet')
-    icon_data = db.Column(db.LargeBinary, nullable=True)  # Image personnalisée (binaire)
+    icon_data = db.deferred(db.Column(db.LargeBinary, nullable=True), group=BLOB_GROUP)  # Image personnalisée (binaire)
+    # Présence de l'image calculée en SQL : afficher une icône ne charge pas ses octets.
+    icon_data_present = db.column_property(icon_data.columns[0].isnot(None))
     icon_mime_type = db.Column(db.String(50), nullable=True)  # Type MIME de l'image
     icon_filename = db.Column(db.String(100), nullable=True)  # Nom du fichier original
     
@@ -57,7 +105,10 @@ class Category(db.Model):
     @property
     def has_custom_icon(self):
         """Vérifie si cette catégorie a une image personnalisée."""
-        return self.icon_data is not None and self.icon_mime_type is not None
+        if 'icon_data' in self.__dict__:
+            # Octets déjà chargés ou modifiés dans cette session : ils font foi.
+            return self.icon_data is not None and self.icon_mime_type is not None
+        return bool(self.icon_data_present) and self.icon_mime_type is not None
     
     @property
     def icon_bootstrap_class(self):
@@ -183,6 +234,8 @@ class Status(enum.Enum):
 
 class Item(db.Model):
     __tablename__ = 'items'
+    # Ordre des listes et pagination par curseur (keyset_pagination.py).
+    __table_args__ = (db.Index('ix_items_status_date_reported_id', 'status', 'date_reported', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     status = db.Column(db.Enum(Status), nullable=False, default=Status.LOST, index=True)
     previous_status = db.Column(db.Enum(Status), nullable=True)  # Statut original avant demande suppression
@@ -201,7 +254,7 @@ class Item(db.Model):
     item_brand = db.Column(db.String(100), nullable=True)         # Marque/modèle visible
     item_distinctive = db.Column(db.String(200), nullable=True)   # Flags CSV ex: "a_document_id,a_argent"
     photo_filename = db.Column(db.String(200), nullable=True)  # Pour compatibilité
-    photo_data = db.Column(db.LargeBinary, nullable=True)
+    photo_data = db.deferred(db.Column(db.LargeBinary, nullable=True), group=BLOB_GROUP)
     photo_mime_type = db.Column(db.String(100), nullable=True)
     photo_original_filename = db.Column(db.String(200), nullable=True)
     claimant_name = db.Column(db.String(100), nullable=True)
@@ -210,10 +263,12 @@ class Item(db.Model):
     return_date = db.Column(db.DateTime, nullable=True)
     return_comment = db.Column(db.Text, nullable=True)
     return_photo_filename = db.Column(db.String(200), nullable=True)  # Photo prise lors de la restitution
-    return_photo_data = db.Column(db.LargeBinary, nullable=True)
+    return_photo_data = db.deferred(db.Column(db.LargeBinary, nullable=True), group=BLOB_GROUP)
     return_photo_mime_type = db.Column(db.String(100), nullable=True)
     return_photo_original_filename = db.Column(db.String(200), nullable=True)
     photos = db.relationship('ItemPhoto', backref='item', lazy=True, cascade="all, delete-orphan")
+    # items.search_vector (tsvector généré, PostgreSQL seulement, migration
+    # 20261017_07) n'est volontairement pas mappée : item_search.py y accède en SQL.
 
     def __repr__(self):
         return f'<Item {self.id} {self.title} ({self.status.value})>'
@@ -232,6 +287,98 @@ class Match(db.Model):
     def __repr__(self):
         return f'<Match Lost:{self.lost_id} Found:{self.found_id}>'
 
+class MatchCandidate(db.Model):
+    """Score persisté d'une paire perdu↔trouvé, tenu à jour par match_candidates.py.
+
+    Seules les paires au-dessus de MATCH_CONFIG['candidate_floor'] sont
+    conservées : la table reste proportionnelle aux paires plausibles, pas au
+    produit perdus × trouvés.
+    """
+    __tablename__ = 'match_candidates'
+    id = db.Column(db.Integer, primary_key=True)
+    lost_id = db.Column(db.Integer, db.ForeignKey('items.id', ondelete='CASCADE'), nullable=False, index=True)
+    found_id = db.Column(db.Integer, db.ForeignKey('items.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+    components = db.Column(db.JSON, nullable=True)  # {'base', 'bonus', 'image'}
+    engine_version = db.Column(db.String(40), nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('lost_id', 'found_id', name='uq_match_candidate_pair'),
+        db.Index('ix_match_candidates_version_score', 'engine_version', 'score'),
+    )
+
+    def __repr__(self):
+        return f'<MatchCandidate Lost:{self.lost_id} Found:{self.found_id} {self.score}>'
+
+class MatchCandidateBuild(db.Model):
+    """Version du moteur pour laquelle match_candidates a été reconstruite en entier.
+
+    Tenue à part du contenu de la table : un festival sans aucune paire
+    au-dessus du plancher a une table vide mais à jour, qui ne doit pas être
+    reconstruite à chaque visite de /matches.
+    """
+    __tablename__ = 'match_candidate_builds'
+    engine_version = db.Column(db.String(40), primary_key=True)
+    pair_count = db.Column(db.Integer, nullable=False)
+    built_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    def __repr__(self):
+        return f'<MatchCandidateBuild {self.engine_version} {self.pair_count}>'
+
+class ItemMatchFeatures(db.Model):
+    """Caractéristiques de score d'un objet (matching.MatchFeatures), voir match_features.py.
+
+    `fingerprint` couvre la version du vocabulaire et les champs sources : une
+    ligne dont l'empreinte ne correspond plus à l'objet est simplement ignorée
+    et recalculée.
+    """
+    __tablename__ = 'item_match_features'
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id', ondelete='CASCADE'), primary_key=True)
+    fingerprint = db.Column(db.String(40), nullable=False)
+    data = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    def __repr__(self):
+        return f'<ItemMatchFeatures item={self.item_id}>'
+
+class PhotoVariant(db.Model):
+    """Variante réduite d'une photo (thumbnails.py), calculée une fois et gardée en base.
+
+    Clé : empreinte de la photo d'origine, largeur et format
+    (thumbnails.variant_key). Le cache disque n'en garde qu'une copie : après
+    une éviction ou un redéploiement, la variante est relue ici, pas recalculée.
+    """
+    __tablename__ = 'photo_variants'
+    key = db.Column(db.String(100), primary_key=True)
+    source_key = db.Column(db.String(64), nullable=False, index=True)
+    width = db.Column(db.Integer, nullable=False)
+    format = db.Column(db.String(10), nullable=False)
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False), group=BLOB_GROUP)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    def __repr__(self):
+        return f'<PhotoVariant {self.key}>'
+
+class PhotoBlobRef(db.Model):
+    """Nom de fichier servi par /uploads → empreinte SHA-256 de son contenu, voir blob_store.py.
+
+    Un nom de fichier est généré à chaque upload et ne change jamais de
+    contenu : la ligne est écrite à la première lecture et reste valable.
+    `source`/`source_id` désignent la colonne binaire qui porte les octets.
+    """
+    __tablename__ = 'photo_blob_refs'
+    filename = db.Column(db.String(200), primary_key=True)
+    blob_key = db.Column(db.String(64), nullable=False, index=True)
+    mime_type = db.Column(db.String(100), nullable=True)
+    source = db.Column(db.String(20), nullable=False)
+    source_id = db.Column(db.Integer, nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    def __repr__(self):
+        return f'<PhotoBlobRef {self.filename} {self.blob_key[:12]}>'
+
 class RejectedPair(db.Model):
     __tablename__ = 'rejected_pairs'
     id = db.Column(db.Integer, primary_key=True)
@@ -255,9 +402,9 @@ class PhotoEmbeddingStatus(enum.Enum):
 class ItemPhoto(db.Model):
     __tablename__ = 'item_photos'
     id = db.Column(db.Integer, primary_key=True)
-    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False, index=True)
     filename = db.Column(db.String(200), nullable=False)
-    data = db.Column(db.LargeBinary, nullable=True)
+    data = db.deferred(db.Column(db.LargeBinary, nullable=True), group=BLOB_GROUP)
     mime_type = db.Column(db.String(100), nullable=True)
     original_filename = db.Column(db.String(200), nullable=True)
     # pHash hexadécimal (256 bits) : accélère la détection de photos très proches.
@@ -265,6 +412,27 @@ class ItemPhoto(db.Model):
     embeddings = db.relationship('PhotoEmbedding', backref='photo', cascade='all, delete-orphan', lazy=True)
 
 
+class PhotoJob(db.Model):
+    """Travail photo en attente du worker (pHash, vecteur DINOv2), voir photo_jobs.py.
+
+    Une ligne par photo : une nouvelle demande remet la même ligne en attente.
+    """
+    __tablename__ = 'photo_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    item_photo_id = db.Column(db.Integer, db.ForeignKey('item_photos.id', ondelete='CASCADE'),
+                              nullable=False, unique=True)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
+
+    def __repr__(self):
+        return f'<PhotoJob photo={self.item_photo_id} status={self.status} attempts={self.attempts}>'
+
+
 class PhotoEmbedding(db.Model):
     """Vecteur DINOv2 persisté pour une ItemPhoto, un par version de modèle."""
     __tablename__ = 'photo_embeddings'
@@ -272,7 +440,7 @@ class PhotoEmbedding(db.Model):
     item_photo_id = db.Column(db.Integer, db.ForeignKey('item_photos.id', ondelete='CASCADE'), nullable=False, index=True)
     model_version = db.Column(db.String(100), nullable=False, index=True)
     image_hash = db.Column(db.String(64), nullable=False, index=True)
-    embedding = db.Column(db.LargeBinary, nullable=True)
+    embedding = db.deferred(db.Column(db.LargeBinary, nullable=True), group=BLOB_GROUP)
     embedding_dimension = db.Column(db.Integer, nullable=True)
     status = db.Column(db.String(20), nullable=False, default=PhotoEmbeddingStatus.PENDING.value, index=True)
     error_message = db.Column(db.String(500), nullable=True)
@@ -283,6 +451,26 @@ class PhotoEmbedding(db.Model):
     def __repr__(self):
         return f'<PhotoEmbedding photo={self.item_photo_id} model={self.model_version} status={self.status}>'
 
+class EmbeddingCacheEntry(db.Model):
+    """Vecteur DINOv2 par contenu d'image (SHA-256) et version de modèle.
+
+    Sert à ne jamais refaire l'inférence d'une image déjà vue, quelle que soit
+    la photo qui la porte ; `perceptual_hash` permet, en option, de reprendre
+    le vecteur d'un simple réencodage de la même prise de vue.
+    """
+    __tablename__ = 'embedding_cache'
+    image_hash = db.Column(db.String(64), primary_key=True)
+    model_version = db.Column(db.String(100), primary_key=True)
+    perceptual_hash = db.Column(db.String(64), nullable=True)
+    embedding = db.deferred(db.Column(db.LargeBinary, nullable=False), group=BLOB_GROUP)
+    embedding_dimension = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    __table_args__ = (db.Index('ix_embedding_cache_phash_model', 'perceptual_hash', 'model_version'),)
+
+    def __repr__(self):
+        return f'<EmbeddingCacheEntry {self.image_hash[:12]} model={self.model_version}>'
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -358,7 +546,7 @@ class Product(db.Model):
     vat_rate = db.Column(db.Integer, nullable=False, default=21)  # taux TVA en % (0,6,12,21)
     active = db.Column(db.Boolean, nullable=False, default=True)
     image_filename = db.Column(db.String(200), nullable=True)
-    image_data = db.Column(db.LargeBinary, nullable=True)
+    image_data = db.deferred(db.Column(db.LargeBinary, nullable=True), group=BLOB_GROUP)
     image_mime_type = db.Column(db.String(100), nullable=True)
     image_original_filename = db.Column(db.String(200), nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
@@ -412,7 +600,7 @@ class ZTicketPDF(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     closure_id = db.Column(db.Integer, db.ForeignKey('z_closures.id'), nullable=True, index=True)
     filename = db.Column(db.String(200), nullable=False)
-    pdf_data = db.Column(db.LargeBinary, nullable=False)
+    pdf_data = db.deferred(db.Column(db.LargeBinary, nullable=False), group=BLOB_GROUP)
     size_bytes = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
 
@@ -510,3 +698,9 @@ def invalidate_embeddings_when_photo_changes(mapper, connection, target):
             embedding.status = PhotoEmbeddingStatus.INVALIDATED.value
             embedding.embedding = None
             embedding.embedding_dimension = None
+
+
+@event.listens_for(HeadphoneLoan, 'before_insert')
+@event.listens_for(HeadphoneLoan, 'before_update')
+def refresh_loan_search_key(mapper, connection, target):
+    target.search_key = loan_search.search_key(target.first_name, target.last_name)
@@ -0,0 +1,176 @@
+"""Index en mémoire des hash perceptuels (pHash) pour la détection de doublons photo.
+
+L'aperçu des doublons à l'upload chargeait toutes les lignes item_photos —
+contenu binaire compris — pour calculer en Python une distance de Hamming
+contre chaque hash de 256 bits. Ici les hash vivent en mémoire, découpés en
+16 bandes de 16 bits (multi-index hashing) :
+
+* deux hash à distance <= r ont forcément au moins une bande à distance
+  <= r // 16 (principe des tiroirs) ; pour le seuil de 18, une bande identique
+  ou à un bit près ;
+* une recherche ne consulte donc, bande par bande, que les seaux de la valeur
+  exacte et de ses voisines à un bit, puis calcule la vraie distance sur ces
+  seuls candidats. Le résultat est exactement celui du balayage complet.
+
+L'index est rafraîchi de façon incrémentale : il compare les ids des photos
+hachées en base à ceux qu'il a lus, oublie les disparues et ne relit que
+(id, item_id, perceptual_hash) des nouvelles. Le hash d'une photo ne change
+jamais une fois calculé (photo_jobs ne le calcule que s'il manque).
+"""
+import threading
+from itertools import combinations
+
+BANDS = 16
+
+
+def hamming_distance(hash_a: str | None, hash_b: str | None) -> int | None:
+    """Distance de Hamming entre deux hash hexadécimaux de même longueur (None sinon)."""
+    if not hash_a or not hash_b or len(hash_a) != len(hash_b):
+        return None
+    try:
+        return (int(hash_a, 16) ^ int(hash_b, 16)).bit_count()
+    except ValueError:
+        return None
+
+
+def perceptual_hash(image_bytes: bytes) -> str | None:
+    """pHash 256 bits d'une image, sans modèle ML ; None si le contenu n'est pas lisible."""
+    import imagehash
+    from io import BytesIO
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            return str(imagehash.phash(image.convert('RGB'), hash_size=16))
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+
+def _parse(hex_hash: str | None) -> tuple[int, int] | None:
+    """(nombre de bits, valeur) d'un hash hexadécimal, None s'il est invalide."""
+    if not hex_hash:
+        return None
+    try:
+        return len(hex_hash) * 4, int(hex_hash, 16)
+    except ValueError:
+        return None
+
+
+def _bands(bits: int, value: int) -> list[int]:
+    width = max(1, bits // BANDS)
+    mask = (1 << width) - 1
+    return [(value >> (band * width)) & mask for band in range(bits // width)]
+
+
+def _neighbours(band_value: int, width: int, radius: int):
+    """La valeur d'une bande et toutes celles à au plus `radius` bits d'écart."""
+    yield band_value
+    for distance in range(1, radius + 1):
+        for positions in combinations(range(width), distance):
+            flipped = band_value
+            for position in positions:
+                flipped ^= 1 << position
+            yield flipped
+
+
+class PerceptualHashIndex:
+    """Hash perceptuels des photos, interrogeables par rayon de Hamming."""
+
+    def __init__(self):
+        self._photos: dict[int, tuple[int | None, int, int]] = {}   # photo → (item, bits, valeur)
+        self._buckets: dict[tuple[int, int, int], set[int]] = {}    # (bits, bande, valeur) → photos
+        self._read: set[int] = set()                                # lignes lues, hash invalide compris
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._photos)
+
+    def add(self, photo_id: int, item_id: int | None, hex_hash: str | None) -> None:
+        parsed = _parse(hex_hash)
+        self.remove(photo_id)
+        if parsed is None:
+            return
+        bits, value = parsed
+        self._photos[photo_id] = (item_id, bits, value)
+        for band, band_value in enumerate(_bands(bits, value)):
+            self._buckets.setdefault((bits, band, band_value), set()).add(photo_id)
+
+    def remove(self, photo_id: int) -> None:
+        entry = self._photos.pop(photo_id, None)
+        if entry is None:
+            return
+        _, bits, value = entry
+        for band, band_value in enumerate(_bands(bits, value)):
+            bucket = self._buckets.get((bits, band, band_value))
+            if bucket is not None:
+                bucket.discard(photo_id)
+                if not bucket:
+                    del self._buckets[(bits, band, band_value)]
+
+    def clear(self) -> None:
+        self._photos.clear()
+        self._buckets.clear()
+        self._read.clear()
+
+    def query(self, hex_hash: str | None, radius: int, limit: int | None = None) -> list[tuple[int, int | None, int]]:
+        """(photo_id, item_id, distance) des hash à distance <= radius, du plus proche au plus lointain."""
+        parsed = _parse(hex_hash)
+        if parsed is None:
+            return []
+        bits, value = parsed
+        band_values = _bands(bits, value)
+        width = max(1, bits // BANDS)
+        band_radius = radius // len(band_values)
+        candidates = set()
+        with self._lock:
+            for band, band_value in enumerate(band_values):
+                for probe in _neighbours(band_value, width, band_radius):
+                    candidates |= self._buckets.get((bits, band, probe), set())
+            found = []
+            for photo_id in candidates:
+                item_id, _, other = self._photos[photo_id]
+                distance = (value ^ other).bit_count()
+                if distance <= radius:
+                    found.append((photo_id, item_id, distance))
+        found.sort(key=lambda entry: (entry[2], entry[0]))
+        return found if limit is None else found[:limit]
+
+    def refresh(self, connection) -> None:
+        """Oublie les photos supprimées et ajoute celles hachées depuis le dernier appel.
+
+        Les ids sont comparés, pas leur nombre : une suppression suivie d'un
+        ajout, ou une photo hachée après coup par le worker (id inférieur à
+        d'autres déjà lus), sont vues toutes les deux.
+        """
+        import sqlalchemy as sa
+        from models import ItemPhoto
+
+        photos = ItemPhoto.__table__
+        hashed = photos.c.perceptual_hash.isnot(None)
+        with self._lock:
+            ids = set(connection.execute(sa.select(photos.c.id).where(hashed)).scalars())
+            for photo_id in self._read - ids:
+                self.remove(photo_id)
+                self._read.discard(photo_id)
+            missing = sorted(ids - self._read)
+            # Listes IN bornées : SQLite limite le nombre de paramètres.
+            for start in range(0, len(missing), 500):
+                self._load(connection.execute(
+                    sa.select(photos.c.id, photos.c.item_id, photos.c.perceptual_hash)
+                    .where(photos.c.id.in_(missing[start:start + 500]))))
+
+    def _load(self, rows) -> None:
+        for photo_id, item_id, hex_hash in rows:
+            self.add(photo_id, item_id, hex_hash)
+            self._read.add(photo_id)
+
+
+_INDEX = PerceptualHashIndex()
+
+
+def perceptual_hash_index() -> PerceptualHashIndex:
+    """L'index du processus, rafraîchi depuis la base."""
+    from app import db
+    with db.engine.connect() as connection:
+        _INDEX.refresh(connection)
+    return _INDEX
@@ -5,8 +5,11 @@ Face ``facebook/dinov2-small``) so a process never keeps two separate DINOv2
 weights sets in memory.
 """
 import hashlib
+import logging
 import os
-from datetime import datetime, timezone
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 
 import numpy as np
 
@@ -14,6 +17,8 @@ READY = "ready"
 FAILED = "failed"
 INVALIDATED = "invalidated"
 
+_LOGGER = logging.getLogger(__name__)
+
 
 def current_model_version() -> str:
     from visual_matcher import MODEL_ID
@@ -24,60 +29,162 @@ def image_hash(data: bytes) -> str:
     return hashlib.sha256(data).hexdigest()
 
 
-def _embed_dinov2(data: bytes) -> np.ndarray:
-    """Return a normalized float32 DINOv2 vector; model loading remains lazy."""
-    from visual_matcher import embed_image_bytes
+def _embed_dinov2_batch(images: list[bytes], batch_size: int | None = None) -> list:
+    """Normalized float32 DINOv2 vectors, or the exception explaining each failure.
+
+    Model loading remains lazy; see ``visual_matcher.embed_images_bytes``.
+    """
+    from visual_matcher import embed_images_bytes
 
-    vector = embed_image_bytes(data)
-    if vector is None:
-        raise RuntimeError("Le modèle visuel DINOv2 est indisponible")
-    vector = np.asarray(vector, dtype=np.float32)
-    norm = np.linalg.norm(vector)
-    if not norm:
-        raise ValueError("DINOv2 returned a zero vector")
-    return vector / norm
+    vectors, failed = embed_images_bytes(images, batch_size=batch_size)
+    results = []
+    for vector, bad in zip(vectors, failed):
+        if bad:
+            results.append(RuntimeError("Le modèle visuel DINOv2 est indisponible") if not vectors.shape[1]
+                           else ValueError("DINOv2 could not embed this image"))
+            continue
+        norm = np.linalg.norm(vector)
+        results.append(vector / norm if norm else ValueError("DINOv2 returned a zero vector"))
+    return results
 
 
 def ensure_photo_embedding(photo, *, force: bool = False):
-    """Create or refresh one embedding, copying an existing identical image when possible.
+    """Create or refresh one embedding; see ``ensure_photo_embeddings``."""
+    return ensure_photo_embeddings([photo], force=force)[0]
+
+
+def reuse_phash_enabled() -> bool:
+    """Reuse the vector of a pHash-identical image (a re-encode of the same shot)? Off by default."""
+    return os.environ.get("PHOTO_EMBEDDING_REUSE_PHASH", "0") == "1"
+
+
+def cached_vectors(session, version: str, digests, phashes=None) -> tuple[dict, dict]:
+    """Bulk ``embedding_cache`` lookup: ({image_hash: vector}, {perceptual_hash: vector}).
 
-    Errors are recorded on the embedding row rather than failing the photo upload.
+    One query for the byte-identical hits and, when ``phashes`` is given, one
+    more for the pHash-identical ones, both on indexed keys.
+    """
+    from sqlalchemy.orm import undefer
+    from models import EmbeddingCacheEntry
+
+    def _vector(entry):
+        return np.frombuffer(entry.embedding, dtype=np.float32).copy()
+
+    query = session.query(EmbeddingCacheEntry).options(undefer(EmbeddingCacheEntry.embedding)).filter(
+        EmbeddingCacheEntry.model_version == version)
+    by_hash = {entry.image_hash: _vector(entry)
+               for entry in query.filter(EmbeddingCacheEntry.image_hash.in_(list(digests)))} if digests else {}
+    by_phash = {}
+    if phashes:
+        for entry in query.filter(EmbeddingCacheEntry.perceptual_hash.in_(list(phashes))):
+            by_phash.setdefault(entry.perceptual_hash, _vector(entry))
+    return by_hash, by_phash
+
+
+def resolve_cached(digests, phash_by_digest: dict, by_hash: dict, by_phash: dict) -> dict:
+    """Vector for each digest found in the cache, by content first, then by pHash."""
+    found = {}
+    for digest in digests:
+        if digest in by_hash:
+            found[digest] = by_hash[digest]
+        elif phash_by_digest.get(digest) in by_phash:
+            found[digest] = by_phash[phash_by_digest[digest]]
+    return found
+
+
+def _store_cached(session, version: str, digest: str, phash: str | None, vector: np.ndarray) -> None:
+    """Record an inferred vector; a concurrent writer of the same key simply wins."""
+    from sqlalchemy.exc import IntegrityError
+    from models import EmbeddingCacheEntry
+
+    try:
+        with session.begin_nested():
+            session.merge(EmbeddingCacheEntry(image_hash=digest, model_version=version, perceptual_hash=phash,
+                                              embedding=vector.astype(np.float32).tobytes(),
+                                              embedding_dimension=int(vector.size)))
+    except IntegrityError:
+        _LOGGER.info("Embedding cache entry %s already written by another process", digest[:12])
+
+
+def ensure_photo_embeddings(photos, *, force: bool = False, batch_size: int | None = None,
+                            reuse_phash: bool | None = None) -> list:
+    """Create or refresh the embeddings of several photos with batched inference.
+
+    Returns one record per photo (``None`` for a photo without bytes). Vectors
+    come from ``embedding_cache`` whenever the same image content was already
+    embedded for this model version, through any photo, and optionally (see
+    ``reuse_phash_enabled``) when an image with the same pHash was. Only the
+    remaining images go through the model, and their vectors are cached.
+    ``force`` skips the cache lookup and overwrites its entries. Errors are
+    recorded on the embedding row rather than raised.
     """
     from app import db
     from models import PhotoEmbedding
 
     version = current_model_version()
-    data = bytes(photo.data or b"")
-    if not data:
-        return None
-    digest = image_hash(data)
-    record = PhotoEmbedding.query.filter_by(item_photo_id=photo.id, model_version=version).first()
-    if record and record.status == READY and record.image_hash == digest and not force:
-        return record
-    if not record:
-        record = PhotoEmbedding(item_photo_id=photo.id, model_version=version)
-        db.session.add(record)
-    record.image_hash = digest
-    record.updated_at = datetime.now(timezone.utc)
-
-    # A byte-identical image does not need another model inference.
-    duplicate = PhotoEmbedding.query.filter(
-        PhotoEmbedding.item_photo_id != photo.id,
-        PhotoEmbedding.model_version == version,
-        PhotoEmbedding.image_hash == digest,
-        PhotoEmbedding.status == READY,
-    ).first()
-    try:
-        vector = np.frombuffer(duplicate.embedding, dtype=np.float32).copy() if duplicate else _embed_dinov2(data)
-        record.embedding = vector.astype(np.float32).tobytes()
-        record.embedding_dimension = int(vector.size)
-        record.status = READY
-    except Exception as exc:  # Availability is operational, not a failed upload.
-        record.embedding = None
-        record.embedding_dimension = None
-        record.status = FAILED
-        record.error_message = str(exc)[:500]
-    return record
+    if reuse_phash is None:
+        reuse_phash = reuse_phash_enabled()
+    photos = list(photos)
+    records = [None] * len(photos)
+    existing = {}
+    if photos:
+        existing = {record.item_photo_id: record for record in PhotoEmbedding.query.filter(
+            PhotoEmbedding.item_photo_id.in_([photo.id for photo in photos]),
+            PhotoEmbedding.model_version == version)}
+    todo = {}  # digest -> records sharing that content
+    payloads = {}
+    phash_by_digest = {}
+    now = datetime.now(timezone.utc)
+    for position, photo in enumerate(photos):
+        data = bytes(photo.data or b"")
+        if not data:
+            continue
+        digest = image_hash(data)
+        record = existing.get(photo.id)
+        if record and record.status == READY and record.image_hash == digest and not force:
+            records[position] = record
+            continue
+        if not record:
+            record = PhotoEmbedding(item_photo_id=photo.id, model_version=version)
+            db.session.add(record)
+        record.image_hash = digest
+        record.updated_at = now
+        records[position] = record
+        todo.setdefault(digest, []).append(record)
+        payloads.setdefault(digest, data)
+        if getattr(photo, "perceptual_hash", None):
+            phash_by_digest.setdefault(digest, photo.perceptual_hash)
+
+    vectors = {}
+    if todo and not force:
+        by_hash, by_phash = cached_vectors(db.session, version, list(todo),
+                                           set(phash_by_digest.values()) if reuse_phash else None)
+        vectors = resolve_cached(todo, phash_by_digest, by_hash, by_phash)
+    missing = [digest for digest in todo if digest not in vectors]
+    if missing:
+        inferred = dict(zip(missing, _embed_dinov2_batch([payloads[digest] for digest in missing], batch_size)))
+        for digest, vector in inferred.items():
+            if not isinstance(vector, Exception):
+                _store_cached(db.session, version, digest, phash_by_digest.get(digest), vector)
+        vectors.update(inferred)
+
+    for digest, group in todo.items():
+        vector = vectors[digest]
+        for record in group:
+            try:
+                if isinstance(vector, Exception):
+                    raise vector
+                record.embedding = vector.astype(np.float32).tobytes()
+                record.embedding_dimension = int(vector.size)
+                record.status = READY
+                record.error_message = None
+                sync_embedding_vector(db.session, record)
+            except Exception as exc:  # Availability is operational, not a failed upload.
+                record.embedding = None
+                record.embedding_dimension = None
+                record.status = FAILED
+                record.error_message = str(exc)[:500]
+    return records
 
 
 def invalidate_photo_embedding(photo) -> None:
@@ -93,13 +200,288 @@ def item_embedding_similarity(item1, item2) -> float | None:
     Returns ``None`` (not 0.0) when no ready embedding exists on either side,
     so an absent comparison is never confused with an actual low similarity.
     """
-    vectors1 = _ready_vectors(item1)
-    vectors2 = _ready_vectors(item2)
+    return vectors_similarity(_ready_vectors(item1), _ready_vectors(item2))
+
+
+def vectors_similarity(vectors1, vectors2) -> float | None:
+    """Best cosine similarity between two lists of normalized vectors (``None`` if either is empty)."""
     if not vectors1 or not vectors2:
         return None
     return max(float(np.clip(np.dot(a, b), -1.0, 1.0)) for a in vectors1 for b in vectors2)
 
 
+def _grouped_max(matrix1, starts1, matrix2, starts2) -> np.ndarray:
+    """Best cosine per (group of rows of ``matrix1``, group of rows of ``matrix2``).
+
+    One float32 matrix product for every vector pair, then a max-reduce over
+    each item's photos on both axes; same value as ``vectors_similarity``.
+    """
+    sims = matrix1 @ matrix2.T
+    sims = np.maximum.reduceat(sims, starts1, axis=0)
+    sims = np.maximum.reduceat(sims, starts2, axis=1)
+    return np.clip(sims, -1.0, 1.0).astype(np.float64)
+
+
+def _stack(vector_lists):
+    """(matrix, starts) for non-empty vector lists, rows grouped list by list."""
+    sizes = [len(vectors) for vectors in vector_lists]
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+    return np.vstack([v for vectors in vector_lists for v in vectors]).astype(np.float32), starts
+
+
+def similarity_matrix(vector_lists1, vector_lists2) -> np.ndarray:
+    """``vectors_similarity`` for every pair of two lists, NaN where it would be ``None``."""
+    result = np.full((len(vector_lists1), len(vector_lists2)), np.nan)
+    rows = [i for i, vectors in enumerate(vector_lists1) if len(vectors)]
+    cols = [j for j, vectors in enumerate(vector_lists2) if len(vectors)]
+    if rows and cols:
+        matrix1, starts1 = _stack([vector_lists1[i] for i in rows])
+        matrix2, starts2 = _stack([vector_lists2[j] for j in cols])
+        result[np.ix_(rows, cols)] = _grouped_max(matrix1, starts1, matrix2, starts2)
+    return result
+
+
+class EmbeddingIndex:
+    """Ready DINOv2 vectors of one model version, kept in memory per process.
+
+    Every matching view used to decode ``np.frombuffer`` blobs from the
+    database (or walk ``item.photos`` → ``photo.embeddings``) before comparing
+    images pair by pair. The index holds all ready vectors as one normalized
+    float32 matrix, grouped by item: ``pairwise`` and ``nearest`` are a single
+    matrix product each.
+
+    ``refresh`` only reads rows changed since the last call (``updated_at``
+    watermark, bumped by every UPDATE of the row, status changes included). A
+    deleted row leaves no trace in that delta, so the ids of the version's rows
+    are compared with those already read: ids gone from the table are dropped,
+    ids never seen are read. That full id scan only runs when the row count or
+    the highest id disagree with the ids read after the delta (a deletion
+    followed by an insertion shows up as an extra id), or every
+    ``RESCAN_SECONDS`` as a backstop.
+    """
+
+    # Rows written by a transaction still open during the previous refresh can
+    # carry an older updated_at than the watermark: re-read a short overlap.
+    REFRESH_OVERLAP = timedelta(seconds=60)
+    RESCAN_SECONDS = 300
+
+    def __init__(self, model_version: str, clock=time.monotonic):
+        self.model_version = model_version
+        self._clock = clock
+        self._scanned_at = None
+        self._entries: dict[int, tuple[int, np.ndarray]] = {}   # embedding id → (item id, vector)
+        self._seen: set[int] = set()                            # ids of every row read, ready or not
+        self._watermark = None
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._item_ids = np.zeros(0, dtype=np.int64)
+        self._starts = np.zeros(0, dtype=np.intp)
+        self._groups: dict[int, tuple[int, int]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    # ── Mise à jour ──────────────────────────────────────────────────────────
+
+    def upsert(self, embedding_id: int, item_id: int | None, vector) -> None:
+        """Record one embedding row; ``vector=None`` (not ready, invalid) removes it."""
+        self._seen.add(embedding_id)
+        previous = self._entries.pop(embedding_id, None)
+        if vector is not None and item_id is not None and len(vector):
+            vector = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm:
+                self._entries[embedding_id] = (item_id, vector / norm if abs(norm - 1.0) > 1e-6 else vector)
+        self._dirty = self._dirty or previous is not None or embedding_id in self._entries
+
+    def forget(self, embedding_ids) -> None:
+        """Drop rows deleted from the database."""
+        for embedding_id in embedding_ids:
+            self._seen.discard(embedding_id)
+            if self._entries.pop(embedding_id, None) is not None:
+                self._dirty = True
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._seen.clear()
+        self._watermark = None
+        self._scanned_at = None
+        self._dirty = True
+
+    def refresh(self, connection) -> None:
+        """Apply rows changed, added or deleted since the last refresh.
+
+        Reads through its own ``connection``: the index only ever holds
+        committed rows, never those of a transaction that may still roll back.
+        """
+        import sqlalchemy as sa
+        from models import ItemPhoto, PhotoEmbedding
+
+        embeddings, photos = PhotoEmbedding.__table__, ItemPhoto.__table__
+        with self._lock:
+            query = sa.select(
+                embeddings.c.id, photos.c.item_id, embeddings.c.status, embeddings.c.embedding,
+                embeddings.c.embedding_dimension, embeddings.c.updated_at,
+            ).select_from(embeddings.outerjoin(photos, photos.c.id == embeddings.c.item_photo_id)).where(
+                embeddings.c.model_version == self.model_version)
+            delta = query
+            if self._watermark is not None:
+                delta = query.where(embeddings.c.updated_at >= self._watermark - self.REFRESH_OVERLAP)
+            self._apply(connection.execute(delta))
+
+            of_version = embeddings.c.model_version == self.model_version
+            count, max_id = connection.execute(
+                sa.select(sa.func.count(embeddings.c.id), sa.func.max(embeddings.c.id)).where(of_version)).one()
+            now = self._clock()
+            if (count == len(self._seen) and max_id == max(self._seen, default=None)
+                    and self._scanned_at is not None and now - self._scanned_at < self.RESCAN_SECONDS):
+                return
+            self._scanned_at = now
+            ids = set(connection.execute(sa.select(embeddings.c.id).where(of_version)).scalars())
+            # Des lignes ont été supprimées depuis la dernière lecture.
+            self.forget(self._seen - ids)
+            # Committed after the overlap window had passed them by.
+            missing = sorted(ids - self._seen)
+            for start in range(0, len(missing), 500):
+                self._apply(connection.execute(query.where(embeddings.c.id.in_(missing[start:start + 500]))))
+
+    def _apply(self, rows) -> None:
+        for embedding_id, item_id, status, embedding, dimension, updated_at in rows:
+            vector = None
+            if status == READY and embedding:
+                vector = np.frombuffer(embedding, dtype=np.float32)
+                if dimension != vector.size:
+                    vector = None
+            self.upsert(embedding_id, item_id, vector)
+            if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+    def _compile(self) -> None:
+        if not self._dirty:
+            return
+        by_item: dict[int, list[np.ndarray]] = {}
+        for embedding_id in sorted(self._entries):
+            item_id, vector = self._entries[embedding_id]
+            by_item.setdefault(item_id, []).append(vector)
+        item_ids = sorted(by_item)
+        if item_ids:
+            self._matrix, self._starts = _stack([by_item[i] for i in item_ids])
+        else:
+            self._matrix, self._starts = np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.intp)
+        self._item_ids = np.asarray(item_ids, dtype=np.int64)
+        stops = list(self._starts[1:]) + [len(self._matrix)]
+        self._groups = {item_id: (int(start), int(stop))
+                        for item_id, start, stop in zip(item_ids, self._starts, stops)}
+        self._dirty = False
+
+    # ── Lecture ──────────────────────────────────────────────────────────────
+
+    def vectors(self, item_id: int) -> list[np.ndarray]:
+        """Ready vectors of one item (read-only rows of the index matrix)."""
+        with self._lock:
+            self._compile()
+            start, stop = self._groups.get(item_id, (0, 0))
+            return list(self._matrix[start:stop])
+
+    def _block(self, item_ids):
+        present = [(n, self._groups[item_id]) for n, item_id in enumerate(item_ids) if item_id in self._groups]
+        if not present:
+            return [], None, None
+        rows = np.concatenate([np.arange(start, stop) for _, (start, stop) in present])
+        sizes = [stop - start for _, (start, stop) in present]
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        return [n for n, _ in present], self._matrix[rows], starts
+
+    def pairwise(self, ids1, ids2) -> np.ndarray:
+        """Best cosine similarity for every (ids1[i], ids2[j]), NaN when either has no vector."""
+        with self._lock:
+            self._compile()
+            result = np.full((len(ids1), len(ids2)), np.nan)
+            rows, matrix1, starts1 = self._block(ids1)
+            cols, matrix2, starts2 = self._block(ids2)
+            if rows and cols:
+                result[np.ix_(rows, cols)] = _grouped_max(matrix1, starts1, matrix2, starts2)
+            return result
+
+    def nearest(self, item_id: int, k: int = 10, among=None) -> list[tuple[int, float]]:
+        """The ``k`` items whose photos look most like ``item_id``'s, best first.
+
+        ``among`` restricts the answer to those item ids (e.g. the opposite status).
+        """
+        with self._lock:
+            self._compile()
+            if item_id not in self._groups or k <= 0:
+                return []
+            start, stop = self._groups[item_id]
+            sims = _grouped_max(self._matrix[start:stop], np.zeros(1, dtype=np.intp),
+                                self._matrix, self._starts)[0]
+            sims[np.searchsorted(self._item_ids, item_id)] = -np.inf
+            if among is not None:
+                sims[~np.isin(self._item_ids, np.fromiter(among, dtype=np.int64))] = -np.inf
+            order = np.argsort(-sims, kind='stable')[:k]
+            return [(int(self._item_ids[n]), float(sims[n])) for n in order if np.isfinite(sims[n])]
+
+
+_INDEXES: dict[str, EmbeddingIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def embedding_index() -> EmbeddingIndex:
+    """The process-wide index of the current model version, refreshed from the database.
+
+    Refreshed at most once per HTTP request: a matching page asks for the
+    index several times (features, visual neighbours, similarity badges). The
+    CLI and the photo worker refresh on every call.
+    """
+    from flask import g, has_request_context
+
+    version = current_model_version()
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(version)
+        if index is None:
+            index = _INDEXES[version] = EmbeddingIndex(version)
+    refreshed = g.setdefault('_embedding_indexes_refreshed', set()) if has_request_context() else set()
+    if version not in refreshed:
+        from app import db
+        with db.engine.connect() as connection:
+            index.refresh(connection)
+        refreshed.add(version)
+    return index
+
+
+def ready_vectors_by_item(item_ids, session=None) -> dict[int, list[np.ndarray]]:
+    """Ready vectors of many items, keyed by item id.
+
+    Same filter as ``_ready_vectors`` without walking ``item.photos`` and
+    ``photo.embeddings`` relationships. Read from the in-memory index by
+    default; with a ``session``, queried through it instead, so that a write
+    transaction sees the embeddings it has not committed yet.
+    """
+    ids = sorted({i for i in item_ids if i is not None})
+    if session is None:
+        index = embedding_index()
+        vectors_of = ((item_id, index.vectors(item_id)) for item_id in ids)
+        return {item_id: vectors for item_id, vectors in vectors_of if vectors}
+
+    from models import ItemPhoto, PhotoEmbedding
+    result: dict[int, list[np.ndarray]] = {}
+    version = current_model_version()
+    # Bounded IN lists: SQLite caps bound parameters per statement.
+    for start in range(0, len(ids), 500):
+        rows = session.query(
+            ItemPhoto.item_id, PhotoEmbedding.embedding, PhotoEmbedding.embedding_dimension,
+        ).join(PhotoEmbedding, PhotoEmbedding.item_photo_id == ItemPhoto.id).filter(
+            ItemPhoto.item_id.in_(ids[start:start + 500]),
+            PhotoEmbedding.model_version == version,
+            PhotoEmbedding.status == READY,
+        )
+        for item_id, embedding, dimension in rows:
+            if not embedding:
+                continue
+            vector = np.frombuffer(embedding, dtype=np.float32)
+            if dimension == vector.size and vector.size:
+                result.setdefault(item_id, []).append(vector)
+    return result
+
+
 def _ready_vectors(item):
     result = []
     version = current_model_version()
@@ -110,3 +492,172 @@ def _ready_vectors(item):
                 if embedding.embedding_dimension == vector.size and vector.size:
                     result.append(vector)
     return result
+
+
+# ── Optional pgvector column ─────────────────────────────────────────────────
+# migrations/optional/20260724_02_photo_embeddings_pgvector_optional.py adds an
+# ``embedding_vector`` column (ivfflat cosine index) next to the bytea source
+# of truth. When it exists, nearest-photo lookups run in PostgreSQL instead of
+# every gunicorn worker holding all vectors; otherwise ``EmbeddingIndex`` does
+# the same work in NumPy.
+
+_PGVECTOR_DIMENSIONS: dict[str, int | None] = {}
+
+
+def pgvector_available(connection) -> bool:
+    """True when the database has the vector extension and ``embedding_vector`` column."""
+    return pgvector_dimension(connection) is not None
+
+
+def pgvector_dimension(connection) -> int | None:
+    """Dimension of the ``embedding_vector`` column, None when pgvector is not set up.
+
+    Checked once per process and database URL; a failed check counts as absent.
+    Only vectors of that dimension are mirrored into the column or used as probes.
+    """
+    if connection.dialect.name != "postgresql":
+        return None
+    key = str(connection.engine.url)
+    if key not in _PGVECTOR_DIMENSIONS:
+        import sqlalchemy as sa
+        try:
+            # atttypmod holds the n of vector(n); -1 for a column without dimension.
+            found = connection.execute(sa.text(
+                "SELECT a.atttypmod FROM pg_extension e, pg_attribute a "
+                "WHERE e.extname = 'vector' AND a.attrelid = to_regclass('photo_embeddings') "
+                "AND a.attname = 'embedding_vector' AND NOT a.attisdropped")).scalar()
+            _PGVECTOR_DIMENSIONS[key] = found if found is not None and found > 0 else None
+        except Exception:
+            _LOGGER.exception("pgvector availability check failed; using NumPy")
+            _PGVECTOR_DIMENSIONS[key] = None
+    return _PGVECTOR_DIMENSIONS[key]
+
+
+def vector_literal(vector) -> str:
+    """pgvector text input (``'[0.1,0.2,...]'``) for one float32 vector."""
+    return "[" + ",".join(repr(float(x)) for x in np.asarray(vector, dtype=np.float32)) + "]"
+
+
+def sync_embedding_vector(session, record) -> None:
+    """Mirror a freshly computed bytea vector into ``embedding_vector`` when the column exists."""
+    dimension = pgvector_dimension(session.connection())
+    if dimension is None or record.embedding_dimension != dimension:
+        return
+    import sqlalchemy as sa
+    session.flush([record])
+    try:
+        # Savepoint: a failure must not abort the transaction holding the bytea.
+        with session.begin_nested():
+            session.execute(sa.text(
+                "UPDATE photo_embeddings SET embedding_vector = CAST(:vector AS vector) WHERE id = :id"),
+                {"id": record.id, "vector": vector_literal(np.frombuffer(record.embedding, dtype=np.float32))})
+    except Exception:
+        _LOGGER.exception("Could not mirror embedding %s into embedding_vector", record.id)
+
+
+def backfill_embedding_vectors(session, *, batch_size: int = 500, force: bool = False) -> int:
+    """Copy ready bytea vectors into ``embedding_vector``, one committed batch at a time.
+
+    Only rows of the current model version whose column is still empty, unless
+    ``force``. Returns the number of rows written; raises ``RuntimeError`` when
+    pgvector is not set up.
+    """
+    import sqlalchemy as sa
+
+    column_dimension = pgvector_dimension(session.connection())
+    if column_dimension is None:
+        raise RuntimeError("pgvector is not available (extension or embedding_vector column missing)")
+    condition = "" if force else " AND embedding_vector IS NULL"
+    last_id, written = 0, 0
+    while True:
+        rows = session.execute(sa.text(
+            "SELECT id, embedding, embedding_dimension FROM photo_embeddings "
+            "WHERE status = :ready AND model_version = :version AND embedding IS NOT NULL "
+            "AND id > :last_id" + condition + " ORDER BY id LIMIT :limit"),
+            {"ready": READY, "version": current_model_version(), "last_id": last_id,
+             "limit": batch_size}).all()
+        if not rows:
+            return written
+        params = []
+        for embedding_id, embedding, dimension in rows:
+            vector = np.frombuffer(embedding, dtype=np.float32)
+            if dimension == vector.size == column_dimension:
+                params.append({"id": embedding_id, "vector": vector_literal(vector)})
+        if params:
+            session.execute(sa.text(
+                "UPDATE photo_embeddings SET embedding_vector = CAST(:vector AS vector) WHERE id = :id"),
+                params)
+        session.commit()
+        written += len(params)
+        last_id = rows[-1][0]
+
+
+def best_per_item(rows, k: int) -> list[tuple[int, float]]:
+    """Keep each item's best photo similarity from (item_id, similarity) rows; top ``k``, best first."""
+    best: dict[int, float] = {}
+    for item_id, similarity in rows:
+        if similarity > best.get(item_id, -np.inf):
+            best[item_id] = similarity
+    return sorted(best.items(), key=lambda entry: (-entry[1], entry[0]))[:k]
+
+
+def nearest_items(item_id: int, k: int = 10, status=None) -> list[tuple[int, float]]:
+    """Items whose ready photos look most like ``item_id``'s: (item_id, cosine similarity), best first.
+
+    ``status`` (a ``models.Status``) keeps only items of that status, e.g. the
+    found items of a lost one: without it returned items, items pending
+    deletion and items of the same status would take neighbour slots.
+
+    Asks PostgreSQL (pgvector ``<=>`` cosine distance, ivfflat index) when the
+    optional column is set up, and falls back to the in-process
+    ``EmbeddingIndex`` otherwise or if the query fails.
+    """
+    from app import db
+
+    try:
+        dimension = pgvector_dimension(db.session.connection())
+        if dimension is not None:
+            return _pgvector_nearest(db.session, item_id, k, status, dimension)
+    except Exception:
+        _LOGGER.exception("pgvector nearest-photo query failed; using NumPy")
+    among = None
+    if status is not None:
+        from models import Item
+        among = {item for item, in db.session.query(Item.id).filter(Item.status == status)}
+    return embedding_index().nearest(item_id, k, among)
+
+
+def _pgvector_nearest(session, item_id: int, k: int, status, column_dimension: int) -> list[tuple[int, float]]:
+    import sqlalchemy as sa
+
+    version = current_model_version()
+    params = {"item_id": item_id, "version": version, "ready": READY}
+    of_status = ""
+    if status is not None:
+        # SQLAlchemy stores Enum(Status) columns by member name.
+        of_status = "AND CAST(i.status AS text) = :status "
+        params["status"] = status.name
+    rows = []
+    # Savepoint: on PostgreSQL a failed statement would abort the request's transaction.
+    with session.begin_nested():
+        probes = session.execute(sa.text(
+            "SELECT pe.embedding, pe.embedding_dimension FROM photo_embeddings pe "
+            "JOIN item_photos ip ON ip.id = pe.item_photo_id "
+            "WHERE ip.item_id = :item_id AND pe.model_version = :version "
+            "AND pe.status = :ready AND pe.embedding IS NOT NULL"), params).all()
+        for embedding, dimension in probes:
+            vector = np.frombuffer(embedding, dtype=np.float32)
+            if not dimension == vector.size == column_dimension:
+                continue
+            # Several photos per item: over-fetch so that k distinct items remain.
+            rows += session.execute(sa.text(
+                "SELECT ip.item_id, 1 - (pe.embedding_vector <=> CAST(:probe AS vector)) "
+                "FROM photo_embeddings pe JOIN item_photos ip ON ip.id = pe.item_photo_id "
+                "JOIN items i ON i.id = ip.item_id "
+                # Literal status: the planner must see the partial index predicate.
+                "WHERE pe.model_version = :version AND pe.status = 'ready' "
+                "AND pe.embedding_vector IS NOT NULL AND ip.item_id != :item_id "
+                + of_status +
+                "ORDER BY pe.embedding_vector <=> CAST(:probe AS vector) LIMIT :limit"),
+                dict(params, probe=vector_literal(vector), limit=4 * k)).all()
+    return best_per_item(((item, min(1.0, float(similarity))) for item, similarity in rows), k)
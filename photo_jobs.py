@@ -0,0 +1,216 @@
+"""File de travaux photo traitée hors requête par `flask photo-worker`.
+
+Le pHash était calculé pendant la requête d'upload, et les vecteurs DINOv2
+n'existaient que si quelqu'un pensait à lancer `flask index-photo-embeddings` :
+d'ici là le matching restait purement textuel. Désormais chaque ItemPhoto
+persistée reçoit une ligne photo_jobs, et un processus worker (seconde entrée
+du Procfile) :
+
+* réserve quelques travaux avec `FOR UPDATE SKIP LOCKED` — plusieurs workers
+  peuvent tourner sans se marcher dessus ; un travail réservé dont le worker
+  est mort est repris après LOCK_TIMEOUT ;
+* calcule le pHash et le vecteur DINOv2 (ensure_photo_embedding, qui note
+  lui-même READY ou FAILED sur PhotoEmbedding) ;
+* en cas d'échec, replanifie le travail avec un délai croissant, puis
+  l'abandonne (statut failed) après MAX_ATTEMPTS essais ;
+* quand la file est vide, reconstruit la table match_candidates si elle date
+  d'une autre version du moteur de matching (/matches calcule à la volée en
+  attendant).
+
+Chaque étape est idempotente : un travail rejoué ne refait que ce qui manque.
+
+Les variantes réduites (thumbnails.py) ne sont pas précalculées ici : elles
+sont produites à la première demande, côté web, puis gardées dans la table
+photo_variants.
+"""
+import logging
+import signal
+import time
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+
+_LOGGER = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+# Au-delà, un travail « running » est considéré comme orphelin (worker tué
+# pendant le calcul) et repris. Large devant un premier chargement de DINOv2.
+LOCK_TIMEOUT = timedelta(minutes=15)
+
+
+def backoff(attempts: int) -> timedelta:
+    """Délai avant l'essai suivant : 30 s, 1 min, 2 min… plafonné à une heure."""
+    return min(BACKOFF_BASE * (2 ** max(0, attempts - 1)), BACKOFF_MAX)
+
+
+def enqueue(session, photo) -> None:
+    """Met (ou remet) la photo en attente de traitement ; à appeler après son flush."""
+    from models import PhotoJob
+
+    job = session.query(PhotoJob).filter_by(item_photo_id=photo.id).first()
+    if job is None:
+        job = PhotoJob(item_photo_id=photo.id)
+        session.add(job)
+    job.status = PENDING
+    job.attempts = 0
+    job.run_after = datetime.now(timezone.utc)
+    job.locked_at = None
+    job.last_error = None
+
+
+def enqueue_missing(session) -> int:
+    """Crée les travaux des photos qui n'en ont pas (photos antérieures à la file)."""
+    from models import ItemPhoto, PhotoJob
+
+    missing = [photo_id for (photo_id,) in session.query(ItemPhoto.id).outerjoin(
+        PhotoJob, PhotoJob.item_photo_id == ItemPhoto.id).filter(PhotoJob.id.is_(None))]
+    for photo_id in missing:
+        session.add(PhotoJob(item_photo_id=photo_id))
+    session.commit()
+    return len(missing)
+
+
+def claimable(session, limit: int, now: datetime):
+    """Requête des travaux prêts (ou orphelins), verrouillés sans attendre ceux d'un autre worker."""
+    from models import PhotoJob
+
+    return (session.query(PhotoJob)
+            .filter(sa.or_(sa.and_(PhotoJob.status == PENDING, PhotoJob.run_after <= now),
+                           sa.and_(PhotoJob.status == RUNNING, PhotoJob.locked_at < now - LOCK_TIMEOUT)))
+            .order_by(PhotoJob.run_after, PhotoJob.id)
+            .with_for_update(skip_locked=True)
+            .limit(limit))
+
+
+def claim(session, limit: int, now: datetime | None = None) -> list[int]:
+    """Réserve jusqu'à `limit` travaux prêts et renvoie leurs ids."""
+    now = now or datetime.now(timezone.utc)
+    jobs = claimable(session, limit, now).all()
+    for job in jobs:
+        job.status = RUNNING
+        job.locked_at = now
+        job.attempts += 1
+    session.commit()
+    return [job.id for job in jobs]
+
+
+def process_photo(photo) -> str | None:
+    """pHash et vecteur DINOv2 d'une photo ; message d'erreur ou None.
+
+    L'échec DINOv2 est noté sur PhotoEmbedding par ensure_photo_embedding et
+    seulement remonté ici : le pHash déjà calculé est gardé, seul le vecteur
+    sera retenté.
+    """
+    from phash_index import perceptual_hash
+    from photo_embeddings import FAILED as EMBEDDING_FAILED, ensure_photo_embedding
+
+    data = bytes(photo.data or b'')
+    if not data:
+        return None
+    if not photo.perceptual_hash:
+        photo.perceptual_hash = perceptual_hash(data)
+    record = ensure_photo_embedding(photo)
+    if record is not None and record.status == EMBEDDING_FAILED:
+        return record.error_message or 'échec du calcul DINOv2'
+    return None
+
+
+def run_job(session, job_id: int, now: datetime | None = None) -> str:
+    """Exécute un travail réservé et enregistre son issue ; renvoie le nouveau statut."""
+    from sqlalchemy.orm import undefer
+    from models import ItemPhoto, PhotoJob
+
+    job = session.get(PhotoJob, job_id)
+    if job is None:  # photo supprimée entre-temps (ON DELETE CASCADE)
+        return DONE
+    photo = session.query(ItemPhoto).options(undefer(ItemPhoto.data)).filter_by(id=job.item_photo_id).first()
+    try:
+        error = process_photo(photo) if photo is not None else None
+    except Exception as exc:
+        session.rollback()
+        _LOGGER.exception("Travail photo %s en échec", job_id)
+        error = f'{type(exc).__name__}: {exc}'
+        job = session.get(PhotoJob, job_id)
+    now = now or datetime.now(timezone.utc)
+    job.locked_at = None
+    job.last_error = error[:500] if error else None
+    if error is None:
+        job.status = DONE
+    elif job.attempts >= MAX_ATTEMPTS:
+        job.status = FAILED
+    else:
+        job.status = PENDING
+        job.run_after = now + backoff(job.attempts)
+    session.commit()
+    return job.status
+
+
+def release(session, job_ids: list[int]) -> None:
+    """Rend des travaux réservés mais non commencés (arrêt du worker)."""
+    from models import PhotoJob
+
+    for job in session.query(PhotoJob).filter(PhotoJob.id.in_(job_ids), PhotoJob.status == RUNNING):
+        job.status = PENDING
+        job.attempts -= 1
+        job.locked_at = None
+    session.commit()
+
+
+def queue_depth(session) -> dict:
+    """Nombre de travaux par statut (pending, running, done, failed)."""
+    from models import PhotoJob
+
+    counts = dict.fromkeys((PENDING, RUNNING, DONE, FAILED), 0)
+    counts.update(session.query(PhotoJob.status, sa.func.count(PhotoJob.id)).group_by(PhotoJob.status).all())
+    return counts
+
+
+def rebuild_match_candidates(session) -> None:
+    """Reconstruit match_candidates après un changement de moteur ; un échec est journalisé."""
+    import match_candidates
+
+    try:
+        match_candidates.ensure_current(session)
+    except Exception:
+        session.rollback()
+        _LOGGER.exception("Reconstruction de match_candidates impossible")
+
+
+def run_worker(session, *, batch_size: int = 4, poll_interval: float = 5.0, once: bool = False) -> int:
+    """Boucle du worker ; s'arrête proprement sur SIGTERM/SIGINT. Renvoie le nombre de travaux traités."""
+    stopping = []
+
+    def _stop(signum, frame):
+        stopping.append(signum)
+
+    previous = {sig: signal.signal(sig, _stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+    processed = 0
+    try:
+        created = enqueue_missing(session)
+        if created:
+            _LOGGER.info("%s photo(s) existante(s) mise(s) en file", created)
+        while not stopping:
+            job_ids = claim(session, batch_size)
+            for index, job_id in enumerate(job_ids):
+                if stopping:
+                    release(session, job_ids[index:])
+                    break
+                run_job(session, job_id)
+                processed += 1
+            if not job_ids:
+                rebuild_match_candidates(session)
+            if once and not job_ids:
+                break
+            if not job_ids:
+                time.sleep(poll_interval)
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+    return processed
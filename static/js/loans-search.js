@@ -1,8 +1,15 @@
 // Live search for headphone loans (prêts de casques)
+// Une saisie non vide interroge /loans/search (JSON, colonnes utiles au
+// comptoir des retours seulement) et reconstruit les lignes du tableau ; une
+// saisie vidée recharge le bloc HTML d'origine, pagination comprise.
 document.addEventListener('DOMContentLoaded', function() {
     const searchInput = document.querySelector('input[name="q"][placeholder*="nom"], input[name="q"][placeholder*="Filtrer"]');
     if (!searchInput) return;
+    const searchUrl = searchInput.dataset.searchUrl;
+    const csrfMeta = document.querySelector('meta[name="csrf-token"]');
     let lastValue = searchInput.value;
+    // Une réponse lente ne doit jamais écraser celle d'une saisie plus récente.
+    let requestSeq = 0;
 
     let timeout = null;
     searchInput.addEventListener('input', function() {
@@ -11,17 +18,23 @@ document.addEventListener('DOMContentLoaded', function() {
         lastValue = value;
         if (timeout) clearTimeout(timeout);
         timeout = setTimeout(() => {
-            fetchLoans(value);
-        }, 200);
+            if (searchUrl && value.trim()) {
+                searchLoans(value);
+            } else {
+                fetchLoans(value);
+            }
+        }, 150);
     });
 
     function fetchLoans(query) {
+        const seq = ++requestSeq;
         const url = new URL(window.location.href);
         url.searchParams.set('q', query);
         url.searchParams.delete('page');
         fetch(url)
             .then(resp => resp.text())
             .then(html => {
+                if (seq !== requestSeq) return;
                 const parser = new DOMParser();
                 const doc = parser.parseFromString(html, 'text/html');
                 const newResults = doc.querySelector('#loans-results');
@@ -35,4 +48,99 @@ document.addEventListener('DOMContentLoaded', function() {
                 // plutôt que de planter silencieusement (promesse rejetée non gérée).
             });
     }
+
+    function searchLoans(query) {
+        const seq = ++requestSeq;
+        const url = new URL(searchUrl, window.location.href);
+        url.searchParams.set('q', query);
+        fetch(url, {headers: {'Accept': 'application/json'}})
+            .then(resp => {
+                if (!resp.ok) throw new Error(resp.status);
+                return resp.json();
+            })
+            .then(data => {
+                if (seq !== requestSeq) return;
+                renderResults(data.results || [], !!data.truncated);
+            })
+            .catch(() => {
+                // Même règle que ci-dessus : les résultats précédents restent affichés.
+            });
+    }
+
+    function cell(text) {
+        const td = document.createElement('td');
+        td.textContent = text == null ? '' : text;
+        return td;
+    }
+
+    function postForm(action, confirmText, label, btnClass) {
+        const form = document.createElement('form');
+        form.method = 'post';
+        form.action = action;
+        form.className = 'd-inline';
+        form.dataset.confirm = confirmText;
+        const token = document.createElement('input');
+        token.type = 'hidden';
+        token.name = 'csrf_token';
+        token.value = csrfMeta ? csrfMeta.content : '';
+        const button = document.createElement('button');
+        button.type = 'submit';
+        button.className = btnClass;
+        button.textContent = label;
+        form.append(token, button);
+        return form;
+    }
+
+    function renderRow(loan) {
+        const tr = document.createElement('tr');
+        const deposit = cell(loan.deposit_type);
+        deposit.append(document.createElement('br'), document.createTextNode(loan.deposit_details));
+        tr.append(cell(loan.last_name), cell(loan.first_name), cell(loan.phone), cell(loan.quantity),
+                  deposit, cell(loan.deposit_amount), cell(loan.loan_date), cell(loan.return_date));
+
+        const signature = document.createElement('td');
+        if (!loan.return_date) {
+            const plural = loan.quantity > 1 ? 's' : '';
+            signature.append(postForm(loan.return_url,
+                `Confirmer le retour de ${loan.quantity} casque${plural} prêté${plural} à ${loan.first_name} ${loan.last_name} ?`,
+                'Retourner', 'btn btn-success btn-sm'));
+        } else if (loan.signature_url) {
+            const link = document.createElement('a');
+            link.href = loan.signature_url;
+            link.target = '_blank';
+            link.rel = 'noopener';
+            link.className = 'btn btn-link';
+            link.textContent = 'Voir';
+            signature.append(link);
+        }
+        tr.append(signature);
+
+        const action = document.createElement('td');
+        if (loan.status === 'PENDING_DELETION') {
+            action.innerHTML = '<span class="badge bg-warning text-dark">En attente suppression</span>';
+        } else if (!loan.return_date) {
+            action.append(postForm(loan.deletion_url, 'Demander la suppression de ce prêt ?',
+                                   'Demander suppression', 'btn btn-outline-danger btn-sm ms-2'));
+        } else {
+            action.innerHTML = '<span class="badge bg-success">Retourné</span>';
+        }
+        tr.append(action);
+        return tr;
+    }
+
+    function renderResults(results, truncated) {
+        const container = document.querySelector('#loans-results');
+        if (!container) return;
+        const tbody = container.querySelector('tbody');
+        if (!tbody) return;
+        tbody.replaceChildren(...results.map(renderRow));
+        // La pagination décrit la liste complète, pas ces résultats.
+        container.querySelectorAll('nav, .js-search-note').forEach(el => el.remove());
+        const note = document.createElement('p');
+        note.className = 'text-center text-muted small mt-1 js-search-note';
+        note.textContent = results.length === 0 ? 'Aucun prêt trouvé.'
+            : truncated ? `${results.length} premiers résultats — précisez la recherche.`
+            : `${results.length} prêt(s) trouvé(s).`;
+        container.append(note);
+    }
 });
@@ -0,0 +1,43 @@
+"""Fixtures partagées : models.py importé sans l'application réelle.
+
+`app` est remplacé par un module minimal qui ne porte qu'un SQLAlchemy() non
+lié ; models.py s'y branche à l'import. Les modules qui font `from app import
+db` au chargement (match_features, match_candidates) sont retirés en même
+temps : importés pendant le test, ils voient eux aussi le faux `app`.
+"""
+import importlib
+import sys
+import types
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+FAKE_APP_MODULES = ('app', 'models', 'match_features', 'match_candidates')
+
+
+@pytest.fixture(scope='module')
+def models():
+    faux = types.ModuleType('app')
+    faux.db = SQLAlchemy()
+    anciens = {name: sys.modules.pop(name, None) for name in FAKE_APP_MODULES}
+    sys.modules['app'] = faux
+    try:
+        yield importlib.import_module('models')
+    finally:
+        for name, module in anciens.items():
+            sys.modules.pop(name, None)
+            if module is not None:
+                sys.modules[name] = module
+
+
+@pytest.fixture
+def session(models):
+    """Session Flask-SQLAlchemy sur une base SQLite en mémoire, tables créées."""
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    models.db.init_app(flask_app)
+    with flask_app.app_context():
+        models.db.create_all()
+        yield models.db.session
+        models.db.session.remove()
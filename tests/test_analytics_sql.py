@@ -0,0 +1,98 @@
+"""Parité entre analytics_sql.py (agrégats en base) et analytics.py (référence).
+
+Les agrégats sont exécutés pour de vrai sur une base SQLite en mémoire ; le
+regroupement horaire PostgreSQL est seulement compilé.
+"""
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from analytics import CAUTION_CARTE_IDENTITE, CAUTION_ESPECES, affluence_prets, agreger_prets
+from analytics_sql import (affluence_depuis_creneaux, analytique_prets, creneaux_depuis_lignes,
+                           requetes_creneaux)
+
+metadata = sa.MetaData()
+prets = sa.Table(
+    'headphone_loans', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('quantity', sa.Integer),
+    sa.Column('deposit_type', sa.String(20)),
+    sa.Column('deposit_amount', sa.Numeric(10, 2)),
+    sa.Column('loan_date', sa.DateTime),
+    sa.Column('return_date', sa.DateTime),
+    sa.Column('status', sa.String(20)),
+)
+
+DEPART = datetime(2026, 7, 31, 9, 0)
+
+
+def _corpus():
+    """Prêts sur trois journées, dont des retours après minuit (UTC) et un prêt supprimé."""
+    lignes = []
+    for i in range(60):
+        pris = DEPART + timedelta(minutes=47 * i)
+        lignes.append(dict(
+            quantity=(i % 4) or None,
+            deposit_type=CAUTION_ESPECES if i % 3 == 0 else CAUTION_CARTE_IDENTITE,
+            deposit_amount=Decimal('20.00') if i % 3 == 0 else None,
+            loan_date=pris,
+            return_date=pris + timedelta(minutes=35 + 13 * i) if i % 5 else None,
+            status='deleted' if i == 7 else 'active',
+        ))
+    return lignes
+
+
+@pytest.fixture
+def session():
+    engine = sa.create_engine('sqlite://')
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(prets.insert(), _corpus())
+    with Session(engine) as session:
+        yield session
+
+
+def _reference(lignes):
+    resume = agreger_prets(lignes)
+    resume['affluence'] = affluence_prets(lignes)
+    return resume
+
+
+def test_agregats_en_base_identiques_a_la_reference(session):
+    retenues = [SimpleNamespace(**l) for l in _corpus() if l['status'] != 'deleted']
+    calcule = analytique_prets(session, prets.c, prets.c.status != 'deleted',
+                               especes=CAUTION_ESPECES, carte_identite=CAUTION_CARTE_IDENTITE)
+    assert calcule == _reference(retenues)
+    assert calcule['prets_total'] == 59
+
+
+def test_corpus_vide(session):
+    calcule = analytique_prets(session, prets.c, prets.c.status == 'aucun',
+                               especes=CAUTION_ESPECES, carte_identite=CAUTION_CARTE_IDENTITE)
+    assert calcule == _reference([])
+
+
+def test_creneaux_identiques_a_la_reference_autour_du_changement_d_heure():
+    """Nuit du 25 octobre : 00 h 30 et 01 h 30 UTC tombent tous deux à 02 h 30 locale."""
+    lignes = [SimpleNamespace(quantity=2, loan_date=datetime(2026, 10, 25, h, 30),
+                              return_date=datetime(2026, 10, 25, h + 3, 0))
+              for h in range(0, 4)]
+    assert affluence_depuis_creneaux(creneaux_depuis_lignes(lignes)) == affluence_prets(lignes)
+
+
+def test_regroupement_postgresql_en_heure_locale():
+    requete_prets, requete_retours = requetes_creneaux(prets.c, prets.c.status != 'deleted')
+    compilee = requete_prets.compile(dialect=postgresql.dialect())
+    sql = ' '.join(str(compilee).split())
+    assert sql.count('date_trunc(') == 1 and sql.endswith('GROUP BY heure')
+    # La date naïve est d'abord située en UTC, puis convertie vers le fuseau.
+    assert re.search(r'timezone\(%\(timezone_1\)s\S*, timezone\(%\(timezone_2\)s\S*, '
+                     r'headphone_loans\.loan_date\)\)', sql)
+    assert compilee.params['timezone_1'] == 'Europe/Brussels' and compilee.params['timezone_2'] == 'UTC'
+    assert 'headphone_loans.return_date' in str(requete_retours.compile(dialect=postgresql.dialect()))
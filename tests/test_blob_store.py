@@ -0,0 +1,57 @@
+"""Tests purs pour blob_store.py — cache disque, aucune base de données requise."""
+import hashlib
+import os
+
+import blob_store
+
+
+def test_blob_key_is_content_sha256():
+    assert blob_store.blob_key(b'abc') == hashlib.sha256(b'abc').hexdigest()
+
+
+def test_disk_cache_put_then_get(tmp_path):
+    cache = blob_store.DiskCache(str(tmp_path), max_bytes=1000)
+    key = blob_store.blob_key(b'image')
+    assert cache.get(key) is None
+    path = cache.put(key, b'image')
+    assert path == os.path.join(str(tmp_path), key[:2], key)
+    assert cache.get(key) == path
+    with open(path, 'rb') as handle:
+        assert handle.read() == b'image'
+
+
+def test_disk_cache_evicts_least_recently_read(tmp_path):
+    cache = blob_store.DiskCache(str(tmp_path), max_bytes=250)
+    first, second, third = (blob_store.blob_key(bytes([i])) for i in range(3))
+    os.utime(cache.put(first, b'x' * 100), (1000, 1000))
+    os.utime(cache.put(second, b'x' * 100), (2000, 2000))
+    # La première entrée est relue : c'est la seconde qui doit partir.
+    cache.get(first)
+    cache.put(third, b'x' * 100)
+    assert cache.get(second) is None
+    assert cache.get(first) is not None and cache.get(third) is not None
+
+
+def test_disk_cache_keeps_entry_just_written(tmp_path):
+    cache = blob_store.DiskCache(str(tmp_path), max_bytes=50)
+    key = blob_store.blob_key(b'big')
+    cache.put(key, b'y' * 100)
+    assert cache.get(key) is not None
+
+
+def test_disk_cache_scans_only_past_ceiling_or_when_stale(tmp_path, monkeypatch):
+    now = [0.0]
+    cache = blob_store.DiskCache(str(tmp_path), max_bytes=250, clock=lambda: now[0])
+    scans = []
+    real_evict = cache.evict
+    monkeypatch.setattr(cache, 'evict', lambda keep=None: scans.append(keep) or real_evict(keep))
+    keys = [blob_store.blob_key(bytes([i])) for i in range(4)]
+    cache.put(keys[0], b'x' * 100)   # total inconnu : premier balayage
+    cache.put(keys[1], b'x' * 100)   # 200 ≤ 250 : aucun balayage
+    assert scans == [keys[0]]
+    cache.put(keys[2], b'x' * 100)   # 300 > 250 : balayage et éviction
+    assert scans == [keys[0], keys[2]]
+    assert sum(cache.get(k) is not None for k in keys[:3]) == 2
+    now[0] += blob_store.RESCAN_SECONDS
+    cache.put(keys[3], b'x' * 10)    # estimation trop ancienne : rebalayage
+    assert scans[-1] == keys[3]
@@ -0,0 +1,87 @@
+"""Tests purs pour calibration.py — aucune base de données requise."""
+import io
+import json
+import math
+
+import numpy as np
+
+import calibration
+import matching
+
+
+def _naive_sweep(scores, validated, rejected, thresholds):
+    """Balayage d'origine : un ensemble de paires retenues par seuil."""
+    rows = []
+    for seuil in thresholds:
+        retenues = {pair for pair, score in scores.items() if score >= seuil}
+        vp = len(retenues & validated)
+        fp = len(retenues & rejected)
+        rows.append((seuil, len(retenues), vp, fp))
+    return rows
+
+
+def test_threshold_sweep_matches_set_based_sweep():
+    rng = np.random.default_rng(3)
+    matrix = np.round(rng.uniform(0, 100, size=(30, 40)), 1)
+    matrix[0, :5] = 70.0  # ex aequo pile sur un seuil balayé
+    validated = rng.random(matrix.shape) < 0.05
+    rejected = (rng.random(matrix.shape) < 0.05) & ~validated
+
+    thresholds = range(50, 99, 5)
+    rows = calibration.threshold_sweep(matrix, validated, rejected, thresholds)
+
+    scores = {(i, j): matrix[i, j] for i in range(30) for j in range(40)}
+    expected = _naive_sweep(scores, set(zip(*np.nonzero(validated))),
+                            set(zip(*np.nonzero(rejected))), thresholds)
+    assert [(r['seuil'], r['proposees'], r['vrais_positifs'], r['faux_positifs']) for r in rows] == expected
+    total = int(validated.sum())
+    assert rows[0]['rappel'] == 100.0 * rows[0]['vrais_positifs'] / total
+
+
+def test_threshold_sweep_without_judged_pairs_gives_nan():
+    rows = calibration.threshold_sweep(np.array([[10.0, 90.0]]), np.zeros((1, 2), bool),
+                                       np.zeros((1, 2), bool), [50])
+    assert rows[0]['proposees'] == 1
+    assert math.isnan(rows[0]['rappel']) and math.isnan(rows[0]['precision'])
+
+
+def test_shard_bounds_cover_every_row_once():
+    for count, shards in [(1, 4), (7, 3), (100, 16), (5, 10)]:
+        bounds = calibration._shard_bounds(count, shards)
+        rows = [i for start, stop in bounds for i in range(start, stop)]
+        assert rows == list(range(count))
+
+
+def test_score_all_in_processes_matches_single_process():
+    def features(title, comments=''):
+        item = type('FakeItem', (), {
+            'title': title, 'comments': comments, 'location': '', 'found_location': '',
+            'item_color': '', 'item_brand': '', 'item_distinctive': '',
+        })()
+        return matching.extract_features(item, family=None)
+
+    lost = [features(t) for t in ("Telephone Samsung noir", "Sac a dos Eastpak", "Cles de voiture",
+                                  "Portefeuille cuir marron", "Gourde bleue")]
+    found = [features(t) for t in ("Portable samsung", "Sac eastpak noir", "Trousseau de cles")]
+    single = calibration.score_all(lost, found, workers=1)
+    assert np.array_equal(calibration.score_all(lost, found, workers=2), single)
+
+
+def test_sample_items_keeps_judged_items():
+    items = [type('FakeItem', (), {'id': i})() for i in range(100)]
+    sample = calibration.sample_items(items, 10, {3, 97}, np.random.default_rng(0))
+    ids = [item.id for item in sample]
+    assert len(ids) == 10 and len(set(ids)) == 10
+    assert {3, 97} <= set(ids)
+    assert calibration.sample_items(items[:5], 10, set(), np.random.default_rng(0)) == items[:5]
+
+
+def test_write_sweep_csv_and_json():
+    rows = [{'seuil': 50, 'proposees': 3, 'rappel': 100.0, 'precision': float('nan')}]
+    out = io.StringIO()
+    calibration.write_sweep(rows, 'json', out)
+    assert json.loads(out.getvalue()) == [{'seuil': 50, 'proposees': 3, 'rappel': 100.0, 'precision': None}]
+
+    out = io.StringIO()
+    calibration.write_sweep(rows, 'csv', out)
+    assert out.getvalue().splitlines() == ['seuil,proposees,rappel,precision', '50,3,100.0,']
@@ -0,0 +1,96 @@
+"""Tests purs pour counters.py — cache des pastilles et règles d'invalidation."""
+import pytest
+
+from counters import ADMIN, UNREAD, CounterCache, LocalBackend, touched
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def cache(clock):
+    return CounterCache(LocalBackend(clock), ttl=30)
+
+
+def counting(value):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return value
+    return compute, calls
+
+
+def test_value_is_computed_once_until_it_expires(cache, clock):
+    compute, calls = counting({'deletions_total': 3})
+    assert cache.get_or_compute(ADMIN, 'badges', compute) == {'deletions_total': 3}
+    assert cache.get_or_compute(ADMIN, 'badges', compute) == {'deletions_total': 3}
+    assert len(calls) == 1
+    clock.now = 31
+    cache.get_or_compute(ADMIN, 'badges', compute)
+    assert len(calls) == 2
+
+
+def test_group_invalidation_forgets_every_key(cache):
+    compute, calls = counting(2)
+    for user_id in (1, 2):
+        cache.get_or_compute(UNREAD, user_id, compute)
+    cache.invalidate(UNREAD)
+    for user_id in (1, 2):
+        cache.get_or_compute(UNREAD, user_id, compute)
+    assert len(calls) == 4
+
+
+def test_key_invalidation_spares_the_other_keys(cache):
+    compute, calls = counting(5)
+    for user_id in (1, 2):
+        cache.get_or_compute(UNREAD, user_id, compute)
+    cache.invalidate(UNREAD, 1)
+    for user_id in (1, 2):
+        cache.get_or_compute(UNREAD, user_id, compute)
+    assert len(calls) == 3
+
+
+def test_a_count_finished_after_invalidation_is_not_served(cache):
+    """Le calcul a lu l'ancien état : il ne doit pas survivre à l'invalidation."""
+    def slow_compute():
+        cache.invalidate(ADMIN)  # une écriture committée pendant le comptage
+        return 'ancien'
+    assert cache.get_or_compute(ADMIN, 'badges', slow_compute) == 'ancien'
+    assert cache.get_or_compute(ADMIN, 'badges', lambda: 'nouveau') == 'nouveau'
+
+
+def test_unavailable_backend_falls_back_to_counting():
+    class Down:
+        def __getattr__(self, name):
+            def fail(*args, **kwargs):
+                raise ConnectionError('redis')
+            return fail
+    cache = CounterCache(Down(), ttl=30)
+    assert cache.get_or_compute(ADMIN, 'badges', lambda: 7) == 7
+    cache.invalidate(ADMIN)  # ne lève pas
+
+
+def test_only_counted_columns_invalidate():
+    assert touched('items', {'status'}, {}) == (ADMIN, None)
+    assert touched('items', {'title', 'comments'}, {}) is None
+    assert touched('items', None, {}) == (ADMIN, None), 'création ou suppression'
+    assert touched('sales', None, {}) == (ADMIN, None)
+    assert touched('sales', {'payment_method'}, {}) is None
+    assert touched('messages', None, {}) == (UNREAD, None)
+    assert touched('categories', None, {}) is None
+
+
+def test_reading_a_conversation_only_invalidates_the_reader():
+    assert touched('conversation_participants', {'last_read_at'}, {'user_id': 4}) == (UNREAD, 4)
+    assert touched('conversation_participants', {'role'}, {'user_id': 4}) is None
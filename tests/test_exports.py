@@ -0,0 +1,67 @@
+"""Tests purs pour exports.py — archive ZIP en flux et manifestes, sans base."""
+import csv
+import io
+import json
+import zipfile
+from datetime import datetime
+from types import SimpleNamespace
+
+import exports
+
+
+def _item(**overrides):
+    values = dict(
+        id=7, status=SimpleNamespace(value='found'), category=SimpleNamespace(name='Clés'), title='Trousseau',
+        comments=None, item_color='rouge', item_brand=None, item_distinctive=None,
+        location=None, found_location='Scène B', storage_location='Tente accueil',
+        date_reported=datetime(2026, 7, 14, 22, 5), reporter_name='Camille',
+        reporter_email='camille@example.org', reporter_phone=None, claimant_name=None,
+        claimant_email=None, claimant_phone=None, return_date=None, return_comment=None,
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def test_stream_zip_round_trip_and_streams_in_chunks(monkeypatch):
+    monkeypatch.setattr(exports, 'CHUNK_SIZE', 1024)
+    photo = bytes(range(256)) * 40
+    consumed = []
+
+    def lazy_chunks():
+        consumed.append('manifest')
+        yield 'a,b\n'
+        yield 'é,ü\n'
+
+    entries = iter([('photos/7/a.jpg', (photo,), False), ('manifest.csv', lazy_chunks(), True)])
+    stream = exports.stream_zip(entries)
+    first = next(stream)
+    assert consumed == []  # l'entrée suivante n'est pas lue d'avance
+    chunks = [first, *stream]
+    assert len(chunks) > 3
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        assert archive.namelist() == ['photos/7/a.jpg', 'manifest.csv']
+        assert archive.getinfo('photos/7/a.jpg').compress_type == zipfile.ZIP_STORED
+        assert archive.read('photos/7/a.jpg') == photo
+        assert archive.read('manifest.csv').decode('utf-8') == 'a,b\né,ü\n'
+        assert archive.testzip() is None
+
+
+def test_manifests_list_photos_and_keep_accents():
+    rows = [exports.manifest_row(_item(), ['photos/7/a.jpg', 'photos/7/b.jpg']),
+            exports.manifest_row(_item(id=8, category=None, title='Écharpe'), [])]
+    text = ''.join(exports.csv_chunks(iter(rows)))
+    assert text.startswith('\ufeff')
+    parsed = list(csv.DictReader(io.StringIO(text.lstrip('\ufeff'))))
+    assert [row['id'] for row in parsed] == ['7', '8']
+    assert parsed[0]['photos'] == 'photos/7/a.jpg|photos/7/b.jpg'
+    assert parsed[0]['date_signalement'] == '2026-07-14T22:05'
+    assert parsed[1]['categorie'] == '' and parsed[1]['titre'] == 'Écharpe'
+
+    loaded = json.loads(''.join(exports.json_chunks(iter(rows))))
+    assert loaded[0]['photos'] == ['photos/7/a.jpg', 'photos/7/b.jpg']
+    assert loaded[0]['statut'] == 'found'
+    assert json.loads(''.join(exports.json_chunks(iter([])))) == []
+
+
+def test_photo_path_drops_directories():
+    assert exports.photo_path(3, '../../etc/passwd') == 'photos/3/passwd'
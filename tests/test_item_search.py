@@ -0,0 +1,22 @@
+"""Tests purs pour item_search.py — découpage et élargissement de la saisie."""
+from item_search import search_terms, tsquery_text
+
+
+def test_terms_fold_accents_and_drop_stopwords():
+    assert search_terms('Le TÉLÉPHONE de ma sœur')[0][0] == 'telephone'
+    assert [variants[0] for variants in search_terms('Le TÉLÉPHONE de ma sœur')] == ['telephone', 'soeur']
+    assert search_terms('  ') == []
+
+
+def test_synonyms_expand_both_ways():
+    (portable, noir) = search_terms('portable noir')
+    assert portable[0] == 'portable'
+    assert {'telephone', 'smartphone', 'gsm'} <= set(portable)
+    assert noir == ['noir']
+    # Le principal ramène ses synonymes d'un seul mot, pas les expressions.
+    telephone = search_terms('telephone')[0]
+    assert 'portable' in telephone and all(' ' not in word for word in telephone)
+
+
+def test_tsquery_text_ands_terms_and_ors_variants():
+    assert tsquery_text([['sac', 'sacoche'], ['noir']]) == '(sac:* | sacoche:*) & (noir:*)'
@@ -0,0 +1,63 @@
+"""Tests purs pour keyset_pagination.py — curseurs et bornes de page, sans base."""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from keyset_pagination import decode_cursor, encode_cursor, page_bounds
+
+T0 = datetime(2026, 7, 14, 20, 0)
+# Liste complète dans l'ordre d'affichage (date puis id décroissants), avec
+# deux objets signalés à la même seconde.
+ROWS = [SimpleNamespace(id=i, date_reported=T0 + timedelta(minutes=i // 2)) for i in range(10, 0, -1)]
+
+
+def key(row):
+    return row.date_reported, row.id
+
+
+def test_cursor_round_trip_and_garbage():
+    assert decode_cursor(encode_cursor(T0, 42)) == (T0, 42)
+    assert decode_cursor(None) is None
+    assert decode_cursor('pas-un-curseur') is None
+    assert decode_cursor('!!!') is None
+
+
+def _after(cursor):
+    date, item_id = decode_cursor(cursor)
+    return [r for r in ROWS if (r.date_reported, r.id) < (date, item_id)]
+
+
+def _before(cursor):
+    date, item_id = decode_cursor(cursor)
+    return [r for r in reversed(ROWS) if (r.date_reported, r.id) > (date, item_id)]
+
+
+def test_walk_forward_then_back_covers_every_row_once():
+    per_page = 4
+    rows, next_cursor, prev_cursor = page_bounds(ROWS[:per_page + 1], per_page, backwards=False,
+                                                 has_cursor=False, key=key)
+    pages = [[r.id for r in rows]]
+    assert prev_cursor is None
+    while next_cursor:
+        rows, next_cursor, prev_cursor = page_bounds(_after(next_cursor)[:per_page + 1], per_page,
+                                                     backwards=False, has_cursor=True, key=key)
+        pages.append([r.id for r in rows])
+    assert pages == [[10, 9, 8, 7], [6, 5, 4, 3], [2, 1]]
+
+    back, next_cursor, prev_cursor = page_bounds(_before(prev_cursor)[:per_page + 1], per_page,
+                                                 backwards=True, has_cursor=True, key=key)
+    assert [r.id for r in back] == [6, 5, 4, 3]
+    assert next_cursor is not None and prev_cursor is not None
+    first, _, prev_cursor = page_bounds(_before(prev_cursor)[:per_page + 1], per_page,
+                                        backwards=True, has_cursor=True, key=key)
+    assert [r.id for r in first] == [10, 9, 8, 7]
+    assert prev_cursor is None
+
+
+def test_empty_page_has_no_neighbours():
+    assert page_bounds([], 12, backwards=False, has_cursor=True, key=key) == ([], None, None)
+
+
+def test_ranked_cursor_round_trip():
+    from decimal import Decimal
+
+    assert decode_cursor(encode_cursor(Decimal('0.060793'), T0, 5)) == (Decimal('0.060793'), T0, 5)
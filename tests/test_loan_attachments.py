@@ -0,0 +1,20 @@
+"""Tests purs pour loan_attachments.py — décodage des data URL héritées."""
+from loan_attachments import ADMIN_ONLY_KINDS, ID_CARD, KINDS, SIGNATURE, data_url, decode_data_url
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(40))
+
+
+def test_data_url_round_trip():
+    assert decode_data_url(data_url('image/png', PNG)) == ('image/png', PNG)
+    assert decode_data_url('data:IMAGE/JPEG;base64,YWJj\n') == ('image/jpeg', b'abc')
+
+
+def test_unreadable_values_are_rejected():
+    for value in (None, '', 'garbage', 'data:image/png,abc', 'data:image/png;base64,!!!',
+                  'data:image/png;base64,', b'data:image/png;base64,YWJj'):
+        assert decode_data_url(value) is None
+
+
+def test_only_the_id_card_is_restricted():
+    assert set(KINDS) == {SIGNATURE, ID_CARD}
+    assert ADMIN_ONLY_KINDS == {ID_CARD}
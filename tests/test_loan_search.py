@@ -0,0 +1,21 @@
+"""Tests purs pour loan_search.py — normalisation des noms et motif de recherche."""
+from loan_search import like_pattern, normalize_name, search_key
+
+
+def test_normalize_folds_accents_case_and_punctuation():
+    assert normalize_name("  Léa-Marie  O'Brien ") == 'lea marie o brien'
+    assert normalize_name(None) == ''
+
+
+def test_search_key_matches_both_orders_and_partial_input():
+    key = search_key('Jérôme', 'Dupont')
+    assert key == 'jerome dupont | dupont jerome'
+    for typed in ('Dupont J', 'jérôme dup', 'DUPONT', 'ome dupo'):
+        pattern = like_pattern(typed)
+        assert pattern.strip('%') in key
+
+
+def test_like_pattern_ignores_empty_and_never_contains_wildcards():
+    assert like_pattern('   ') is None
+    assert like_pattern('--') is None
+    assert like_pattern('50%_off') == '%50 off%'
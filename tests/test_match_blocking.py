@@ -0,0 +1,85 @@
+"""Tests purs pour match_blocking.py — aucune base de données requise."""
+import numpy as np
+
+import matching
+import match_blocking
+
+
+def _features(title='', comments='', family=None, item_color='', item_brand=''):
+    item = type('FakeItem', (), {
+        'title': title, 'comments': comments, 'location': '', 'found_location': '',
+        'item_color': item_color, 'item_brand': item_brand, 'item_distinctive': '',
+    })()
+    return matching.extract_features(item, family=family)
+
+
+def test_blocking_keys_cover_tokens_colors_brands_and_family():
+    keys = match_blocking.blocking_keys(_features(
+        "Sac a dos Eastpak", family="Accessoires", item_color="noir,inconnu", item_brand="Eastpak"))
+    assert 'f:Accessoires' in keys
+    assert 'c:noir' in keys and 'c:inconnu' not in keys
+    assert 'b:eastpak' in keys
+    assert any(key.startswith('t:') for key in keys)
+
+
+def test_pairs_without_shared_key_are_not_candidates():
+    lost = {1: _features("Telephone Samsung noir", family="Objets personnels")}
+    found = {
+        10: _features("Portable samsung", family="Objets personnels"),
+        11: _features("Gourde metal bleue camping", family="Festival & camping"),
+    }
+    pairs = match_blocking.candidate_pairs(lost, found)
+    assert (1, 10) in pairs
+    assert (1, 11) not in pairs
+
+
+def test_items_with_few_keys_are_compared_to_everything():
+    lost = {1: _features("Casque")}
+    found = {
+        10: _features("Gourde metal bleue camping", family="Festival & camping"),
+        11: _features("Veste rouge Quechua", family="Vêtements"),
+    }
+    assert match_blocking.candidate_pairs(lost, found) == {(1, 10), (1, 11)}
+    # Et dans l'autre sens : un trouvé pauvre en clés reste candidat pour tous.
+    index = match_blocking.BlockIndex({20: _features("Casque")})
+    assert index.candidates(_features("Gourde metal bleue camping", family="Festival & camping")) == {20}
+
+
+def test_blocking_can_be_disabled(monkeypatch):
+    monkeypatch.setitem(matching.MATCH_CONFIG, 'blocking_enabled', False)
+    lost = {1: _features("Telephone Samsung noir", family="Objets personnels")}
+    found = {11: _features("Gourde metal bleue camping", family="Festival & camping")}
+    assert match_blocking.candidate_pairs(lost, found) == {(1, 11)}
+
+
+def _with_vectors(features, *vectors):
+    features.vectors = [np.asarray(v, dtype=np.float32) / np.linalg.norm(v) for v in vectors]
+    return features
+
+
+def test_similar_photos_are_candidates_without_shared_key():
+    lost = {1: _with_vectors(_features("Telephone Samsung noir", family="Objets personnels"), [1, 0, 0])}
+    found = {
+        10: _with_vectors(_features("Gourde metal bleue camping", family="Festival & camping"), [1, 0.1, 0]),
+        11: _with_vectors(_features("Veste rouge Quechua", family="Vêtements"), [0, 1, 0]),
+        12: _features("Lunettes soleil Rayban", family="Accessoires"),
+    }
+    assert match_blocking.candidate_pairs(lost, found) == {(1, 10)}
+
+
+def test_one_item_against_a_list_gives_the_same_pairs_as_both_lists():
+    lost = {
+        1: _with_vectors(_features("Telephone Samsung noir", family="Objets personnels"), [1, 0, 0]),
+        2: _features("Casque"),
+        3: _with_vectors(_features("Veste rouge Quechua", family="Vêtements"), [0, 0, 1]),
+    }
+    found = {
+        10: _with_vectors(_features("Gourde metal bleue camping", family="Festival & camping"), [1, 0.2, 0]),
+        11: _features("Portable samsung", family="Objets personnels"),
+        12: _with_vectors(_features("Veste quechua rouge", family="Vêtements"), [0, 1, 0.2]),
+    }
+    everything = match_blocking.candidate_pairs(lost, found)
+    by_lost = set().union(*(match_blocking.candidate_pairs({i: f}, found) for i, f in lost.items()))
+    by_found = set().union(*(match_blocking.candidate_pairs(lost, {j: f}) for j, f in found.items()))
+    assert everything == by_lost == by_found
+    assert (1, 10) in everything and (3, 12) in everything
@@ -0,0 +1,200 @@
+"""Tenue à jour de la table match_candidates, sur une base SQLite en mémoire.
+
+models.py et match_candidates.py (et ses événements de session) se branchent
+sur le faux `app` des fixtures de conftest.py, sans la configuration de
+l'application réelle.
+"""
+import importlib
+import types
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def match_candidates(models):
+    return importlib.import_module('match_candidates')
+
+
+@pytest.fixture
+def env(models, session, match_candidates):
+    yield types.SimpleNamespace(models=models, session=session, match_candidates=match_candidates)
+    match_candidates._RETRY_ITEMS.clear()
+
+
+def _pair(env, lost_title='Sac a dos noir', found_title='Sac a dos noir Eastpak'):
+    models, session = env.models, env.session
+    category = models.Category(name='Sac')
+    session.add(category)
+    session.flush()
+    lost = models.Item(status=models.Status.LOST, title=lost_title, category_id=category.id, reporter_name='a')
+    found = models.Item(status=models.Status.FOUND, title=found_title, category_id=category.id, reporter_name='b')
+    session.add_all([lost, found])
+    session.commit()
+    return lost, found
+
+
+def _scores(env):
+    return {(row.lost_id, row.found_id): row.score for row in env.models.MatchCandidate.query}
+
+
+def _spy(monkeypatch, module, name):
+    calls = []
+    real = getattr(module, name)
+
+    def spy(*args, **kwargs):
+        calls.append(args[1:])
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(module, name, spy)
+    return calls
+
+
+def test_dirty_item_is_rescored_on_commit(env, monkeypatch):
+    lost, found = _pair(env)
+    before = _scores(env)[(lost.id, found.id)]
+    refreshed = _spy(monkeypatch, env.match_candidates, 'refresh_items')
+
+    found.title = 'Sac a dos noir'
+    env.session.commit()
+    assert refreshed == [({found.id},)]
+    after = _scores(env)[(lost.id, found.id)]
+    assert after != before
+    # Même score qu'une reconstruction complète.
+    env.match_candidates.rebuild_all(env.session)
+    assert _scores(env)[(lost.id, found.id)] == after
+
+    # Un champ hors du score ne déclenche aucun recalcul.
+    found.reporter_name = 'c'
+    env.session.commit()
+    assert len(refreshed) == 1
+
+
+def test_rollback_discards_pending_items(env, monkeypatch):
+    lost, found = _pair(env)
+    before = _scores(env)
+    refreshed = _spy(monkeypatch, env.match_candidates, 'refresh_items')
+    session = env.session
+
+    found.title = 'Gourde verte'
+    session.flush()
+    assert session.info[env.match_candidates._STALE_ITEMS] == {found.id}
+    session.rollback()
+    assert env.match_candidates._STALE_ITEMS not in session.info
+
+    # La transaction suivante ne recalcule pas l'objet de la transaction annulée.
+    session.add(env.models.Category(name='Divers'))
+    session.commit()
+    assert refreshed == []
+    assert _scores(env) == before
+
+
+def test_engine_revision_change_forces_rebuild(env, monkeypatch):
+    _pair(env)
+    mc = env.match_candidates
+    session = env.session
+    rebuilds = _spy(monkeypatch, mc, 'rebuild_all')
+
+    mc.ensure_current(session)
+    mc.ensure_current(session)
+    assert len(rebuilds) == 1
+
+    old_version = mc.engine_version()
+    monkeypatch.setattr(mc, 'ENGINE_REVISION', mc.ENGINE_REVISION + 1)
+    assert mc.engine_version() != old_version
+    assert not mc.is_current(session)
+    mc.ensure_current(session)
+    assert len(rebuilds) == 2
+    assert {row.engine_version for row in env.models.MatchCandidate.query} == {mc.engine_version()}
+
+
+def test_empty_table_is_not_rebuilt_on_every_visit(env, monkeypatch):
+    models = env.models
+    session = env.session
+    # Aucun objet trouvé : aucune paire, la table reste vide une fois à jour.
+    category = models.Category(name='Cles')
+    session.add(category)
+    session.flush()
+    session.add(models.Item(status=models.Status.LOST, title='Cles de voiture', category_id=category.id,
+                            reporter_name='a'))
+    session.commit()
+    mc = env.match_candidates
+    rebuilds = _spy(monkeypatch, mc, 'rebuild_all')
+
+    for _ in range(3):
+        mc.ensure_current(session)
+    assert len(rebuilds) == 1
+    assert _scores(env) == {}
+    build = env.models.MatchCandidateBuild.query.one()
+    assert (build.engine_version, build.pair_count) == (mc.engine_version(), 0)
+
+
+def test_rows_written_meanwhile_by_another_transaction_are_overwritten(env, monkeypatch):
+    lost, found = _pair(env)
+    mc, models = env.match_candidates, env.models
+    real_load_features = mc.load_features
+
+    def concurrent_writer(session, items, **kwargs):
+        # Une autre transaction (édition du trouvé) a validé entre notre DELETE
+        # et notre INSERT : même paire, mêmes caractéristiques.
+        session.execute(models.MatchCandidate.__table__.insert(), {
+            'lost_id': lost.id, 'found_id': found.id, 'score': 1.0,
+            'engine_version': 'ancienne', 'updated_at': lost.date_reported})
+        session.execute(models.ItemMatchFeatures.__table__.delete())
+        session.execute(models.ItemMatchFeatures.__table__.insert(), {
+            'item_id': lost.id, 'fingerprint': 'ancienne', 'data': {}})
+        return real_load_features(session, items, **kwargs)
+
+    monkeypatch.setattr(mc, 'load_features', concurrent_writer)
+    lost.title = 'Sac a dos noir Eastpak'
+    env.session.commit()
+    monkeypatch.undo()
+
+    assert mc._RETRY_ITEMS == {}
+    row = models.MatchCandidate.query.one()
+    assert (row.engine_version, row.score) == (mc.engine_version(), _scores(env)[(lost.id, found.id)])
+    assert row.score > 1.0
+    assert env.session.get(models.ItemMatchFeatures, lost.id).fingerprint != 'ancienne'
+
+
+def test_failed_refresh_is_retried_on_the_next_commit(env, monkeypatch):
+    lost, found = _pair(env)
+    mc = env.match_candidates
+    before = _scores(env)
+    real_refresh = mc.refresh_items
+    calls = []
+
+    def flaky(session, item_ids):
+        calls.append(set(item_ids))
+        if len(calls) == 1:
+            raise RuntimeError('contrainte violée')
+        return real_refresh(session, item_ids)
+
+    monkeypatch.setattr(mc, 'refresh_items', flaky)
+    found.title = 'Sac a dos noir'
+    env.session.commit()
+    assert mc._RETRY_ITEMS == {found.id: 1}
+    assert _scores(env) == before
+
+    # Commit suivant, sans rapport avec les objets : la paire est recalculée.
+    env.session.add(env.models.Category(name='Divers'))
+    env.session.commit()
+    assert calls[1] == {found.id}
+    assert mc._RETRY_ITEMS == {}
+    assert _scores(env) != before
+
+
+def test_refresh_is_abandoned_after_max_retries(env, monkeypatch, caplog):
+    _, found = _pair(env)
+    mc = env.match_candidates
+
+    def broken(session, item_ids):
+        raise RuntimeError('table absente')
+
+    monkeypatch.setattr(mc, 'refresh_items', broken)
+    found.title = 'Sac a dos noir'
+    env.session.commit()
+    for n in range(mc.MAX_RETRIES - 1):
+        env.session.add(env.models.Category(name=f'Divers {n}'))
+        env.session.commit()
+    assert mc._RETRY_ITEMS == {}
+    assert 'rebuild-match-candidates' in caplog.text
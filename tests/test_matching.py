@@ -1,4 +1,11 @@
 """Tests purs pour matching.py — aucune base de données, aucune app Flask requise."""
+import json
+import random
+import re
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
 import matching
 
 
@@ -188,6 +195,192 @@ def test_normalize_text_is_memoized(monkeypatch):
     )
 
 
+def _legacy_replace_synonyms(text):
+    """Ancien algorithme (une regex par synonyme), référence pour l'équivalence."""
+    for syn, main in matching._SYNONYM_FLAT:
+        text = re.sub(r'\b' + re.escape(syn) + r'\b', main, text)
+    return text
+
+
+def _legacy_extract_descriptors(text):
+    return (
+        frozenset(c for c in matching.COLORS if re.search(r'\b' + re.escape(c) + r'\b', text)),
+        frozenset(b for b in matching.BRANDS if re.search(r'\b' + re.escape(b) + r'\b', text)),
+    )
+
+
+def _vocabulary():
+    words = set()
+    for syn, main in matching._SYNONYM_FLAT:
+        words.update((syn, main))
+        words.update(re.split(r'[\s-]', syn) + re.split(r'[\s-]', main))
+    return sorted(words | {'usb', 'bag', 'noir', 'trouve'})
+
+
+def test_replace_synonyms_matches_legacy_on_chains():
+    # Un remplacement peut en déclencher un autre, y compris avec le mot voisin.
+    for text in ("batterie externe usb", "trousseau de cles usb", "montre connectee",
+                 "smartwatch", "camera reflex", "sac a dos sac banane", "porte feuille"):
+        assert matching._replace_synonyms(text) == _legacy_replace_synonyms(text), text
+
+
+def test_replace_synonyms_matches_legacy_on_vocabulary():
+    vocab = _vocabulary()
+    rnd = random.Random(0)
+    texts = list(vocab)
+    texts += [' '.join(rnd.choice(vocab) for _ in range(rnd.randint(2, 5))) for _ in range(400)]
+    for text in texts:
+        assert matching._replace_synonyms(text) == _legacy_replace_synonyms(text), text
+
+
+def test_extract_descriptors_matches_legacy():
+    vocab = sorted(matching.COLORS | matching.BRANDS | {'noirs2', 'sac', 'h m'})
+    rnd = random.Random(0)
+    for _ in range(400):
+        text = ' '.join(rnd.choice(vocab) for _ in range(rnd.randint(1, 5)))
+        assert matching._extract_descriptors.__wrapped__(text) == _legacy_extract_descriptors(text), text
+
+
+def test_features_roundtrip_through_json_keeps_the_score():
+    lost = _item(title="Sac a dos noir Eastpak", comments="porte cles rouge", location="Scene",
+                 item_color="noir,rouge", item_brand="Eastpak", item_distinctive="a_document_id")
+    found = _item(title="sacoche noire eastpak", found_location="Scene",
+                  item_color="noir", item_brand="eastpak ", item_distinctive="a_document_id")
+    f1 = matching.extract_features(lost, family=None)
+    f2 = matching.extract_features(found, family=None)
+    stored = json.loads(json.dumps(f1.to_dict()))
+    restored = matching.MatchFeatures.from_dict(stored)
+    assert matching.score_features(restored, f2) == matching.match_score(lost, found)
+    assert matching.structured_bonus(restored, f2) == matching.structured_field_bonus(lost, found)
+
+
+def test_pair_bonus_combines_family_date_and_structured_fields():
+    now = datetime(2026, 7, 10, 12, 0)
+    lost = matching.MatchFeatures({}, colors={'noir'}, category_id=1, family='Accessoires',
+                                  date_reported=now)
+    found = matching.MatchFeatures({}, colors={'noir'}, category_id=1, family='Accessoires',
+                                   date_reported=now + timedelta(days=1))
+    cfg = matching.MATCH_CONFIG
+    assert matching.pair_bonus(lost, found) == (
+        cfg['bonus_same_category'] + cfg['bonus_date_close'] + cfg['bonus_color_match'])
+    far = matching.MatchFeatures({}, category_id=2, family='Vêtements',
+                                 date_reported=now + timedelta(days=30))
+    assert matching.pair_bonus(lost, far) == -cfg['malus_other_family'] - cfg['malus_date_far']
+
+
+def test_pair_bonus_ignores_mixed_naive_and_aware_dates():
+    lost = matching.MatchFeatures({}, date_reported=datetime(2026, 7, 10))
+    found = matching.MatchFeatures({}, date_reported=datetime(2026, 7, 10, tzinfo=timezone.utc))
+    assert matching.pair_bonus(lost, found) == 0.0
+
+
+def test_features_fingerprint_tracks_source_fields():
+    item = _item(title="Casque audio", comments="noir")
+    before = matching.features_fingerprint(item)
+    assert matching.features_fingerprint(_item(title="Casque audio", comments="noir")) == before
+    item.item_brand = "Bose"
+    assert matching.features_fingerprint(item) != before
+
+
+def _random_items(rnd, count):
+    titles = ["Sac a dos noir Eastpak", "sacoche noire", "Telephone Samsung", "portable samsung noir",
+              "Portefeuille cuir marron", "porte monnaie rouge", "Casque audio Bose", "ecouteurs blancs",
+              "Veste rouge Quechua", "gourde bleue", "", "Cle de voiture", "trousseau de cles"]
+    colors = ['', 'noir', 'noir,rouge', 'multicolore', 'inconnu', 'bleu,multicolore', 'rouge']
+    brands = ['', 'Eastpak', 'eastpack', 'Samsung', 'inconnu', 'Bose ']
+    flags = ['', 'a_document_id', 'a_argent,a_document_id', 'a_stickers']
+    families = [None, 'Accessoires', 'Audio & tech', 'Vêtements']
+    base_date = datetime(2026, 7, 10, 12, 0)
+    items = []
+    for _ in range(count):
+        date = base_date + timedelta(days=rnd.choice([0, 1, 2, 3, 14, 15, 30]),
+                                     seconds=rnd.choice([0, 1, 3600]))
+        if rnd.random() < 0.2:
+            date = date.replace(tzinfo=timezone.utc)
+        item = _item(title=rnd.choice(titles), comments=rnd.choice(['', 'perdu au camping', 'avec autocollant noir']),
+                     location=rnd.choice(['', 'Scene', 'Camping']), item_color=rnd.choice(colors),
+                     item_brand=rnd.choice(brands), item_distinctive=rnd.choice(flags))
+        item.category_id = rnd.choice([None, 1, 2, 3])
+        item.date_reported = rnd.choice([date, None]) if rnd.random() < 0.1 else date
+        items.append((item, rnd.choice(families)))
+    return items
+
+
+def test_score_matrix_matches_scalar_path():
+    rnd = random.Random(1)
+    lost = _random_items(rnd, 30)
+    found = _random_items(rnd, 25)
+    features1 = [matching.extract_features(item, family=fam) for item, fam in lost]
+    features2 = [matching.extract_features(item, family=fam) for item, fam in found]
+    scores = matching.score_matrix(features1, features2)
+    bonuses = matching.bonus_matrix(features1, features2)
+    assert scores.shape == (30, 25)
+    for i, (item1, _) in enumerate(lost):
+        for j, (item2, _) in enumerate(found):
+            assert scores[i, j] == matching.match_score(item1, item2)
+            assert bonuses[i, j] == matching.pair_bonus(features1[i], features2[j])
+
+
+def test_score_matrix_accepts_plain_items_and_empty_sides():
+    items = [_item(title="Sac noir"), _item(title="Gourde")]
+    assert matching.score_matrix(items, []).shape == (2, 0)
+    assert matching.score_matrix(items, items)[0, 0] == matching.match_score(items[0], items[0])
+
+
+def test_pair_scores_scores_only_blocked_pairs(monkeypatch):
+    rnd = random.Random(3)
+    lost = [matching.extract_features(item, family=fam) for item, fam in _random_items(rnd, 12)]
+    found = [matching.extract_features(item, family=fam) for item, fam in _random_items(rnd, 9)]
+    pairs = [(0, 3), (0, 8), (5, 0), (11, 3), (5, 7)]
+    full = matching.pair_score_matrix(lost, found)
+
+    compared = []
+    real = matching.pair_score_matrix
+
+    def spy(lost_features, found_features, workers=-1):
+        compared.extend((id(a), id(b)) for a in lost_features for b in found_features)
+        return real(lost_features, found_features, workers=workers)
+
+    monkeypatch.setattr(matching, 'pair_score_matrix', spy)
+    result = matching.pair_scores(lost, found, pairs)
+    # Aucune paire hors du blocage n'est comparée, et chacune une seule fois.
+    assert sorted(compared) == sorted((id(lost[i]), id(found[j])) for i, j in pairs)
+    for vector, matrix in zip(result, full):
+        expected = [matrix[i, j] for i, j in pairs]
+        np.testing.assert_array_equal(vector, expected)
+    assert all(len(vector) == 0 for vector in matching.pair_scores(lost, found, []))
+
+
+def test_apply_bonus_array_rounds_like_python():
+    rnd = random.Random(2)
+    base = [rnd.choice([0.0, 12.345, 50.005, 99.995, 100.0]) + rnd.random() for _ in range(500)]
+    base += [1.005, 2.675, 33.125, 67.875]
+    bonus = [rnd.choice([-40.0, -5.0, 0.0, 8.0, 27.5, 60.0]) for _ in base]
+    result = matching.apply_bonus_array(np.array(base), np.array(bonus))
+    assert list(result) == [matching.apply_bonus(b, x) for b, x in zip(base, bonus)]
+
+
+def test_top_k_matches_stable_full_sort():
+    rnd = random.Random(11)
+    scored = [(rnd.choice([10.0, 50.0, 72.5, 90.0, 99.9]), f"obj{i}") for i in range(300)]
+    for k in (0, 1, 5, 10, 400):
+        expected = sorted(scored, key=lambda x: x[0], reverse=True)[:k]
+        assert matching.top_k(iter(scored), k) == [(key, score) for score, key in expected]
+    above = matching.top_k(scored, 1000, threshold=72.5)
+    assert above and all(score >= 72.5 for _, score in above)
+    assert len(above) == sum(1 for score, _ in scored if score >= 72.5)
+
+
+def test_top_k_ties_keep_arrival_order_and_k_beyond_candidates():
+    scored = [(80.0, 'a'), (95.0, 'b'), (80.0, 'c'), (80.0, 'd'), (60.0, 'e')]
+    # À score égal, le premier arrivé passe devant (tri stable décroissant).
+    assert matching.top_k(scored, 3) == [('b', 95.0), ('a', 80.0), ('c', 80.0)]
+    # k plus grand que le nombre de candidats : tout le monde, dans l'ordre.
+    assert matching.top_k(scored, 50) == [('b', 95.0), ('a', 80.0), ('c', 80.0), ('d', 80.0), ('e', 60.0)]
+    assert matching.top_k(scored, 50, threshold=80.0) == [('b', 95.0), ('a', 80.0), ('c', 80.0), ('d', 80.0)]
+    assert matching.top_k([], 5) == []
+
+
 class _item:
     """Petit double léger imitant un Item pour matching.py (title/comments/location/...)."""
     def __init__(self, title='', comments='', location='', found_location='',
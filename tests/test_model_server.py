@@ -0,0 +1,76 @@
+"""Tests purs pour model_server.py — protocole et regroupement, sans torch ni modèle."""
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+import model_server
+
+
+def test_frames_round_trip_over_socketpair():
+    left, right = socket.socketpair()
+    with left, right:
+        payload = bytes(range(256)) * 5000  # plus grand que le tampon du socket
+
+        def write():
+            model_server.send_frame(left, payload)
+            model_server.send_frame(left, b'')
+            model_server.send_json(left, {'op': 'status'})
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        assert model_server.recv_frame(right) == payload
+        assert model_server.recv_frame(right) == b''
+        assert model_server.recv_json(right) == {'op': 'status'}
+        writer.join()
+        left.close()
+        assert model_server.recv_frame(right) is None
+
+
+def test_oversized_frame_is_rejected():
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(model_server._LENGTH.pack(model_server.MAX_FRAME + 1))
+        with pytest.raises(ValueError):
+            model_server.recv_frame(right)
+
+
+def _fake_embed(calls):
+    def embed(images):
+        calls.append(len(images))
+        vectors = np.array([[len(image), 1.0] for image in images], dtype=np.float32).reshape(-1, 2)
+        return vectors, np.array([not image for image in images], dtype=bool)
+    return embed
+
+
+def test_server_batches_concurrent_requests(tmp_path):
+    calls = []
+    server = model_server.ModelServer(str(tmp_path / 'model.sock'), _fake_embed(calls),
+                                      lambda: {'state': 'ready'}, max_batch=64, max_wait=0.2)
+    server.start()
+    try:
+        client = model_server.ModelClient(server.path, timeout=5)
+        assert client.status() == {'state': 'ready'}
+        results = {}
+
+        def call(n):
+            results[n] = client.embed([b'x' * n, b''])
+
+        threads = [threading.Thread(target=call, args=(n,)) for n in (3, 5, 7)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for n, (vectors, failed) in results.items():
+            assert vectors.shape == (2, 2) and vectors[0, 0] == n
+            assert failed.tolist() == [False, True]
+        assert len(calls) < 3  # au moins deux requêtes partagent un lot
+    finally:
+        server.stop()
+
+
+def test_client_reports_missing_server(tmp_path):
+    client = model_server.ModelClient(str(tmp_path / 'absent.sock'), timeout=1)
+    with pytest.raises(model_server.ModelServerUnavailable):
+        client.embed([b'x'])
@@ -0,0 +1,45 @@
+"""Les colonnes binaires ne sont jamais lues par les requêtes de liste.
+
+Aucune base de données : models.py vient de la fixture `models` (conftest.py),
+branchée sur un SQLAlchemy() non lié, et les requêtes sont seulement compilées.
+"""
+import re
+
+import pytest
+import sqlalchemy as sa
+
+
+BLOBS = {
+    'Item': ('photo_data', 'return_photo_data'),
+    'ItemPhoto': ('data',),
+    'Product': ('image_data',),
+    'Category': ('icon_data',),
+    'LoanAttachment': ('data',),
+    'ZTicketPDF': ('pdf_data',),
+    'PhotoEmbedding': ('embedding',),
+    'PhotoVariant': ('data',),
+}
+
+
+@pytest.mark.parametrize('model_name', sorted(BLOBS))
+def test_listing_queries_never_select_blob_columns(models, model_name):
+    model = getattr(models, model_name)
+    compiled = str(sa.select(model).compile())
+    table = model.__tablename__
+    for column in BLOBS[model_name]:
+        # Seule une expression de présence (IS NOT NULL) peut citer la colonne.
+        assert not re.search(rf'\b{table}\.{column}\b(?! IS NOT NULL)', compiled), compiled
+
+
+def test_every_binary_column_is_deferred(models):
+    for mapper in models.db.Model.registry.mappers:
+        for prop in mapper.column_attrs:
+            column = prop.columns[0]
+            if isinstance(column, sa.Column) and isinstance(column.type, sa.LargeBinary):
+                assert prop.deferred, f'{mapper.class_.__name__}.{prop.key} doit être différée'
+                assert prop.group == models.BLOB_GROUP
+
+
+def test_custom_icon_presence_is_read_without_the_bytes(models):
+    compiled = str(sa.select(models.Category).compile())
+    assert 'categories.icon_data IS NOT NULL' in compiled
@@ -0,0 +1,85 @@
+"""Tests pour phash_index.py — l'index pur, puis son rafraîchissement sur une
+base SQLite en mémoire (fixture `models` de conftest.py)."""
+import random
+
+import pytest
+import sqlalchemy as sa
+
+import phash_index
+
+
+def _random_hash(rnd, bits=256):
+    return f"{rnd.getrandbits(bits):0{bits // 4}x}"
+
+
+def _flip(hex_hash, count, rnd):
+    value = int(hex_hash, 16)
+    for position in rnd.sample(range(len(hex_hash) * 4), count):
+        value ^= 1 << position
+    return f"{value:0{len(hex_hash)}x}"
+
+
+def test_query_matches_brute_force_scan():
+    rnd = random.Random(4)
+    probe = _random_hash(rnd)
+    hashes = {}
+    for photo_id in range(1, 400):
+        # Un tiers de quasi-copies à toutes les distances autour du seuil.
+        hashes[photo_id] = _flip(probe, rnd.randint(0, 40), rnd) if photo_id % 3 == 0 else _random_hash(rnd)
+    index = phash_index.PerceptualHashIndex()
+    for photo_id, value in hashes.items():
+        index.add(photo_id, photo_id * 10, value)
+
+    for radius in (0, 5, 18, 31, 40):
+        expected = sorted(
+            (photo_id, photo_id * 10, phash_index.hamming_distance(probe, value))
+            for photo_id, value in hashes.items()
+            if phash_index.hamming_distance(probe, value) <= radius)
+        expected.sort(key=lambda entry: (entry[2], entry[0]))
+        assert index.query(probe, radius) == expected
+    assert len(index.query(probe, 18, limit=3)) <= 3
+
+
+def test_remove_and_invalid_hashes():
+    rnd = random.Random(8)
+    value = _random_hash(rnd)
+    index = phash_index.PerceptualHashIndex()
+    index.add(1, 10, value)
+    index.add(2, 20, 'pas-un-hash')
+    index.add(3, 30, value[:16])        # autre longueur : jamais comparé
+    assert [photo_id for photo_id, _, _ in index.query(value, 18)] == [1]
+    index.remove(1)
+    assert index.query(value, 18) == []
+    assert len(index) == 1
+    assert index.query(None, 18) == []
+
+
+def test_refresh_sees_a_deletion_followed_by_an_insertion(models):
+    rnd = random.Random(12)
+    hashes = [_random_hash(rnd) for _ in range(4)]
+    engine = sa.create_engine('sqlite://')
+    models.db.metadata.create_all(engine, tables=[models.ItemPhoto.__table__])
+    photos = models.ItemPhoto.__table__
+    index = phash_index.PerceptualHashIndex()
+    with engine.begin() as connection:
+        connection.execute(photos.insert(), [
+            {'id': 1, 'item_id': 10, 'filename': 'a.jpg', 'perceptual_hash': hashes[0]},
+            {'id': 2, 'item_id': 20, 'filename': 'b.jpg', 'perceptual_hash': None},
+            {'id': 3, 'item_id': 30, 'filename': 'c.jpg', 'perceptual_hash': hashes[2]},
+        ])
+        index.refresh(connection)
+        assert [item for _, item, _ in index.query(hashes[0], 0)] == [10]
+
+        # Autant de hash qu'avant : une photo supprimée, une autre hachée après
+        # coup par le worker, d'id inférieur au dernier lu.
+        connection.execute(photos.delete().where(photos.c.id == 1))
+        connection.execute(photos.update().where(photos.c.id == 2).values(perceptual_hash=hashes[1]))
+        index.refresh(connection)
+        assert index.query(hashes[0], 0) == []
+        assert [item for _, item, _ in index.query(hashes[1], 0)] == [20]
+
+        connection.execute(photos.insert(), {'id': 4, 'item_id': 40, 'filename': 'd.jpg',
+                                             'perceptual_hash': hashes[3]})
+        index.refresh(connection)
+        assert [item for _, item, _ in index.query(hashes[3], 0)] == [40]
+        assert len(index) == 3
@@ -4,9 +4,19 @@ N'importent jamais torch/transformers : current_model_version() est
 monkeypatché pour éviter le chargement de visual_matcher.py (qui importe
 torch au niveau module). Les objets Item/ItemPhoto/PhotoEmbedding réels ne
 sont jamais utilisés — de simples doubles suffisent pour cette logique pure.
+
+Le rafraîchissement de l'EmbeddingIndex et le chemin par lots
+d'ensure_photo_embeddings (modèle remplacé par un double) lisent une base
+SQLite en mémoire (fixtures `models` et `session` de conftest.py).
 """
+import importlib.util
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
 import numpy as np
 import pytest
+import sqlalchemy as sa
 
 import photo_embeddings as pe
 
@@ -93,3 +103,307 @@ def test_item_embedding_similarity_picks_best_match_across_photos():
     # doit l'emporter sur le pire (0.0).
     similarity = pe.item_embedding_similarity(item1, item2)
     assert similarity == pytest.approx(1.0)
+
+
+def _unit(rng, dimension=8):
+    vector = rng.normal(size=dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_similarity_matrix_matches_pairwise_vectors_similarity():
+    rng = np.random.default_rng(5)
+    lists1 = [[_unit(rng) for _ in range(rng.integers(0, 3))] for _ in range(12)]
+    lists2 = [[_unit(rng) for _ in range(rng.integers(0, 3))] for _ in range(9)]
+    matrix = pe.similarity_matrix(lists1, lists2)
+    for i, vectors1 in enumerate(lists1):
+        for j, vectors2 in enumerate(lists2):
+            expected = pe.vectors_similarity(vectors1, vectors2)
+            if expected is None:
+                assert np.isnan(matrix[i, j])
+            else:
+                assert matrix[i, j] == pytest.approx(expected, abs=1e-6)
+
+
+def test_embedding_index_pairwise_and_nearest():
+    rng = np.random.default_rng(7)
+    index = pe.EmbeddingIndex('test-model')
+    a, b, c = _unit(rng), _unit(rng), _unit(rng)
+    index.upsert(1, 10, a)
+    index.upsert(2, 10, b)          # deuxième photo de l'objet 10
+    index.upsert(3, 20, a)          # même image que la 1re photo de 10
+    index.upsert(4, 30, c)
+    index.upsert(5, 40, None)       # pas prêt : absent de l'index
+
+    matrix = index.pairwise([10, 40, 30], [20, 30])
+    assert matrix[0, 0] == pytest.approx(1.0, abs=1e-6)
+    assert np.isnan(matrix[1]).all()
+    assert matrix[2, 1] == pytest.approx(1.0, abs=1e-6)
+    assert matrix[0, 1] == pytest.approx(pe.vectors_similarity([a, b], [c]), abs=1e-6)
+
+    nearest = index.nearest(10, k=5)
+    assert nearest[0] == (20, pytest.approx(1.0, abs=1e-6))
+    assert [item_id for item_id, _ in nearest] == [20, 30]
+    assert [item_id for item_id, _ in index.nearest(10, k=5, among={30, 40})] == [30]
+    assert index.nearest(40) == []
+
+
+def test_embedding_index_upsert_replaces_and_removes_rows():
+    rng = np.random.default_rng(9)
+    index = pe.EmbeddingIndex('test-model')
+    index.upsert(1, 10, _unit(rng))
+    assert len(index.vectors(10)) == 1
+    index.upsert(1, 10, None)       # embedding invalidé
+    assert index.vectors(10) == []
+    assert np.isnan(index.pairwise([10], [10])).all()
+
+
+def test_embedding_index_refresh_sees_a_deletion_followed_by_an_insertion(models):
+    rng = np.random.default_rng(11)
+    vectors = [_unit(rng) for _ in range(4)]
+    engine = sa.create_engine('sqlite://')
+    models.db.metadata.create_all(engine, tables=[models.ItemPhoto.__table__,
+                                                  models.PhotoEmbedding.__table__])
+    photos, embeddings = models.ItemPhoto.__table__, models.PhotoEmbedding.__table__
+    now = datetime(2026, 7, 10, 12, 0)
+
+    def embedding(embedding_id, vector, updated_at=now):
+        return {'id': embedding_id, 'item_photo_id': embedding_id, 'model_version': 'test-model',
+                'image_hash': f'h{embedding_id}', 'embedding': vector.tobytes(),
+                'embedding_dimension': vector.size, 'status': pe.READY, 'updated_at': updated_at}
+
+    index = pe.EmbeddingIndex('test-model')
+    with engine.begin() as connection:
+        connection.execute(photos.insert(), [{'id': n, 'item_id': 10 * n, 'filename': f'{n}.jpg'}
+                                             for n in range(1, 5)])
+        connection.execute(embeddings.insert(), [embedding(1, vectors[0]), embedding(2, vectors[1])])
+        index.refresh(connection)
+        assert len(index.vectors(10)) == 1
+
+        # Même nombre de lignes qu'avant : une supprimée, une autre ajoutée.
+        connection.execute(embeddings.delete().where(embeddings.c.id == 1))
+        connection.execute(embeddings.insert(), embedding(3, vectors[2]))
+        index.refresh(connection)
+        assert index.vectors(10) == []
+        assert np.allclose(index.vectors(30)[0], vectors[2])
+        assert np.isnan(index.pairwise([10], [20, 30])).all()
+
+        # Ligne validée bien après son updated_at, hors de la fenêtre de recouvrement.
+        connection.execute(embeddings.insert(), embedding(4, vectors[3], now - timedelta(days=1)))
+        index.refresh(connection)
+        assert np.allclose(index.vectors(40)[0], vectors[3])
+
+
+def test_embedding_index_refresh_skips_the_id_scan_when_nothing_changed(models):
+    engine = sa.create_engine('sqlite://')
+    models.db.metadata.create_all(engine, tables=[models.ItemPhoto.__table__,
+                                                  models.PhotoEmbedding.__table__])
+    photos, embeddings = models.ItemPhoto.__table__, models.PhotoEmbedding.__table__
+    vector = _unit(np.random.default_rng(12))
+    statements = []
+    sa.event.listen(engine, 'before_cursor_execute',
+                    lambda conn, cursor, statement, *args: statements.append(statement))
+    clock = [0.0]
+    index = pe.EmbeddingIndex('test-model', clock=lambda: clock[0])
+
+    def id_scans():
+        return sum(1 for statement in statements
+                   if statement.startswith('SELECT photo_embeddings.id \nFROM photo_embeddings'))
+
+    with engine.begin() as connection:
+        connection.execute(photos.insert(), {'id': 1, 'item_id': 10, 'filename': '1.jpg'})
+        connection.execute(embeddings.insert(), {
+            'id': 1, 'item_photo_id': 1, 'model_version': 'test-model', 'image_hash': 'h1',
+            'embedding': vector.tobytes(), 'embedding_dimension': vector.size, 'status': pe.READY,
+            'updated_at': datetime(2026, 7, 10, 12, 0)})
+        index.refresh(connection)
+        assert id_scans() == 1
+        index.refresh(connection)
+        assert id_scans() == 1
+
+        connection.execute(embeddings.delete())
+        index.refresh(connection)
+        assert id_scans() == 2
+        assert index.vectors(10) == []
+
+        clock[0] = pe.EmbeddingIndex.RESCAN_SECONDS
+        index.refresh(connection)
+        assert id_scans() == 3
+
+
+def test_embedding_index_refreshes_once_per_request(models, session, monkeypatch, fixed_model_version):
+    from flask import current_app
+
+    refreshes = []
+    monkeypatch.setattr(pe.EmbeddingIndex, 'refresh', lambda self, connection: refreshes.append(self))
+    monkeypatch.setitem(pe._INDEXES, 'test-model', pe.EmbeddingIndex('test-model'))
+    # Un contexte d'application neuf par requête, comme en service.
+    with current_app.app_context(), current_app.test_request_context():
+        first = pe.embedding_index()
+        assert pe.embedding_index() is first
+        assert len(refreshes) == 1
+    with current_app.app_context(), current_app.test_request_context():
+        pe.embedding_index()
+    assert len(refreshes) == 2
+    # Hors requête (CLI, worker) : rafraîchi à chaque appel.
+    pe.embedding_index()
+    pe.embedding_index()
+    assert len(refreshes) == 4
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Double de _embed_dinov2_batch : vecteur tiré du premier octet, échec pour b'!…'."""
+    calls = []
+
+    def embed(images, batch_size=None):
+        calls.append(list(images))
+        return [ValueError("DINOv2 could not embed this image") if data.startswith(b'!')
+                else np.asarray([data[0], 1.0], dtype=np.float32) / np.hypot(data[0], 1.0)
+                for data in images]
+
+    monkeypatch.setattr(pe, '_embed_dinov2_batch', embed)
+    return calls
+
+
+def _photos(*payloads):
+    return [SimpleNamespace(id=n, data=data, perceptual_hash=None) for n, data in enumerate(payloads, start=1)]
+
+
+def test_ensure_photo_embeddings_embeds_duplicate_content_once(models, session, fake_model):
+    photos = _photos(b'aaa', b'bbb', b'aaa', b'ccc', b'bbb')
+    records = pe.ensure_photo_embeddings(photos)
+    # Un seul passage dans le modèle, une fois par contenu, dans l'ordre d'arrivée.
+    assert fake_model == [[b'aaa', b'bbb', b'ccc']]
+    assert [record.item_photo_id for record in records] == [1, 2, 3, 4, 5]
+    assert all(record.status == pe.READY for record in records)
+    assert records[0].embedding == records[2].embedding != records[1].embedding
+    session.commit()
+    assert session.query(models.EmbeddingCacheEntry).count() == 3
+
+    # Même contenu sur une nouvelle photo : lu dans embedding_cache, sans modèle.
+    (again,) = pe.ensure_photo_embeddings([SimpleNamespace(id=6, data=b'ccc', perceptual_hash=None)])
+    assert len(fake_model) == 1
+    assert again.embedding == records[3].embedding
+
+
+def test_ensure_photo_embeddings_failure_stays_on_its_own_rows(models, session, fake_model):
+    records = pe.ensure_photo_embeddings(_photos(b'aaa', b'!illisible', b'', b'!illisible', b'bbb'))
+    assert [record.status if record else None for record in records] == [
+        pe.READY, pe.FAILED, None, pe.FAILED, pe.READY]
+    assert fake_model == [[b'aaa', b'!illisible', b'bbb']]
+    assert records[1].embedding is None and 'could not embed' in records[1].error_message
+    session.commit()
+    # Un échec n'est jamais mis en cache : il sera retenté.
+    assert {entry.image_hash for entry in session.query(models.EmbeddingCacheEntry)} == {
+        pe.image_hash(b'aaa'), pe.image_hash(b'bbb')}
+
+
+def test_vector_literal_round_trips_float32():
+    vector = np.asarray([0.1, -0.25, 1.0 / 3.0], dtype=np.float32)
+    literal = pe.vector_literal(vector)
+    assert literal.startswith('[') and literal.endswith(']')
+    parsed = np.asarray([float(x) for x in literal[1:-1].split(',')], dtype=np.float32)
+    assert np.array_equal(parsed, vector)
+
+
+def test_best_per_item_keeps_each_items_best_photo():
+    rows = [(10, 0.5), (20, 0.9), (10, 0.95), (30, 0.2), (20, 0.1)]
+    assert pe.best_per_item(rows, 2) == [(10, 0.95), (20, 0.9)]
+    assert pe.best_per_item([], 3) == []
+
+
+def test_pgvector_never_available_outside_postgresql():
+    connection = type('FakeConnection', (), {'dialect': type('Dialect', (), {'name': 'sqlite'})()})()
+    assert pe.pgvector_available(connection) is False
+
+
+def test_resolve_cached_prefers_content_hash_then_phash():
+    by_hash = {'h1': np.array([1.0], dtype=np.float32)}
+    by_phash = {'p2': np.array([2.0], dtype=np.float32), 'p1': np.array([9.0], dtype=np.float32)}
+    found = pe.resolve_cached(['h1', 'h2', 'h3'], {'h1': 'p1', 'h2': 'p2', 'h3': 'p3'}, by_hash, by_phash)
+    assert sorted(found) == ['h1', 'h2']
+    assert found['h1'][0] == 1.0 and found['h2'][0] == 2.0
+    assert pe.resolve_cached(['h2'], {'h2': 'p2'}, {}, {}) == {}
+
+
+def _seed_neighbours(models, session, dimension):
+    """Un objet perdu et, à la même photo près, un trouvé, un perdu et un rendu."""
+    Status = models.Status
+    category = models.Category(name='Sac')
+    session.add(category)
+    session.flush()
+    vector = _unit(np.random.default_rng(13), dimension)
+    items = {}
+    for status in (Status.LOST, Status.FOUND, Status.LOST, Status.RETURNED):
+        item = models.Item(status=status, title='Sac noir', category_id=category.id, reporter_name='a')
+        photo = models.ItemPhoto(item=item, filename=f'{len(items)}.jpg')
+        session.add_all([item, photo])
+        session.flush()
+        session.add(models.PhotoEmbedding(
+            item_photo_id=photo.id, model_version='test-model', image_hash=f'h{photo.id}',
+            embedding=vector.tobytes(), embedding_dimension=dimension, status=pe.READY))
+        items.setdefault(status, []).append(item.id)
+    session.commit()
+    return items
+
+
+def test_nearest_items_keeps_only_the_requested_status(models, session, monkeypatch, fixed_model_version):
+    monkeypatch.setitem(pe._INDEXES, 'test-model', pe.EmbeddingIndex('test-model'))
+    items = _seed_neighbours(models, session, 8)
+    lost = items[models.Status.LOST][0]
+
+    assert len(pe.nearest_items(lost, 5)) == 3
+    assert [item_id for item_id, _ in pe.nearest_items(lost, 5, models.Status.FOUND)] == items[models.Status.FOUND]
+
+
+@pytest.fixture
+def pg_session(models):
+    """Base PostgreSQL jetable avec pgvector (TEST_DATABASE_URL), migration optionnelle appliquée."""
+    import os
+    from flask import Flask
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+
+    url = os.environ.get('TEST_DATABASE_URL', '')
+    if not url.startswith('postgresql'):
+        pytest.skip('TEST_DATABASE_URL ne désigne pas une base PostgreSQL avec pgvector')
+    path = Path(__file__).parents[1] / 'migrations/optional/20260724_02_photo_embeddings_pgvector_optional.py'
+    spec = importlib.util.spec_from_file_location('pgvector_migration', path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    flask_app = Flask(__name__)
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = url
+    models.db.init_app(flask_app)
+    with flask_app.app_context():
+        models.db.drop_all()
+        models.db.create_all()
+        with models.db.engine.begin() as connection, Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+        pe._PGVECTOR_DIMENSIONS.clear()
+        yield models.db.session
+        models.db.session.remove()
+        models.db.drop_all()
+        pe._PGVECTOR_DIMENSIONS.clear()
+
+
+def test_pgvector_backfill_and_nearest_items(models, pg_session, monkeypatch, fixed_model_version):
+    items = _seed_neighbours(models, pg_session, 384)
+    # Vecteurs d'un autre modèle : ni copiés, ni proposés comme voisins.
+    returned_photos = sa.select(models.ItemPhoto.id).where(
+        models.ItemPhoto.item_id == items[models.Status.RETURNED][0])
+    pg_session.execute(sa.update(models.PhotoEmbedding)
+                       .where(models.PhotoEmbedding.item_photo_id.in_(returned_photos))
+                       .values(model_version='other-model'))
+    pg_session.commit()
+    monkeypatch.setattr(pe, 'embedding_index', lambda: pytest.fail('repli NumPy inattendu'))
+
+    assert pe.pgvector_dimension(pg_session.connection()) == 384
+    assert pe.backfill_embedding_vectors(pg_session) == 3
+    assert pe.backfill_embedding_vectors(pg_session) == 0
+
+    lost = items[models.Status.LOST][0]
+    found = pe.nearest_items(lost, 5, models.Status.FOUND)
+    assert [item_id for item_id, _ in found] == items[models.Status.FOUND]
+    assert found[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert {item_id for item_id, _ in pe.nearest_items(lost, 5)} == {
+        items[models.Status.FOUND][0], items[models.Status.LOST][1]}
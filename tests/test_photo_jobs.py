@@ -0,0 +1,120 @@
+"""Tests pour photo_jobs.py — délais de reprise, puis réservation, reprise et
+abandon des travaux sur une base SQLite en mémoire.
+
+La base vient de la fixture `session` de conftest.py.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+import photo_jobs
+
+NOW = datetime(2026, 7, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def test_backoff_doubles_then_caps():
+    assert photo_jobs.backoff(1) == timedelta(seconds=30)
+    assert photo_jobs.backoff(2) == timedelta(minutes=1)
+    assert photo_jobs.backoff(4) == timedelta(minutes=4)
+    assert photo_jobs.backoff(30) == photo_jobs.BACKOFF_MAX
+
+
+def test_process_photo_skips_empty_photo():
+    photo = type('FakePhoto', (), {'data': None, 'perceptual_hash': None})()
+    assert photo_jobs.process_photo(photo) is None
+    assert photo.perceptual_hash is None
+
+
+def _jobs(models, session, *states):
+    """Une photo et son travail par état (statut, run_after, locked_at, attempts)."""
+    category = models.Category(name='Sac')
+    session.add(category)
+    session.flush()
+    item = models.Item(status=models.Status.FOUND, title='Sac', category_id=category.id, reporter_name='a')
+    session.add(item)
+    session.flush()
+    jobs = []
+    for index, (status, run_after, locked_at, attempts) in enumerate(states):
+        photo = models.ItemPhoto(item_id=item.id, filename=f'p{index}.jpg', data=b'x')
+        session.add(photo)
+        session.flush()
+        job = models.PhotoJob(item_photo_id=photo.id, status=status, run_after=run_after,
+                              locked_at=locked_at, attempts=attempts)
+        session.add(job)
+        jobs.append(job)
+    session.commit()
+    return [job.id for job in jobs]
+
+
+def test_claim_never_waits_for_jobs_locked_by_another_worker(models, session):
+    sql = str(photo_jobs.claimable(session, 4, NOW).statement.compile(dialect=postgresql.dialect()))
+    assert 'FOR UPDATE SKIP LOCKED' in sql
+
+
+def test_claim_takes_ready_and_orphaned_jobs_only(models, session):
+    stale = NOW - photo_jobs.LOCK_TIMEOUT - timedelta(minutes=1)
+    ready, later, orphan, busy, done = _jobs(
+        models, session,
+        (photo_jobs.PENDING, NOW - timedelta(minutes=1), None, 0),
+        (photo_jobs.PENDING, NOW + timedelta(minutes=1), None, 1),
+        (photo_jobs.RUNNING, stale - timedelta(hours=1), stale, 1),
+        (photo_jobs.RUNNING, NOW, NOW - timedelta(minutes=1), 1),
+        (photo_jobs.DONE, NOW - timedelta(hours=2), None, 1),
+    )
+    assert photo_jobs.claim(session, 10, now=NOW) == [orphan, ready]
+    claimed = {job.id: job for job in session.query(models.PhotoJob)}
+    assert (claimed[ready].status, claimed[ready].attempts) == (photo_jobs.RUNNING, 1)
+    assert claimed[orphan].attempts == 2
+    assert claimed[later].status == photo_jobs.PENDING
+    assert claimed[busy].attempts == 1 and claimed[done].status == photo_jobs.DONE
+    assert photo_jobs.claim(session, 10, now=NOW) == []
+
+
+def test_run_job_retries_with_backoff_then_gives_up(models, session, monkeypatch):
+    (job_id,) = _jobs(models, session, (photo_jobs.PENDING, NOW, None, 0))
+    monkeypatch.setattr(photo_jobs, 'process_photo', lambda photo: 'modèle indisponible')
+
+    photo_jobs.claim(session, 1, now=NOW)
+    assert photo_jobs.run_job(session, job_id, now=NOW) == photo_jobs.PENDING
+    job = session.get(models.PhotoJob, job_id)
+    assert job.run_after == (NOW + photo_jobs.backoff(1)).replace(tzinfo=None)
+    assert job.last_error == 'modèle indisponible' and job.locked_at is None
+
+    job.attempts = photo_jobs.MAX_ATTEMPTS - 1
+    session.commit()
+    photo_jobs.claim(session, 1, now=job.run_after.replace(tzinfo=timezone.utc))
+    assert photo_jobs.run_job(session, job_id, now=NOW) == photo_jobs.FAILED
+    assert session.get(models.PhotoJob, job_id).attempts == photo_jobs.MAX_ATTEMPTS
+
+
+def test_run_job_rolls_back_a_crashed_photo_and_keeps_the_job(models, session, monkeypatch):
+    (job_id,) = _jobs(models, session, (photo_jobs.PENDING, NOW, None, 0))
+
+    def crash(photo):
+        photo.perceptual_hash = 'incomplet'
+        raise RuntimeError('plantage')
+
+    monkeypatch.setattr(photo_jobs, 'process_photo', crash)
+    photo_jobs.claim(session, 1, now=NOW)
+    assert photo_jobs.run_job(session, job_id, now=NOW) == photo_jobs.PENDING
+    job = session.get(models.PhotoJob, job_id)
+    assert job.last_error == 'RuntimeError: plantage'
+    assert session.get(models.ItemPhoto, job.item_photo_id).perceptual_hash is None
+
+    monkeypatch.setattr(photo_jobs, 'process_photo', lambda photo: None)
+    photo_jobs.claim(session, 1, now=NOW + timedelta(hours=1))
+    assert photo_jobs.run_job(session, job_id) == photo_jobs.DONE
+    assert session.get(models.PhotoJob, job_id).last_error is None
+
+
+def test_release_returns_unstarted_jobs(models, session):
+    first, second = _jobs(models, session, (photo_jobs.PENDING, NOW, None, 0),
+                          (photo_jobs.PENDING, NOW, None, 2))
+    assert photo_jobs.claim(session, 2, now=NOW) == [first, second]
+    # Arrêt du worker après le premier : le second est rendu tel quel.
+    photo_jobs.release(session, [second])
+    job = session.get(models.PhotoJob, second)
+    assert (job.status, job.attempts, job.locked_at) == (photo_jobs.PENDING, 2, None)
+    assert session.get(models.PhotoJob, first).status == photo_jobs.RUNNING
+    assert photo_jobs.claim(session, 2, now=NOW) == [second]
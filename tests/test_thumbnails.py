@@ -0,0 +1,101 @@
+"""Tests pour thumbnails.py — Pillow seulement, sauf StoredVariants (base SQLite en mémoire, conftest.py)."""
+from io import BytesIO
+
+from PIL import Image
+
+import blob_store
+import thumbnails
+
+
+def _jpeg(width, height, orientation=None):
+    image = Image.new('RGB', (width, height), (200, 30, 30))
+    out = BytesIO()
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        image.save(out, 'JPEG', exif=exif)
+    else:
+        image.save(out, 'JPEG')
+    return out.getvalue()
+
+
+def test_variant_width_picks_smallest_covering_width():
+    assert thumbnails.variant_width(None) is None
+    assert thumbnails.variant_width(0) is None
+    assert thumbnails.variant_width(60) == 160
+    assert thumbnails.variant_width(160) == 160
+    assert thumbnails.variant_width(400) == 480
+    assert thumbnails.variant_width(1280) == 1280
+    assert thumbnails.variant_width(4000) is None
+
+
+def test_render_scales_and_applies_exif_orientation():
+    variant = thumbnails.render(_jpeg(2000, 1000), 480, 'webp')
+    with Image.open(BytesIO(variant)) as image:
+        assert image.format == 'WEBP' and image.size == (480, 240)
+    # Orientation 6 : photo prise en portrait, stockée couchée.
+    variant = thumbnails.render(_jpeg(2000, 1000, orientation=6), 160, 'jpeg')
+    with Image.open(BytesIO(variant)) as image:
+        assert image.format == 'JPEG' and image.size == (160, 320)
+
+
+def test_render_rejects_non_images():
+    assert thumbnails.render(b'pas une image', 160, 'webp') is None
+
+
+def test_cached_variant_reads_source_once(tmp_path):
+    cache = blob_store.DiskCache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    data = _jpeg(800, 600)
+    calls = []
+
+    def source():
+        calls.append(1)
+        return data
+
+    key = blob_store.blob_key(data)
+    first = thumbnails.cached_variant(cache, key, 160, 'webp', source)
+    second = thumbnails.cached_variant(cache, key, 160, 'webp', source)
+    assert first == second and len(calls) == 1
+    assert thumbnails.cached_variant(cache, key, 480, 'webp', source) != first
+    assert thumbnails.cached_variant(cache, 'absent', 160, 'webp', lambda: None) is None
+
+
+class FakeStore:
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, key):
+        return self.rows.get(key)
+
+    def put(self, key, source_key, width, fmt, data):
+        self.rows[key] = data
+
+
+def test_evicted_variant_is_read_back_from_the_store(tmp_path):
+    data = _jpeg(800, 600)
+    calls = []
+
+    def source():
+        calls.append(1)
+        return data
+
+    key = blob_store.blob_key(data)
+    store = FakeStore()
+    first = thumbnails.cached_variant(blob_store.DiskCache(str(tmp_path / 'a'), 10 * 1024 * 1024),
+                                      key, 160, 'jpeg', source, store=store)
+    assert list(store.rows) == [thumbnails.variant_key(key, 160, 'jpeg')]
+    # Nouveau disque (redéploiement) : la variante vient du store, pas de l'original.
+    second = thumbnails.cached_variant(blob_store.DiskCache(str(tmp_path / 'b'), 10 * 1024 * 1024),
+                                       key, 160, 'jpeg', source, store=store)
+    assert len(calls) == 1
+    with open(first, 'rb') as a, open(second, 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_stored_variants_round_trip_and_ignore_a_duplicate(models, session):
+    store = thumbnails.StoredVariants()
+    assert store.get('abc-w160.webp') is None
+    store.put('abc-w160.webp', 'abc', 160, 'webp', b'variante')
+    store.put('abc-w160.webp', 'abc', 160, 'webp', b'variante')
+    assert store.get('abc-w160.webp') == b'variante'
+    assert session.query(models.PhotoVariant).count() == 1
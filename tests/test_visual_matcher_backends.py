@@ -0,0 +1,72 @@
+"""Parité des moteurs de visual_matcher.py (torch float32, int8, ONNX).
+
+Contrairement aux autres tests, ceux-ci importent torch et transformers. Ils
+tournent sur un DINOv2 miniature aux poids aléatoires, construit localement :
+aucun téléchargement. La parité sur les vrais poids (plus lente, réseau ou
+cache Hugging Face requis) ne tourne qu'avec VISUAL_MATCHER_PARITY=1.
+"""
+import os
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+import visual_matcher  # noqa: E402
+
+MIN_COSINE = 0.99
+
+
+def _cosines(a, b):
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    torch.manual_seed(0)
+    config = transformers.Dinov2Config(hidden_size=64, num_hidden_layers=2, num_attention_heads=4,
+                                       intermediate_size=128, image_size=56, patch_size=14)
+    return transformers.Dinov2Model(config).eval()
+
+
+@pytest.fixture(scope="module")
+def pixels():
+    processor = transformers.BitImageProcessor(size={"shortest_edge": 64}, crop_size={"height": 56, "width": 56})
+    images = [visual_matcher._decode(data) for data in visual_matcher.sample_images(6, size=(160, 120))]
+    return processor(images=images, return_tensors="pt")["pixel_values"]
+
+
+def test_int8_backend_matches_fp32(tiny_model, pixels):
+    reference = visual_matcher.build_backend("torch", tiny_model)(pixels)
+    quantized = visual_matcher.build_backend("int8", tiny_model)(pixels)
+    assert quantized.shape == reference.shape == (6, 64)
+    assert _cosines(reference, quantized).min() >= MIN_COSINE
+
+
+def test_onnx_backend_matches_fp32(tiny_model, pixels, tmp_path):
+    pytest.importorskip("onnxruntime")
+    backend = visual_matcher.build_backend("onnx", tiny_model, str(tmp_path / "tiny.onnx"))
+    reference = visual_matcher.build_backend("torch", tiny_model)(pixels)
+    assert _cosines(reference, backend(pixels)).min() >= MIN_COSINE
+
+
+def test_unknown_backend_is_rejected(monkeypatch):
+    monkeypatch.setenv("VISUAL_MATCHER_BACKEND", "tpu")
+    with pytest.raises(ValueError):
+        visual_matcher.backend_name()
+
+
+@pytest.mark.skipif(os.environ.get("VISUAL_MATCHER_PARITY") != "1",
+                    reason="charge les vrais poids DINOv2 ; VISUAL_MATCHER_PARITY=1 pour l'activer")
+@pytest.mark.parametrize("name", ["int8", "onnx"])
+def test_real_weights_parity(name, tmp_path):
+    if name == "onnx":
+        pytest.importorskip("onnxruntime")
+    processor = transformers.AutoImageProcessor.from_pretrained(visual_matcher.MODEL_ID)
+    model = transformers.AutoModel.from_pretrained(visual_matcher.MODEL_ID).eval()
+    images = [visual_matcher._decode(data) for data in visual_matcher.sample_images(8)]
+    pixel_values = processor(images=images, return_tensors="pt")["pixel_values"]
+    reference = visual_matcher.build_backend("torch", model)(pixel_values)
+    candidate = visual_matcher.build_backend(name, model, str(tmp_path / "dinov2.onnx"))(pixel_values)
+    assert _cosines(reference, candidate).min() >= MIN_COSINE
@@ -0,0 +1,76 @@
+"""Découpage en lots et masque d'échec de visual_matcher.embed_images_bytes.
+
+Le modèle est remplacé par un double qui renvoie, pour chaque image, sa
+largeur et sa hauteur : on vérifie ainsi l'ordre des vecteurs sans DINOv2.
+visual_matcher importe torch au niveau module, d'où l'importorskip.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import visual_matcher  # noqa: E402
+
+
+class FakeBackend:
+    hidden_size = 2
+
+    def __init__(self, fail_on_call=None):
+        self.batches = []
+        self.fail_on_call = fail_on_call
+
+    def __call__(self, pixel_values):
+        self.batches.append(len(pixel_values))
+        if len(self.batches) == self.fail_on_call:
+            raise RuntimeError("lot en erreur")
+        return np.asarray([image.size for image in pixel_values], dtype=np.float32)
+
+
+def fake_processor(images, return_tensors):
+    # Le double du modèle lit directement les images décodées.
+    return {"pixel_values": list(images)}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    fake = FakeBackend()
+    monkeypatch.setattr(visual_matcher, "_sidecar", lambda: None)
+    monkeypatch.setattr(visual_matcher, "load_model", lambda: (fake, fake_processor))
+    return fake
+
+
+def _images(sizes):
+    return [visual_matcher.sample_images(1, size=size, seed=n)[0] for n, size in enumerate(sizes)]
+
+
+def test_undecodable_image_fails_only_its_own_row(backend):
+    good1, good2 = _images([(160, 120), (200, 100)])
+    vectors, failed = visual_matcher.embed_images_bytes([good1, b"pas une image", good2, b""], batch_size=8)
+    assert failed.tolist() == [False, True, False, True]
+    assert vectors.tolist() == [[160, 120], [0, 0], [200, 100], [0, 0]]
+    assert backend.batches == [2]
+
+
+def test_uneven_batches_keep_input_order(backend):
+    sizes = [(160 + n, 120 + n) for n in range(5)]
+    vectors, failed = visual_matcher.embed_images_bytes(_images(sizes), batch_size=2, decode_workers=3)
+    assert backend.batches == [2, 2, 1]
+    assert not failed.any()
+    assert vectors.tolist() == [list(size) for size in sizes]
+
+
+def test_failed_batch_only_marks_its_own_rows(backend):
+    backend.fail_on_call = 2
+    sizes = [(160 + n, 120) for n in range(5)]
+    vectors, failed = visual_matcher.embed_images_bytes(_images(sizes), batch_size=2)
+    assert failed.tolist() == [False, False, True, True, False]
+    assert vectors[4].tolist() == [164, 120]
+
+
+def test_unavailable_model_fails_every_row(monkeypatch):
+    monkeypatch.setattr(visual_matcher, "_sidecar", lambda: None)
+    monkeypatch.setattr(visual_matcher, "load_model", lambda: None)
+    vectors, failed = visual_matcher.embed_images_bytes(_images([(160, 120)] * 3))
+    assert vectors.shape == (3, 0)
+    assert failed.all()
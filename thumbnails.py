@@ -0,0 +1,124 @@
+"""Variantes réduites des photos servies par /uploads/<fichier>?w=<largeur>.
+
+Les cartes, les paires de /matches et les suggestions affichaient la photo
+d'origine — plusieurs Mo depuis un téléphone, jusqu'à 30 Mo acceptés — pour
+une vignette de quelques dizaines de pixels, ce qui se paie cher en 4G sur le
+site du festival. Chaque photo est déclinée en trois largeurs (WIDTHS), en
+WebP pour les navigateurs qui l'annoncent et en JPEG sinon.
+
+Une variante est calculée une seule fois par contenu, à sa première demande,
+sous une clé dérivée de l'empreinte de la photo d'origine : elle est écrite
+dans la table photo_variants, puis copiée dans le cache disque de blob_store
+d'où elle est resservie telle quelle (et en 304 via l'ETag). Le disque de
+Railway ne survit pas à un redéploiement et le cache évince : une variante
+absente du disque est relue en base, pas recalculée depuis l'original.
+"""
+import logging
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+_LOGGER = logging.getLogger(__name__)
+
+# Vignettes (cartes admin, suggestions), cartes de liste, agrandissement.
+WIDTHS = (160, 480, 1280)
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_width(requested: int | None) -> int | None:
+    """Plus petite largeur disponible couvrant `requested` ; None pour l'original."""
+    if not requested or requested <= 0:
+        return None
+    for width in WIDTHS:
+        if requested <= width:
+            return width
+    return None
+
+
+def variant_key(source_key: str, width: int, fmt: str) -> str:
+    """Clé de cache (et ETag) d'une variante : empreinte source, largeur, format."""
+    return f'{source_key}-w{width}.{fmt}'
+
+
+def mime_type(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+
+def render(data: bytes, width: int, fmt: str) -> bytes | None:
+    """Réduit l'image à `width` pixels de large (hauteur bornée à deux fois la largeur).
+
+    L'orientation EXIF est appliquée avant la réduction : les variantes ne
+    portent plus de métadonnées et s'afficheraient sinon couchées. Une image
+    déjà plus petite est seulement réencodée. None si le contenu n'est pas
+    une image lisible.
+    """
+    pil_format, _, options = FORMATS[fmt]
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.draft('RGB', (width, width * 2))  # décodage JPEG réduit, bien plus rapide
+            image = ImageOps.exif_transpose(image)
+            has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+            mode = 'RGBA' if pil_format == 'WEBP' and has_alpha else 'RGB'
+            if image.mode != mode:
+                image = image.convert(mode)
+            image.thumbnail((width, width * 2), Image.Resampling.LANCZOS)
+            out = BytesIO()
+            image.save(out, pil_format, **options)
+            return out.getvalue()
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        _LOGGER.warning("Variante %spx impossible à calculer", width, exc_info=True)
+        return None
+
+
+class StoredVariants:
+    """Variantes gardées dans la table photo_variants, derrière le cache disque."""
+
+    def get(self, key: str) -> bytes | None:
+        from app import db
+        from models import PhotoVariant
+
+        data = db.session.query(PhotoVariant.data).filter(PhotoVariant.key == key).scalar()
+        return bytes(data) if data else None
+
+    def put(self, key: str, source_key: str, width: int, fmt: str, data: bytes) -> None:
+        from app import db
+        from models import PhotoVariant
+
+        try:
+            db.session.add(PhotoVariant(key=key, source_key=source_key, width=width, format=fmt,
+                                        data=data, size_bytes=len(data)))
+            db.session.commit()
+        except Exception:
+            # Deux workers ont calculé la même variante : l'autre l'a déjà
+            # écrite, le contenu est le même.
+            db.session.rollback()
+            _LOGGER.debug("Variante %s déjà enregistrée", key, exc_info=True)
+
+
+def cached_variant(cache, source_key: str, width: int, fmt: str, source_bytes, store=None) -> str | None:
+    """Chemin de la variante dans `cache` (un blob_store.DiskCache), calculée au besoin.
+
+    Absente du disque, elle est relue dans `store` (un StoredVariants) ;
+    absente des deux, calculée depuis l'original puis écrite dans les deux.
+    `source_bytes` n'est donc appelée qu'une fois par variante : la photo
+    d'origine n'est pas relue pour une variante déjà calculée.
+    """
+    key = variant_key(source_key, width, fmt)
+    path = cache.get(key)
+    if path is not None:
+        return path
+    variant = store.get(key) if store is not None else None
+    if variant is None:
+        data = source_bytes()
+        if not data:
+            return None
+        variant = render(data, width, fmt)
+        if variant is None:
+            return None
+        if store is not None:
+            store.put(key, source_key, width, fmt, variant)
+    return cache.put(key, variant)
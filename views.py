@@ -3,12 +3,24 @@ import uuid
 import json
 import base64
 import requests
+import numpy as np
 from decimal import Decimal, ROUND_HALF_UP
 import matching
 import visual_matcher
 import zones
+import blob_store
+import thumbnails
+import exports
+import keyset_pagination
+import item_search
+import loan_search
+import loan_attachments
 from categories_families import guess_family
-from photo_embeddings import item_embedding_similarity
+from photo_embeddings import embedding_index
+from match_blocking import candidate_pairs
+from match_features import load_features
+from phash_index import perceptual_hash as compute_perceptual_hash, perceptual_hash_index
+import photo_jobs
 from registration_policy import compute_registration_open
 from io import BytesIO
 from datetime import datetime, timedelta, timezone
@@ -17,16 +29,16 @@ from types import SimpleNamespace
 from werkzeug.datastructures import FileStorage
 from flask import (
     Blueprint, render_template, redirect, url_for, abort,
-    flash, request, current_app, send_from_directory, make_response, jsonify
+    flash, request, current_app, send_from_directory, send_file, make_response, jsonify,
+    Response, stream_template, stream_with_context
 )
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.utils import secure_filename
+from werkzeug.utils import safe_join, secure_filename
 from sqlalchemy import or_
-import imagehash
-from PIL import Image, UnidentifiedImageError
+from sqlalchemy.orm import load_only, selectinload, undefer
 
 from app import app, db, limiter
-from models import Item, Category, Status, ItemPhoto, User, ActionLog, HeadphoneLoan, DepositType, LoanStatus, Match, RejectedPair, Product, Sale, SaleItem, PaymentMethod, ZClosure, AppSettings, PasswordResetToken
+from models import Item, Category, Status, ItemPhoto, User, ActionLog, HeadphoneLoan, LoanAttachment, DepositType, LoanStatus, Match, RejectedPair, Product, Sale, SaleItem, PaymentMethod, ZClosure, AppSettings, PasswordResetToken
 from forms import ItemForm, ClaimForm, ConfirmReturnForm, MatchForm, LoginForm, RegisterForm, DeleteForm, HeadphoneLoanForm, SimpleCsrfForm, ResetPasswordForm, ChangePasswordForm
 import password_reset
 from ocr_utils import extract_id_card_data
@@ -121,39 +133,22 @@ def _guess_mime_from_ext(filename: str) -> str | None:
 PERCEPTUAL_HASH_DISTANCE = 18
 
 
-def _perceptual_hash(image_bytes: bytes) -> str | None:
-    """Calcule un pHash stable sans charger de modèle ML."""
-    try:
-        with Image.open(BytesIO(image_bytes)) as image:
-            return str(imagehash.phash(image.convert('RGB'), hash_size=16))
-    except (UnidentifiedImageError, OSError, ValueError):
-        return None
-
-
-def _hamming_distance(hash_a: str | None, hash_b: str | None) -> int | None:
-    if not hash_a or not hash_b or len(hash_a) != len(hash_b):
-        return None
-    try:
-        return (int(hash_a, 16) ^ int(hash_b, 16)).bit_count()
-    except ValueError:
-        return None
-
-
 def find_visual_duplicates(perceptual_hash: str | None, limit: int = 10):
-    """Retourne les ItemPhoto proches, triés par distance de Hamming."""
+    """Retourne les ItemPhoto proches, triés par distance de Hamming.
+
+    La recherche passe par l'index en mémoire de phash_index.py : seuls les
+    hash candidats sont comparés, et seules les photos retenues sont lues en
+    base (sans leur contenu binaire).
+    """
     if not perceptual_hash:
         return []
-    # L'index réduit le coût des cas exactement identiques. Les autres hashes
-    # sont ensuite comparés en mémoire, car PostgreSQL n'offre pas un opérateur
-    # Hamming portable pour cette colonne hexadécimale.
-    photos = ItemPhoto.query.filter(ItemPhoto.perceptual_hash.isnot(None)).all()
-    matches = []
-    for photo in photos:
-        distance = _hamming_distance(perceptual_hash, photo.perceptual_hash)
-        if distance is not None and distance <= PERCEPTUAL_HASH_DISTANCE:
-            matches.append((photo, distance))
-    matches.sort(key=lambda entry: entry[1])
-    return matches[:limit]
+    found = perceptual_hash_index().query(perceptual_hash, PERCEPTUAL_HASH_DISTANCE, limit)
+    if not found:
+        return []
+    photos = {photo.id: photo for photo in ItemPhoto.query.options(
+        load_only(ItemPhoto.id, ItemPhoto.item_id, ItemPhoto.filename)
+    ).filter(ItemPhoto.id.in_([photo_id for photo_id, _, _ in found]))}
+    return [(photos[photo_id], distance) for photo_id, _, distance in found if photo_id in photos]
 
 
 def _primary_perceptual_hash(item: Item) -> str | None:
@@ -162,7 +157,7 @@ def _primary_perceptual_hash(item: Item) -> str | None:
 
 
 def _persist_item_photo(item: Item, file: FileStorage) -> ItemPhoto | None:
-    """Persiste toute ItemPhoto au même endroit, avec son hash perceptuel."""
+    """Persiste toute ItemPhoto au même endroit et la confie au worker photo."""
     if not (file and file.filename and allowed_file(file.filename) and _check_image_magic_bytes(file)):
         return None
     ext = os.path.splitext(file.filename)[1].lower()
@@ -174,74 +169,22 @@ def _persist_item_photo(item: Item, file: FileStorage) -> ItemPhoto | None:
         data=data,
         mime_type=_guess_mime_from_ext(filename),
         original_filename=file.filename,
-        perceptual_hash=_perceptual_hash(data),
     )
     db.session.add(photo)
-    # Pas d'appel à ensure_photo_embedding() ici : charger DINOv2 (et parfois
-    # télécharger ses poids) prenait des dizaines de secondes DANS la requête du
-    # bénévole, worker gunicorn bloqué pendant tout ce temps. Sur un festival
-    # cela figeait le site entier — deux workers suffisent à saturer.
-    # Les vecteurs sont désormais calculés hors requête par la commande
-    # `flask index-photo-embeddings`, à lancer périodiquement. En attendant,
-    # item_embedding_similarity() renvoie None et le score reste 100 % textuel.
+    # Ni pHash ni vecteur DINOv2 ici : charger le modèle (et parfois
+    # télécharger ses poids) prenait des dizaines de secondes DANS la requête
+    # du bénévole, worker gunicorn bloqué pendant tout ce temps. Le pHash et
+    # le vecteur sont calculés par `flask photo-worker` (photo_jobs.py)
+    # quelques secondes après l'enregistrement ; d'ici là la
+    # comparaison d'images renvoie None et le score reste textuel.
     db.session.flush()
+    photo_jobs.enqueue(db.session, photo)
     return photo
 
 
-def _db_image_bytes_by_filename(filename: str):
-    """Return (bytes, mime_type) for a known filename stored in DB, else (None, None).
-
-    Chaque source est interrogée séparément : un seul `try` englobant les quatre
-    faisait qu'une erreur sur la première (les produits de la boutique) empêchait
-    de chercher la photo de l'objet, et toutes les images disparaissaient d'un
-    coup sans la moindre trace. Les photos d'objets sont interrogées en premier
-    parce que c'est le cas courant.
-    """
-    if not filename:
-        return None, None
-
-    def _mime(valeur):
-        return valeur or _guess_mime_from_ext(filename) or 'application/octet-stream'
-
-    sources = (
-        ('photo objet',      lambda: ItemPhoto.query.filter_by(filename=filename).first(),
-         'data', 'mime_type'),
-        ('photo historique', lambda: Item.query.filter_by(photo_filename=filename).first(),
-         'photo_data', 'photo_mime_type'),
-        ('photo restitution', lambda: Item.query.filter_by(return_photo_filename=filename).first(),
-         'return_photo_data', 'return_photo_mime_type'),
-        ('produit boutique', lambda: Product.query.filter_by(image_filename=filename).first(),
-         'image_data', 'image_mime_type'),
-    )
-    for libelle, requete, champ_donnees, champ_mime in sources:
-        try:
-            ligne = requete()
-        except Exception:
-            # Une source en panne (table absente, modèle désynchronisé) ne doit
-            # pas masquer les autres : on note et on continue.
-            current_app.logger.exception("Recherche d'image impossible dans %s", libelle)
-            continue
-        donnees = getattr(ligne, champ_donnees, None) if ligne else None
-        if donnees:
-            return bytes(donnees), _mime(getattr(ligne, champ_mime, None))
-    return None, None
-
-
 def _item_pair_bonus(lost, found) -> float:
     """Bonus/malus catégorie + date + champs structurés pour une paire Lost↔Found."""
-    _cfg = matching.MATCH_CONFIG
-    bonus = matching.family_bonus(lost, found)
-    try:
-        if lost.date_reported and found.date_reported:
-            days = abs((lost.date_reported - found.date_reported).total_seconds()) / 86400.0
-            if days <= 2:
-                bonus += _cfg['bonus_date_close']
-            elif days > 14:
-                bonus -= _cfg['malus_date_far']
-    except Exception:
-        pass
-    bonus += matching.structured_field_bonus(lost, found)
-    return bonus
+    return matching.pair_bonus(matching.extract_features(lost), matching.extract_features(found))
 
 
 def _compute_weighted_score(base_score: float, img_img_pct: float | None, bonus: float) -> float:
@@ -262,15 +205,88 @@ def _embedding_similarity_pct(item1: Item, item2: Item) -> float | None:
     Returns ``None`` when either item has no ready embedding yet, so callers can
     fall back to the text-only score instead of treating it as 0% similarity.
     """
-    similarity = item_embedding_similarity(item1, item2)
-    if similarity is None:
+    similarity = float(embedding_index().pairwise([item1.id], [item2.id])[0, 0])
+    if np.isnan(similarity):
         return None
     return round(100.0 * max(0.0, similarity), 2)
 
 
-def find_similar_items(titre, category_id, seuil=None, location=''):
+def _item_display(obj) -> dict:
+    """Photo principale et icône de catégorie d'un objet affiché en suggestion.
+
+    Appelé uniquement pour les objets retenus (voir top_k_matches) : url_for et
+    get_icon_display coûtent cher multipliés par tous les candidats.
+    """
+    if hasattr(obj, 'photos') and obj.photos and len(obj.photos) > 0:
+        photo_url = url_for('main.uploaded_file', filename=obj.photos[0].filename, w=160)
+    elif obj.photo_filename:
+        photo_url = url_for('main.uploaded_file', filename=obj.photo_filename, w=160)
+    else:
+        photo_url = None
+    cat_icon_url = None
+    cat_icon_class = None
+    try:
+        if obj.category is not None:
+            icon_info = obj.category.get_icon_display()
+            if icon_info and isinstance(icon_info, dict):
+                if icon_info.get('type') == 'image':
+                    cat_icon_url = icon_info.get('url')
+                elif icon_info.get('type') == 'bootstrap':
+                    cat_icon_class = icon_info.get('class')
+    except Exception:
+        pass
+    return {
+        'photo_url': photo_url,
+        'category_icon_url': cat_icon_url,
+        'category_icon_class': cat_icon_class,
+    }
+
+
+def top_k_matches(item, k, threshold=None, candidats=None):
+    """Les `k` meilleurs candidats de statut opposé pour `item` : liste de (objet, score).
+
+    Les candidats retenus par le blocage (match_blocking.candidate_pairs, les
+    mêmes paires que sur /matches) sont scorés d'un bloc
+    (matching.pair_score_matrix), et seuls les `k` meilleurs scores sont
+    gardés au fil de l'eau
+    (matching.top_k) ; l'appelant ne prépare l'affichage que pour eux.
+    `candidats` évite de relire la liste opposée quand l'appelant l'a déjà.
+    """
+    if item.status not in (Status.LOST, Status.FOUND):
+        return []
+    if candidats is None:
+        opposite_status = Status.FOUND if item.status == Status.LOST else Status.LOST
+        candidats = Item.query.filter_by(status=opposite_status).all()
+    if not candidats:
+        return []
+    # Caractéristiques de l'objet et de tous les candidats en trois requêtes ;
+    # DINOv2 ne compare que des embeddings déjà persistés (jamais d'inférence
+    # dans ce chemin de requête) et le texte garde 100 % de son poids si la
+    # comparaison image est indisponible.
+    features = load_features(db.session, candidats + [item])
+    current_features = features[item.id]
+    opposes = {c.id: features[c.id] for c in candidats}
+    if item.status == Status.LOST:
+        retenus = {found_id for _, found_id in candidate_pairs({item.id: current_features}, opposes)}
+    else:
+        retenus = {lost_id for lost_id, _ in candidate_pairs(opposes, {item.id: current_features})}
+
+    # Seuls les candidats retenus par le blocage sont scorés.
+    candidats = [c for c in candidats if c.id in retenus]
+    if not candidats:
+        return []
+    autres = [features[c.id] for c in candidats]
+    if item.status == Status.LOST:
+        scores = matching.pair_score_matrix([current_features], autres)[0][0]
+    else:
+        scores = matching.pair_score_matrix(autres, [current_features])[0][:, 0]
+    return matching.top_k(zip(scores.tolist(), candidats), k, threshold)
+
+
+def find_similar_items(titre, category_id, seuil=None, location='', limite=None):
     """Retourne des objets similaires (même catégorie) triés par score descendant.
     Utilise le score complet (titre + description + lieu) via matching.match_score.
+    `limite` : au plus ce nombre d'objets, les meilleurs (tous par défaut).
 
     Le seuil par défaut vient de MATCH_CONFIG : la sonde n'a pas de description,
     or un champ vide face à un champ rempli score 0 et pèse malgré tout 0,25.
@@ -280,47 +296,25 @@ def find_similar_items(titre, category_id, seuil=None, location=''):
     if seuil is None:
         seuil = matching.MATCH_CONFIG['threshold_duplicate']
     similaires = []
-    probe = SimpleNamespace(title=titre or '', comments='', location=location or '')
+    probe = matching.extract_features(
+        SimpleNamespace(title=titre or '', comments='', location=location or ''), family=None)
     candidats = Item.query.filter(
         Item.category_id == category_id,
         Item.status.in_([Status.LOST, Status.FOUND])
     ).all()
-    for obj in candidats:
-        loc = obj.found_location if obj.status == Status.FOUND and obj.found_location else (obj.location or '')
-        candidate = SimpleNamespace(title=obj.title or '', comments=obj.comments or '', location=loc)
-        score = matching.match_score(probe, candidate)
-        if score >= seuil:
-            if hasattr(obj, 'photos') and obj.photos and len(obj.photos) > 0:
-                photo_url = url_for('main.uploaded_file', filename=obj.photos[0].filename)
-            elif obj.photo_filename:
-                photo_url = url_for('main.uploaded_file', filename=obj.photo_filename)
-            else:
-                photo_url = None
-            cat_icon_url = None
-            cat_icon_class = None
-            try:
-                if obj.category is not None:
-                    icon_info = obj.category.get_icon_display()
-                    if icon_info and isinstance(icon_info, dict):
-                        if icon_info.get('type') == 'image':
-                            cat_icon_url = icon_info.get('url')
-                        elif icon_info.get('type') == 'bootstrap':
-                            cat_icon_class = icon_info.get('class')
-            except Exception:
-                pass
-            similaires.append({
-                'id': obj.id,
-                'title': obj.title,
-                'score': score,
-                'confidence': matching.confidence_level(score),
-                'confidence_label': matching.confidence_label(score),
-                'category_name': obj.category.name if obj.category else None,
-                'photo_url': photo_url,
-                'category_icon_url': cat_icon_url,
-                'category_icon_class': cat_icon_class,
-                'url_detail': url_for('main.detail_item', item_id=obj.id)
-            })
-    similaires.sort(key=lambda x: x['score'], reverse=True)
+    features = load_features(db.session, candidats, with_vectors=False)
+    scored = ((matching.score_features(probe, features[obj.id]), obj) for obj in candidats)
+    for obj, score in matching.top_k(scored, limite or len(candidats), seuil):
+        similaires.append({
+            'id': obj.id,
+            'title': obj.title,
+            'score': score,
+            'confidence': matching.confidence_level(score),
+            'confidence_label': matching.confidence_label(score),
+            'category_name': obj.category.name if obj.category else None,
+            'url_detail': url_for('main.detail_item', item_id=obj.id),
+            **_item_display(obj),
+        })
     return similaires
 
 @bp.route('/choix-declaration')
@@ -509,14 +503,11 @@ def list_items():
     q = request.args.get('q', '', type=str).strip()
     from_date_str = request.args.get('from_date', type=str)
     to_date_str = request.args.get('to_date', type=str)
-    page = request.args.get('page', 1, type=int)
     query = Item.query.filter_by(status=st)
     if cat_filter:
         query = query.filter_by(category_id=cat_filter)
-    # Recherche texte basique sur titre/commentaires
-    if q:
-        like = f"%{q}%"
-        query = query.filter(or_(Item.title.ilike(like), Item.comments.ilike(like)))
+    # Plein texte classé par pertinence sur PostgreSQL, ILIKE ailleurs (item_search.py)
+    query, rank = item_search.apply_search(query, q, db.session.get_bind().dialect.name)
     # Filtre par date de création
     try:
         if from_date_str:
@@ -529,14 +520,29 @@ def list_items():
             query = query.filter(Item.date_reported < dt_end)
     except Exception:
         pass
-    pagination = query.order_by(Item.date_reported.desc()).paginate(page=page, per_page=12, error_out=False)
-    items = pagination.items
     categories = Category.query.order_by(Category.name).all()
+    # Projection des seules colonnes affichées par les cartes ; catégories et
+    # noms de fichiers des photos chargés en une requête chacun plutôt qu'un
+    # chargement paresseux par carte.
+    page_query = query.options(
+        load_only(Item.id, Item.status, Item.title, Item.comments, Item.location, Item.found_location,
+                  Item.storage_location, Item.date_reported, Item.category_id, Item.photo_filename),
+        selectinload(Item.category),
+        selectinload(Item.photos).load_only(ItemPhoto.id, ItemPhoto.item_id, ItemPhoto.filename),
+    )
+    pagination = keyset_pagination.paginate(page_query, Item.date_reported, Item.id, per_page=12,
+                                            after=request.args.get('after'),
+                                            before=request.args.get('before'), rank=rank)
+    total_cap = current_app.config.get('LIST_TOTAL_CAP', 0)
+    if total_cap:
+        pagination.total, pagination.total_exact = keyset_pagination.bounded_count(query, total_cap)
+    items = pagination.items
     # Construction des groupes pour affichage superposé
     seen = set()
     grouped_items = []
+    item_ids = [item.id for item in items]
     matches = Match.query.filter(
-        (Match.lost_id.in_([item.id for item in items])) | (Match.found_id.in_([item.id for item in items]))
+        (Match.lost_id.in_(item_ids)) | (Match.found_id.in_(item_ids))
     ).all()
     match_map = {}
     for m in matches:
@@ -546,7 +552,7 @@ def list_items():
         if item.id in seen:
             continue
         match_id = match_map.get(item.id)
-        if match_id and match_id in [i.id for i in items]:
+        if match_id and match_id in item_ids:
             other = next(i for i in items if i.id == match_id)
             grouped_items.append([item, other])
             seen.add(item.id)
@@ -554,17 +560,10 @@ def list_items():
         else:
             grouped_items.append([item])
             seen.add(item.id)
-    # Optimisation : pré-calcule les ids des items affichés
-    all_items = [item for group in grouped_items for item in group]
-    item_ids = [item.id for item in all_items]
-    matches = Match.query.filter(
-        (Match.lost_id.in_(item_ids)) | (Match.found_id.in_(item_ids))
-    ).all()
-    matched_ids = set()
-    for m in matches:
-        matched_ids.add(m.lost_id)
-        matched_ids.add(m.found_id)
-    matches_map = {item.id: (item.id in matched_ids) for item in all_items}
+    # Les groupes ne contiennent que des objets de la page : la requête
+    # ci-dessus suffit pour savoir lesquels sont déjà liés.
+    matched_ids = set(match_map)
+    matches_map = {item_id: (item_id in matched_ids) for item_id in item_ids}
     # Pré-calcul des icônes Bootstrap pour optimiser l'affichage
     for cat in categories:
         _ = cat.icon_bootstrap_class  # force le calcul, utile pour SQLAlchemy lazy loading
@@ -620,7 +619,7 @@ def report_item():
             return render_template('report.html', lost_form=lost_form, found_form=found_form, active_tab='lost')
         lost_zone = zones.resolve(lost_form.location.data, lost_form.location_other.data)
         if current_app.config.get('DECLARATION_CHECKS'):
-            if find_similar_items(lost_form.title.data, category_id, location=lost_zone):
+            if find_similar_items(lost_form.title.data, category_id, location=lost_zone, limite=1):
                 flash("Attention : des objets similaires existent déjà !", "lost")
         item = Item(
             status=Status.LOST,
@@ -660,7 +659,7 @@ def report_item():
             return render_template('report.html', lost_form=lost_form, found_form=found_form, active_tab='found')
         found_zone = zones.resolve(found_form.found_location.data, found_form.found_location_other.data)
         if current_app.config.get('DECLARATION_CHECKS'):
-            if find_similar_items(found_form.title.data, category_id, location=found_zone):
+            if find_similar_items(found_form.title.data, category_id, location=found_zone, limite=1):
                 flash("Attention : des objets similaires existent déjà !", "found")
         item = Item(
             status=Status.FOUND,
@@ -780,45 +779,11 @@ def detail_item(item_id):
     if item.status in (Status.LOST, Status.FOUND):
         opposite_status = Status.FOUND if item.status == Status.LOST else Status.LOST
         candidats = Item.query.filter_by(status=opposite_status).all()
-        # Construire des suggestions scorées
-        def to_matchable(i: Item):
-            loc = i.found_location if i.status == Status.FOUND and i.found_location else i.location
-            return SimpleNamespace(title=i.title or '', comments=i.comments or '', location=loc or '')
-        current_matchable = to_matchable(item)
-
-        for c in candidats:
-            m = to_matchable(c)
-            base_score = matching.match_score(current_matchable, m)
-            # Bonus catégorie + date via helper partagé
-            lost_item  = item if item.status == Status.LOST else c
-            found_item = c    if item.status == Status.LOST else item
-            bonus = _item_pair_bonus(lost_item, found_item)
-            # DINOv2 ne compare que deux images, via des embeddings déjà persistés
-            # à l'upload (jamais d'inférence dans ce chemin de requête).
-            img_img_pct = _embedding_similarity_pct(lost_item, found_item)
-            # Le texte garde 100 % de son poids si la comparaison image est indisponible.
-            final_score = _compute_weighted_score(base_score, img_img_pct, bonus)
-            # Photo principale
-            if hasattr(c, 'photos') and c.photos and len(c.photos) > 0:
-                photo_url = url_for('main.uploaded_file', filename=c.photos[0].filename)
-            elif c.photo_filename:
-                photo_url = url_for('main.uploaded_file', filename=c.photo_filename)
-            else:
-                photo_url = None
-            # Préparer info d'icône de catégorie (si pas de photo)
-            cat_icon_class = None
-            cat_icon_url = None
-            try:
-                if c.category is not None:
-                    icon_info = c.category.get_icon_display()
-                    if icon_info and isinstance(icon_info, dict):
-                        if icon_info.get('type') == 'image':
-                            cat_icon_url = icon_info.get('url')
-                        elif icon_info.get('type') == 'bootstrap':
-                            cat_icon_class = icon_info.get('class')
-            except Exception:
-                pass
-
+        # Un candidat de plus que ce qui est affiché : suffit pour savoir s'il
+        # faut proposer « Voir plus ».
+        meilleurs = top_k_matches(item, 11, candidats=candidats)
+        has_more = len(meilleurs) > 10
+        for c, final_score in meilleurs[:10]:
             suggestions.append({
                 'id': c.id,
                 'title': c.title,
@@ -826,17 +791,11 @@ def detail_item(item_id):
                 'confidence': matching.confidence_level(final_score),
                 'confidence_label': matching.confidence_label(final_score),
                 'url_detail': url_for('main.detail_item', item_id=c.id),
-                'photo_url': photo_url,
                 'category_name': (c.category.name if c.category else None),
                 'meta_location': (c.found_location if c.status == Status.FOUND else c.location),
                 'date_reported': c.date_reported,
-                'category_icon_class': cat_icon_class,
-                'category_icon_url': cat_icon_url
+                **_item_display(c),
             })
-        # Trier desc et limiter à top 10
-        suggestions.sort(key=lambda x: x['score'], reverse=True)
-        has_more = len(suggestions) > 10
-        suggestions = suggestions[:10]
         # Lien "Voir plus" vers la liste opposée filtrée par catégorie
         try:
             more_url = url_for('main.list_items', status=opposite_status.value, category=item.category_id)
@@ -1003,64 +962,132 @@ def export_items(status):
     except ValueError:
         st = Status.LOST
 
+    if request.args.get('format') == 'zip':
+        # Archive complète (photos d'origine + manifestes), sans plafond.
+        response = Response(stream_with_context(exports.zip_export(st)), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename=export_{st.value}.zip'
+        return response
+
     EXPORT_LIMIT = 1000
-    items = Item.query.filter_by(status=st).filter(Item.status != Status.PENDING_DELETION).order_by(Item.date_reported.desc()).limit(EXPORT_LIMIT).all()
-    items_export = []
-    for item in items:
-        photo_b64 = None
-        photo_filename = None
-        mime = ''
-
-        # Si plusieurs photos (relation), prendre la première sinon utiliser photo_filename
-        if hasattr(item, 'photos') and item.photos and len(item.photos) > 0:
-            p0 = item.photos[0]
-            photo_filename = p0.filename
-            if getattr(p0, 'data', None):
-                photo_b64 = base64.b64encode(bytes(p0.data)).decode('utf-8')
-                mime = p0.mime_type or _guess_mime_from_ext(photo_filename) or ''
-        elif item.photo_filename:
-            photo_filename = item.photo_filename
-            if getattr(item, 'photo_data', None):
-                photo_b64 = base64.b64encode(bytes(item.photo_data)).decode('utf-8')
-                mime = item.photo_mime_type or _guess_mime_from_ext(photo_filename) or ''
-
-        # Fallback disque (anciennes images)
-        if photo_filename and not photo_b64:
-            try:
-                chemin = os.path.join(current_app.config['UPLOAD_FOLDER'], photo_filename)
-                with open(chemin, 'rb') as img_file:
-                    photo_b64 = base64.b64encode(img_file.read()).decode('utf-8')
-                mime = _guess_mime_from_ext(photo_filename) or ''
-            except Exception:
-                photo_b64 = None
-                mime = ''
-        items_export.append({
-            **item.__dict__,
-            'category': item.category,
-            'photo_filename': photo_filename,
-            'photo_base64': photo_b64,
-            'photo_mime': mime
-        })
-    html = render_template('export_template.html', items=items_export, status=st.value)
-    response = make_response(html)
+    # Page rendue au fil de l'eau : les objets sont relus par lots de 100 et
+    # chaque photo est embarquée en vignette 160 px (affichée à 120 px) tirée
+    # du cache des variantes, plutôt que l'original de plusieurs Mo en base64.
+    # Lots par ids plutôt qu'un curseur ouvert : blob_store peut committer
+    # pendant le rendu (première lecture d'un fichier).
+    item_ids = [item_id for (item_id,) in db.session.query(Item.id)
+                .filter(Item.status == st, Item.status != Status.PENDING_DELETION)
+                .order_by(Item.date_reported.desc()).limit(EXPORT_LIMIT)]
+
+    def items():
+        for start in range(0, len(item_ids), 100):
+            batch = item_ids[start:start + 100]
+            by_id = {item.id: item for item in Item.query.options(
+                selectinload(Item.category), selectinload(Item.photos)).filter(Item.id.in_(batch))}
+            yield from (by_id[item_id] for item_id in batch if item_id in by_id)
+
+    def rows():
+        for item in items():
+            photo_filename = item.photos[0].filename if item.photos else item.photo_filename
+            photo_b64 = None
+            if photo_filename:
+                try:
+                    found = _variant_source(photo_filename)
+                    path = found and thumbnails.cached_variant(
+                        blob_store.disk_cache(), found[0], thumbnails.WIDTHS[0], 'jpeg', found[1])
+                except Exception:
+                    current_app.logger.exception("Vignette d'export impossible pour %s", photo_filename)
+                    path = None
+                if path:
+                    with open(path, 'rb') as handle:
+                        photo_b64 = base64.b64encode(handle.read()).decode('utf-8')
+            yield SimpleNamespace(
+                id=item.id, category=item.category, title=item.title, comments=item.comments,
+                item_color=item.item_color, item_brand=item.item_brand,
+                item_distinctive=item.item_distinctive, location=item.location,
+                date_reported=item.date_reported, reporter_name=item.reporter_name,
+                reporter_email=item.reporter_email, reporter_phone=item.reporter_phone,
+                claimant_name=item.claimant_name, claimant_email=item.claimant_email,
+                claimant_phone=item.claimant_phone, return_date=item.return_date,
+                return_comment=item.return_comment, photo_filename=photo_filename,
+                photo_base64=photo_b64, photo_mime='image/jpeg' if photo_b64 else '',
+            )
+
+    response = Response(stream_template('export_template.html', items=rows(), status=st.value))
     response.headers['Content-Type'] = 'text/html; charset=utf-8'
     response.headers['Content-Disposition'] = f'attachment; filename=export_{st.value}.html'
     return response
 
 
+def _variant_source(filename: str):
+    """(empreinte source, lecteur des octets d'origine) de la photo, None si introuvable."""
+    disk_path = safe_join(current_app.config['UPLOAD_FOLDER'], filename)
+    if disk_path and os.path.isfile(disk_path):
+        # Fichier historique sur disque : son nom (uuid) ne change jamais de
+        # contenu, il suffit à identifier la source sans la relire.
+        def source():
+            with open(disk_path, 'rb') as handle:
+                return handle.read()
+        return blob_store.blob_key(f'disk:{filename}'.encode()), source
+
+    ref, data = blob_store.lookup(filename)
+    if ref is None:
+        return None
+
+    def source():
+        return data if data is not None else blob_store.load(ref)
+    return ref.blob_key, source
+
+
+def _photo_variant(filename: str, width: int):
+    """Réponse servant la variante `width` de la photo, None si elle est introuvable."""
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    found = _variant_source(filename)
+    if found is None:
+        return None
+    source_key, source = found
+    etag = thumbnails.variant_key(source_key, width, fmt)
+    if etag in request.if_none_match:
+        resp = make_response('', 304)
+        resp.set_etag(etag)
+    else:
+        path = thumbnails.cached_variant(blob_store.disk_cache(), source_key, width, fmt, source,
+                                         store=thumbnails.StoredVariants())
+        if path is None:
+            return None
+        resp = send_file(path, mimetype=thumbnails.mime_type(fmt), etag=etag, conditional=True, max_age=31536000)
+    resp.headers['Cache-Control'] = 'public, max-age=31536000'
+    # Le format dépend de l'en-tête Accept : un cache intermédiaire ne doit pas
+    # resservir du WebP à un navigateur qui ne l'a pas demandé.
+    resp.vary.add('Accept')
+    return resp
+
+
 @bp.route('/uploads/<filename>')
 @login_required
 def uploaded_file(filename):
+    # ?w= : variante réduite (thumbnails.py) ; l'original reste servi si la
+    # largeur demandée dépasse les variantes ou si le calcul échoue.
+    width = thumbnails.variant_width(request.args.get('w', type=int))
+    if width:
+        resp = _photo_variant(filename, width)
+        if resp is not None:
+            return resp
     try:
         return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
     except Exception:
         pass
-    data, mime = _db_image_bytes_by_filename(filename)
-    if data:
-        resp = make_response(data)
-        resp.headers['Content-Type'] = mime or 'application/octet-stream'
+    # Image en base : l'association nom → empreinte (blob_store) donne l'ETag
+    # sans lire le contenu, puis les octets sont servis depuis le cache disque.
+    ref, data = blob_store.lookup(filename)
+    if ref is not None and ref.blob_key in request.if_none_match:
+        resp = make_response('', 304)
+        resp.set_etag(ref.blob_key)
         resp.headers['Cache-Control'] = 'public, max-age=31536000'
         return resp
+    path = blob_store.cached_path(ref, data) if ref is not None else None
+    if path:
+        return send_file(path, mimetype=ref.mime_type or _guess_mime_from_ext(filename) or 'application/octet-stream',
+                         etag=ref.blob_key, conditional=True, max_age=31536000)
     # Tracé : une image manquante ne doit pas rester un 404 muet, c'est ce qui
     # a rendu le diagnostic si long.
     current_app.logger.warning("Image introuvable, ni sur disque ni en base : %s", filename)
@@ -1081,43 +1108,46 @@ def api_check_similar():
     current_status = request.form.get('status', '')  # 'lost' ou 'found'
 
     # Doublons (même statut)
-    similars = find_similar_items(titre, cat_id, location=location)
+    similars = find_similar_items(titre, cat_id, location=location, limite=10)
 
     # Correspondances croisées (statut opposé) — preview temps réel
     candidates = []
     if current_status in ('lost', 'found'):
         opposite = Status.FOUND if current_status == 'lost' else Status.LOST
-        probe = SimpleNamespace(
+        probe = matching.extract_features(SimpleNamespace(
             title=titre, comments='', location=location or '',
             item_color=colors_raw, item_brand=brand_raw, item_distinctive=dist_raw
-        )
+        ), family=None)
         opp_items = Item.query.filter(
             Item.category_id == cat_id,
             Item.status == opposite,
         ).order_by(Item.date_reported.desc()).limit(200).all()
+        features = load_features(db.session, opp_items, with_vectors=False)
         # Les candidats sont filtrés sur la même catégorie que la déclaration en
         # cours : on applique donc le même bonus que sur la fiche objet, sans
         # quoi l'aperçu serait systématiquement plus sévère que /item/<id>.
         same_cat_bonus = matching.MATCH_CONFIG['bonus_same_category']
-        for obj in opp_items:
-            struct_b = matching.structured_field_bonus(probe, obj)
-            threshold = matching.effective_threshold(struct_b)
-            base = matching.match_score(probe, obj)
-            score = matching.apply_bonus(base, struct_b + same_cat_bonus)
-            if score >= threshold:
-                candidates.append({
-                    'id': obj.id,
-                    'title': obj.title,
-                    'category': obj.category.name if obj.category else '',
-                    'score': score,
-                    'confidence': matching.confidence_level(score),
-                    'confidence_label': matching.confidence_label(score),
-                    'date': obj.date_reported.strftime('%d/%m/%Y') if obj.date_reported else '',
-                    'item_color': obj.item_color or '',
-                    'item_brand': obj.item_brand or '',
-                })
-        candidates.sort(key=lambda x: -x['score'])
-        candidates = candidates[:5]
+
+        def scored():
+            for obj in opp_items:
+                struct_b = matching.structured_bonus(probe, features[obj.id])
+                base = matching.score_features(probe, features[obj.id])
+                score = matching.apply_bonus(base, struct_b + same_cat_bonus)
+                if score >= matching.effective_threshold(struct_b):
+                    yield score, obj
+
+        for obj, score in matching.top_k(scored(), 5):
+            candidates.append({
+                'id': obj.id,
+                'title': obj.title,
+                'category': obj.category.name if obj.category else '',
+                'score': score,
+                'confidence': matching.confidence_level(score),
+                'confidence_label': matching.confidence_label(score),
+                'date': obj.date_reported.strftime('%d/%m/%Y') if obj.date_reported else '',
+                'item_color': obj.item_color or '',
+                'item_brand': obj.item_brand or '',
+            })
 
     return jsonify({'similars': similars, 'candidates': candidates})
 
@@ -1132,7 +1162,7 @@ def api_check_visual_duplicates():
         if not (uploaded and uploaded.filename and allowed_file(uploaded.filename)
                 and _check_image_magic_bytes(uploaded)):
             continue
-        perceptual_hash = _perceptual_hash(uploaded.read())
+        perceptual_hash = compute_perceptual_hash(uploaded.read())
         uploaded.seek(0)
         for photo, distance in find_visual_duplicates(perceptual_hash):
             item = photo.item
@@ -1144,7 +1174,7 @@ def api_check_visual_duplicates():
                 'title': item.title,
                 'distance': distance,
                 'url_detail': url_for('main.detail_item', item_id=item.id),
-                'photo_url': url_for('main.uploaded_file', filename=photo.filename),
+                'photo_url': url_for('main.uploaded_file', filename=photo.filename, w=160),
             })
     matches.sort(key=lambda row: row['distance'])
     return jsonify({'duplicates': matches[:10]})
@@ -1234,10 +1264,13 @@ def headphone_loans():
     form = HeadphoneLoanForm()
     search = request.args.get('q', '', type=str).strip()
     page = request.args.get('page', 1, type=int)
+    # Ni signature ni pièce d'identité (table loan_attachments) : la signature
+    # est servie à part, au moment où on ouvre sa fenêtre.
     query = HeadphoneLoan.query
     sort = request.args.get('sort', 'date')
-    if search:
-        query = query.filter((HeadphoneLoan.first_name.ilike(f'%{search}%')) | (HeadphoneLoan.last_name.ilike(f'%{search}%')))
+    pattern = loan_search.like_pattern(search)
+    if pattern:
+        query = query.filter(HeadphoneLoan.search_key.like(pattern))
     # Exclure les prêts en attente de suppression
     query = query.filter(HeadphoneLoan.status != LoanStatus.PENDING_DELETION)
     if sort == 'name':
@@ -1247,16 +1280,14 @@ def headphone_loans():
     pagination = query.paginate(page=page, per_page=25, error_out=False)
     loans = pagination.items
     if form.validate_on_submit():
-        id_card_photo_b64 = None
+        id_card_photo = None
         if form.deposit_type.data == 'id_card' and 'id_card_photo' in request.files:
             file = request.files['id_card_photo']
             if file and file.filename:
                 if not allowed_file(file.filename) or not _check_image_magic_bytes(file):
                     flash("La photo de carte d'identité doit être une image JPEG ou PNG valide.", "danger")
                     return redirect(url_for('main.headphone_loans'))
-                img_bytes = file.read()
-                mime_type = _guess_mime_from_ext(file.filename)
-                id_card_photo_b64 = f'data:{mime_type};base64,' + base64.b64encode(img_bytes).decode('utf-8')
+                id_card_photo = (_guess_mime_from_ext(file.filename), file.read())
         loan = HeadphoneLoan(
             first_name=form.first_name.data,
             last_name=form.last_name.data,
@@ -1265,8 +1296,9 @@ def headphone_loans():
             deposit_details=form.deposit_details.data,
             quantity=form.quantity.data or 1,
             deposit_amount=form.deposit_amount.data if form.deposit_type.data == 'cash' else None,
-            id_card_photo=id_card_photo_b64
         )
+        if id_card_photo is not None:
+            loan_attachments.attach(loan, loan_attachments.ID_CARD, *id_card_photo)
         db.session.add(loan)
         db.session.commit()
         flash("Prêt enregistré !", "success")
@@ -1281,6 +1313,58 @@ def train_schedule():
 def shuttle_page():
     return render_template('shuttle.html')
 
+@bp.route('/loans/search')
+@login_required
+def search_headphone_loans():
+    """Recherche instantanée par nom pour le comptoir des retours (JSON, voir loan_search.py)."""
+    rows, truncated = loan_search.search(request.args.get('q', '', type=str))
+    results = []
+    for row in rows:
+        results.append({
+            'id': row['id'],
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'phone': row['phone'],
+            'quantity': row['quantity'],
+            'deposit_type': row['deposit_type'].value if row['deposit_type'] else '',
+            'deposit_details': row['deposit_details'] or '',
+            'deposit_amount': f"{row['deposit_amount']:.2f}" if row['deposit_amount'] else '',
+            'loan_date': row['loan_date'].strftime('%d/%m/%Y %H:%M') if row['loan_date'] else '',
+            'return_date': row['return_date'].strftime('%d/%m/%Y %H:%M') if row['return_date'] else '',
+            'status': row['status'].name,
+            'return_url': url_for('main.return_headphone_loan', loan_id=row['id']),
+            'deletion_url': url_for('main.request_loan_deletion', loan_id=row['id']),
+            'signature_url': (url_for('main.headphone_loan_attachment', loan_id=row['id'],
+                                      kind=loan_attachments.SIGNATURE)
+                              if row['signature_present'] else None),
+        })
+    return jsonify({'results': results, 'truncated': truncated})
+
+
+@bp.route('/loans/<int:loan_id>/attachments/<kind>')
+@login_required
+def headphone_loan_attachment(loan_id, kind):
+    """Signature ou pièce d'identité d'un prêt (table loan_attachments, voir loan_attachments.py).
+
+    L'empreinte du contenu sert d'ETag : une image déjà vue par le navigateur
+    est revalidée sans que ses octets soient lus.
+    """
+    if kind not in loan_attachments.KINDS:
+        abort(404)
+    if kind in loan_attachments.ADMIN_ONLY_KINDS and not current_user.is_admin:
+        abort(403)
+    attachment = LoanAttachment.query.filter_by(loan_id=loan_id, kind=kind).first_or_404()
+    if attachment.content_hash in request.if_none_match:
+        resp = make_response('', 304)
+        resp.set_etag(attachment.content_hash)
+    else:
+        resp = send_file(BytesIO(attachment.data), mimetype=attachment.mime_type,
+                         etag=attachment.content_hash, conditional=True, max_age=3600)
+    # Donnée personnelle : jamais dans un cache partagé.
+    resp.headers['Cache-Control'] = 'private, max-age=3600'
+    return resp
+
+
 @bp.route('/loans/<int:loan_id>/request_deletion', methods=['POST'])
 @login_required
 def request_loan_deletion(loan_id):
@@ -1334,13 +1418,13 @@ def return_headphone_loan(loan_id):
     prefix = 'data:image/png;base64,'
     if not isinstance(signature, str) or not signature.startswith(prefix):
         return jsonify({'success': False, 'error': 'Format de signature invalide'}), 400
-    try:
-        signature_bytes = base64.b64decode(signature[len(prefix):], validate=True)
-    except (ValueError, TypeError):
+    decoded = loan_attachments.decode_data_url(signature)
+    if decoded is None:
         return jsonify({'success': False, 'error': 'Signature invalide'}), 400
+    signature_bytes = decoded[1]
     if not signature_bytes.startswith(b'\x89PNG\r\n\x1a\n') or len(signature_bytes) > 2 * 1024 * 1024:
         return jsonify({'success': False, 'error': 'Signature invalide ou trop volumineuse'}), 400
-    loan.signature = signature
+    loan_attachments.attach(loan, loan_attachments.SIGNATURE, 'image/png', signature_bytes)
     loan.return_date = datetime.now(timezone.utc)
     db.session.commit()
     return {'success': True}
@@ -1351,7 +1435,8 @@ def return_headphone_loan(loan_id):
 def get_all_candidate_pairs(seuil=None, skip_set=None):
     """Calcule toutes les paires Lost↔Found dont le score >= seuil.
     skip_set: ensemble de tuples (lost_id, found_id) à ignorer (déjà validés/rejetés si non affichés).
-    Utilise _compute_weighted_score pour que les scores soient identiques à ceux de detail_item.
+    Utilise matching.pair_scores sur les seules paires retenues par le blocage,
+    avec les mêmes scores que detail_item.
     Compare les images via les embeddings DINOv2 déjà persistés : jamais d'inférence
     (donc jamais de N×M appels modèle) dans cette boucle O(lost × found).
 
@@ -1365,35 +1450,99 @@ def get_all_candidate_pairs(seuil=None, skip_set=None):
     pairs = []
     lost_items  = Item.query.filter_by(status=Status.LOST).all()
     found_items = Item.query.filter_by(status=Status.FOUND).all()
-    fields_weights = matching.MATCH_CONFIG['fields_weights']
-
-    for lost in lost_items:
-        for found in found_items:
-            if skip_set and (lost.id, found.id) in skip_set:
-                continue
-            base_score = matching.match_score(lost, found, fields_weights)
-            bonus = _item_pair_bonus(lost, found)
-            img_img_pct = _embedding_similarity_pct(lost, found)
-            score = _compute_weighted_score(base_score, img_img_pct, bonus)
-            if score >= seuil:
-                pairs.append((lost, found, round(score, 2)))
+    features = load_features(db.session, lost_items + found_items)
+    # Blocage : les paires sans aucune clé commune (mot, couleur, marque,
+    # famille) ne sont pas retenues, cf. match_blocking.py.
+    candidates = candidate_pairs({i.id: features[i.id] for i in lost_items},
+                                 {i.id: features[i.id] for i in found_items})
+    if skip_set:
+        candidates -= set(skip_set)
+    # Seules les paires retenues sont scorées, jamais la grille entière.
+    lost_row = {item.id: i for i, item in enumerate(lost_items)}
+    found_col = {item.id: j for j, item in enumerate(found_items)}
+    index_pairs = sorted((lost_row[lost_id], found_col[found_id]) for lost_id, found_id in candidates)
+    scores, _, _, _ = matching.pair_scores([features[i.id] for i in lost_items],
+                                           [features[i.id] for i in found_items], index_pairs)
+
+    for (i, j), score in zip(index_pairs, scores.tolist()):
+        if score >= seuil:
+            pairs.append((lost_items[i], found_items[j], score))
     return pairs
 
 MATCHES_PER_PAGE = 25
 
 
-@bp.route('/matches')
-@login_required
-def list_matches():
-    _default_seuil = matching.MATCH_CONFIG['threshold_default']
-    try:
-        seuil = int(request.args.get('threshold', _default_seuil))
-    except (TypeError, ValueError):
-        seuil = _default_seuil
-    page = request.args.get('page', 1, type=int) or 1
-    show_validated = request.args.get('show_validated', '0') == '1'
-    show_rejected  = request.args.get('show_rejected',  '0') == '1'
+def _paginate(total_visible, page):
+    total_pages = max(1, (total_visible + MATCHES_PER_PAGE - 1) // MATCHES_PER_PAGE)
+    page = min(max(1, page), total_pages)
+    return page, total_pages
+
+
+def _matches_page_from_table(seuil, page, show_validated, show_rejected):
+    """Page de /matches lue dans match_candidates : tri et pagination en SQL.
 
+    Les scores ont été calculés à l'écriture (voir match_candidates.py) ; ici on
+    ne fait que filtrer, compter et paginer sur un index (engine_version, score).
+    """
+    import match_candidates
+    from sqlalchemy import and_, case, exists, func
+    from sqlalchemy.orm import aliased, selectinload
+    from models import MatchCandidate
+
+    mc = MatchCandidate
+    lost_item = aliased(Item)
+    found_item = aliased(Item)
+    # Match et RejectedPair peuvent avoir été enregistrés dans les deux sens.
+    is_validated = exists().where(or_(
+        and_(Match.lost_id == mc.lost_id, Match.found_id == mc.found_id),
+        and_(Match.lost_id == mc.found_id, Match.found_id == mc.lost_id),
+    ))
+    is_rejected = exists().where(or_(
+        and_(RejectedPair.lost_id == mc.lost_id, RejectedPair.found_id == mc.found_id),
+        and_(RejectedPair.lost_id == mc.found_id, RejectedPair.found_id == mc.lost_id),
+    ))
+    base_filters = (
+        mc.engine_version == match_candidates.engine_version(),
+        mc.score >= seuil,
+        lost_item.status == Status.LOST,
+        found_item.status == Status.FOUND,
+    )
+
+    def _scoped(query):
+        return (query.join(lost_item, lost_item.id == mc.lost_id)
+                     .join(found_item, found_item.id == mc.found_id)
+                     .filter(*base_filters))
+
+    # Un seul passage pour les trois compteurs (validée prime sur rejetée,
+    # comme dans le calcul complet).
+    bucket = case((is_validated, 'validated'), (is_rejected, 'rejected'), else_='pending')
+    stats = {'pending': 0, 'validated': 0, 'rejected': 0}
+    for name, count in _scoped(db.session.query(bucket, func.count(mc.id))).group_by(bucket):
+        stats[name] = count
+
+    hidden = []
+    if not show_validated:
+        hidden.append(~is_validated)
+    if not show_rejected:
+        hidden.append(~is_rejected)
+    total_visible = _scoped(db.session.query(func.count(mc.id))).filter(*hidden).scalar()
+    page, total_pages = _paginate(total_visible, page)
+
+    query = _scoped(db.session.query(
+        mc, lost_item, found_item, is_validated.label('v'), is_rejected.label('r'))).filter(*hidden)
+    rows = (query.options(selectinload(lost_item.photos), selectinload(found_item.photos),
+                          selectinload(lost_item.category), selectinload(found_item.category))
+                 .order_by(mc.score.desc(), mc.id)
+                 .offset((page - 1) * MATCHES_PER_PAGE)
+                 .limit(MATCHES_PER_PAGE)
+                 .all())
+    page_slice = [(lost, found, cand.score, bool(v), bool(r))
+                  for cand, lost, found, v, r in rows]
+    return page_slice, stats, page, total_pages, total_visible
+
+
+def _matches_page_live(seuil, page, show_validated, show_rejected):
+    """Page de /matches calculée à la volée (seuils sous le plancher de stockage)."""
     # Précharger les sets validés/rejetés AVANT le scoring pour éviter les calculs inutiles
     validated_set = set()
     for m in Match.query.all():
@@ -1439,10 +1588,37 @@ def list_matches():
     # Pagination : la page rendait auparavant toutes les paires d'un coup
     # (plusieurs centaines de cartes sur un festival réel).
     total_visible = len(visible)
-    total_pages = max(1, (total_visible + MATCHES_PER_PAGE - 1) // MATCHES_PER_PAGE)
-    page = min(max(1, page), total_pages)
+    page, total_pages = _paginate(total_visible, page)
     start = (page - 1) * MATCHES_PER_PAGE
     page_slice = visible[start:start + MATCHES_PER_PAGE]
+    stats = {'pending': n_pending, 'validated': n_validated, 'rejected': n_rejected}
+    return page_slice, stats, page, total_pages, total_visible
+
+
+@bp.route('/matches')
+@login_required
+def list_matches():
+    _default_seuil = matching.MATCH_CONFIG['threshold_default']
+    try:
+        seuil = int(request.args.get('threshold', _default_seuil))
+    except (TypeError, ValueError):
+        seuil = _default_seuil
+    page = request.args.get('page', 1, type=int) or 1
+    show_validated = request.args.get('show_validated', '0') == '1'
+    show_rejected  = request.args.get('show_rejected',  '0') == '1'
+
+    # La table match_candidates ne garde que les paires au-dessus du plancher :
+    # un seuil plus bas (rare, exploration manuelle) repasse par le calcul complet.
+    # De même tant que la table n'a pas été reconstruite pour le moteur courant
+    # (`flask rebuild-match-candidates` ou le worker photo) : jamais de
+    # reconstruction dans une requête GET.
+    import match_candidates
+    if seuil >= matching.MATCH_CONFIG['candidate_floor'] and match_candidates.is_current(db.session):
+        page_slice, stats, page, total_pages, total_visible = _matches_page_from_table(
+            seuil, page, show_validated, show_rejected)
+    else:
+        page_slice, stats, page, total_pages, total_visible = _matches_page_live(
+            seuil, page, show_validated, show_rejected)
 
     # Pas de match_explanation() ici : le bouton « Détails » de matches.html la
     # récupère en AJAX via /api/match_explain, à la demande et pour une seule paire.
@@ -1456,7 +1632,6 @@ def list_matches():
         'is_rejected': is_rejected,
     } for lost, found, score, is_validated, is_rejected in page_slice]
 
-    stats = {'pending': n_pending, 'validated': n_validated, 'rejected': n_rejected}
     return render_template(
         'matches.html',
         pairs=pairs_with_status,
@@ -3,10 +3,26 @@
 Les poids Hugging Face sont mis en cache dans ``VISUAL_MATCHER_CACHE_DIR``. Sur
 Railway, configurez cette variable vers un volume persistant; sinon le cache
 standard Hugging Face (dans l'image de build si préchargé) est utilisé.
+
+``VISUAL_MATCHER_BACKEND`` choisit le moteur d'inférence CPU :
+
+* ``torch`` (défaut) : le modèle PyTorch float32 d'origine ;
+* ``int8`` : le même modèle, couches linéaires quantifiées dynamiquement en
+  int8 (``torch.ao.quantization.quantize_dynamic``) — environ deux fois moins
+  de mémoire pour ces couches et une inférence plus rapide sur CPU ;
+* ``onnx`` : le graphe exporté une fois en ONNX (fichier rangé dans le cache,
+  ou ``VISUAL_MATCHER_ONNX_PATH``) et exécuté par ONNX Runtime, dépendance
+  optionnelle (``pip install onnx onnxruntime``).
+
+Les vecteurs restent comparables d'un moteur à l'autre (cosinus ≥ 0,99, voir
+tests/test_visual_matcher_backends.py) ; ``flask bench-visual-matcher``
+compare latence, débit et mémoire.
 """
+import inspect
 import logging
 import os
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from pathlib import Path
 from typing import Any
@@ -17,12 +33,16 @@ from PIL import Image
 from transformers import AutoImageProcessor, AutoModel
 
 MODEL_ID = "facebook/dinov2-small"
+BACKENDS = ("torch", "int8", "onnx")
 _LOGGER = logging.getLogger(__name__)
 _MODEL_LOCK = threading.Lock()
-_MODEL: AutoModel | None = None
+_MODEL: "TorchBackend | OnnxBackend | None" = None
 _PROCESSOR: AutoImageProcessor | None = None
 _LOAD_ERROR: str | None = None
 _LOAD_ATTEMPTED = False
+# Taille de lot par défaut pour embed_images_bytes : 16 images 224x224 tiennent
+# largement en mémoire CPU et amortissent le coût fixe d'une passe.
+DEFAULT_BATCH_SIZE = int(os.environ.get("VISUAL_MATCHER_BATCH_SIZE", "16"))
 
 
 def _cache_dir() -> str | None:
@@ -33,8 +53,104 @@ def _cache_dir() -> str | None:
     return cache_dir
 
 
-def load_model() -> tuple[AutoModel, AutoImageProcessor] | None:
-    """Charge DINOv2 une fois par processus et le prépare en lecture seule."""
+def backend_name() -> str:
+    """Moteur configuré par ``VISUAL_MATCHER_BACKEND`` (``torch`` par défaut)."""
+    name = os.environ.get("VISUAL_MATCHER_BACKEND", "torch").strip().lower() or "torch"
+    if name not in BACKENDS:
+        raise ValueError(f"VISUAL_MATCHER_BACKEND inconnu : {name!r} (attendu : {', '.join(BACKENDS)})")
+    return name
+
+
+class TorchBackend:
+    """Modèle PyTorch (float32 ou quantifié int8) renvoyant le vecteur CLS."""
+
+    def __init__(self, model, name: str = "torch"):
+        self.model = model
+        self.name = name
+        self.hidden_size = model.config.hidden_size
+
+    def __call__(self, pixel_values: torch.Tensor) -> np.ndarray:
+        with torch.inference_mode():
+            outputs = self.model(pixel_values=pixel_values)
+        return outputs.last_hidden_state[:, 0, :].cpu().numpy()
+
+
+class OnnxBackend:
+    """Session ONNX Runtime sur le graphe exporté par ``export_onnx``."""
+
+    name = "onnx"
+
+    def __init__(self, session, hidden_size: int):
+        self.session = session
+        self.hidden_size = hidden_size
+
+    def __call__(self, pixel_values: torch.Tensor) -> np.ndarray:
+        inputs = {"pixel_values": pixel_values.cpu().numpy().astype(np.float32, copy=False)}
+        return self.session.run(["cls"], inputs)[0]
+
+
+class _ClsHead(torch.nn.Module):
+    """Le modèle réduit à sa sortie utile : le graphe ONNX ne porte que le vecteur CLS."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values).last_hidden_state[:, 0, :]
+
+
+def export_onnx(model, path: str, image_size: int = 224) -> str:
+    """Exporte le modèle en ONNX (lot de taille variable) et renvoie le chemin."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    dummy = torch.zeros(1, 3, image_size, image_size)
+    options = {}
+    # Depuis torch 2.9 l'export passe par défaut par dynamo, qui exige
+    # onnxscript ; l'exporteur historique suffit ici et reste disponible.
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        options["dynamo"] = False
+    tmp = f"{path}.tmp"
+    torch.onnx.export(_ClsHead(model).eval(), (dummy,), tmp, input_names=["pixel_values"],
+                      output_names=["cls"], dynamic_axes={"pixel_values": {0: "batch"}, "cls": {0: "batch"}},
+                      opset_version=17, **options)
+    os.replace(tmp, path)
+    return path
+
+
+def build_backend(name: str, model, onnx_path: str | None = None):
+    """Construit le moteur `name` à partir du modèle float32 chargé."""
+    if name == "torch":
+        return TorchBackend(model)
+    if name == "int8":
+        quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return TorchBackend(quantized, name="int8")
+    if name == "onnx":
+        try:
+            import onnxruntime
+        except ImportError as exc:
+            raise RuntimeError("VISUAL_MATCHER_BACKEND=onnx exige le paquet onnxruntime "
+                               "(et onnx pour le premier export)") from exc
+        if not onnx_path:
+            raise ValueError("chemin du graphe ONNX manquant")
+        if not os.path.isfile(onnx_path):
+            _LOGGER.info("Export ONNX de %s vers %s", MODEL_ID, onnx_path)
+            export_onnx(model, onnx_path)
+        options = onnxruntime.SessionOptions()
+        threads = int(os.environ.get("VISUAL_MATCHER_THREADS", "0"))
+        if threads:
+            options.intra_op_num_threads = threads
+        session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        return OnnxBackend(session, model.config.hidden_size)
+    raise ValueError(f"moteur inconnu : {name!r}")
+
+
+def _onnx_path(cache_dir: str | None) -> str:
+    default_dir = cache_dir or os.path.join(Path.home(), ".cache", "visual_matcher")
+    return os.environ.get("VISUAL_MATCHER_ONNX_PATH") or os.path.join(default_dir, "dinov2-small.onnx")
+
+
+def load_model() -> tuple["TorchBackend | OnnxBackend", AutoImageProcessor] | None:
+    """Charge DINOv2 une fois par processus, avec le moteur configuré, en lecture seule."""
     global _MODEL, _PROCESSOR, _LOAD_ERROR, _LOAD_ATTEMPTED
     if _MODEL is not None and _PROCESSOR is not None:
         return _MODEL, _PROCESSOR
@@ -46,15 +162,18 @@ def load_model() -> tuple[AutoModel, AutoImageProcessor] | None:
             return None
         _LOAD_ATTEMPTED = True
         try:
+            name = backend_name()
             cache_dir = _cache_dir()
-            _LOGGER.info("Chargement du modèle visuel local %s (cache=%s)", MODEL_ID, cache_dir or "Hugging Face par défaut")
+            _LOGGER.info("Chargement du modèle visuel local %s, moteur %s (cache=%s)",
+                         MODEL_ID, name, cache_dir or "Hugging Face par défaut")
             processor = AutoImageProcessor.from_pretrained(MODEL_ID, cache_dir=cache_dir)
             model = AutoModel.from_pretrained(MODEL_ID, cache_dir=cache_dir)
             model.eval()
+            set_num_threads(int(os.environ.get("VISUAL_MATCHER_THREADS", "0")))
             for parameter in model.parameters():
                 parameter.requires_grad_(False)
-            _MODEL, _PROCESSOR = model, processor
-            _LOGGER.info("Modèle visuel %s prêt pour les embeddings image↔image", MODEL_ID)
+            _MODEL, _PROCESSOR = build_backend(name, model, _onnx_path(cache_dir)), processor
+            _LOGGER.info("Modèle visuel %s (%s) prêt pour les embeddings image↔image", MODEL_ID, name)
             return _MODEL, _PROCESSOR
         except Exception as exc:
             _LOAD_ERROR = f"{type(exc).__name__}: {exc}"
@@ -62,8 +181,36 @@ def load_model() -> tuple[AutoModel, AutoImageProcessor] | None:
             return None
 
 
+def _sidecar():
+    """Client du serveur de modèle partagé (model_server.py) si ``VISUAL_MATCHER_SOCKET`` est défini."""
+    path = os.environ.get("VISUAL_MATCHER_SOCKET")
+    if not path:
+        return None
+    from model_server import ModelClient
+    return ModelClient(path, timeout=float(os.environ.get("VISUAL_MATCHER_SOCKET_TIMEOUT", "30")))
+
+
 def model_status(load: bool = False) -> dict[str, Any]:
-    """Expose un état explicite sans confondre un échec avec une similarité nulle."""
+    """Expose un état explicite sans confondre un échec avec une similarité nulle.
+
+    Avec le serveur de modèle, l'état est le sien ; s'il ne répond pas, le
+    modèle est « unavailable », comme après un échec de chargement local.
+    """
+    client = _sidecar()
+    if client is not None:
+        from model_server import ModelServerUnavailable
+        try:
+            status = client.status()
+        except ModelServerUnavailable as exc:
+            status = {
+                "state": "unavailable",
+                "model": MODEL_ID,
+                "backend": os.environ.get("VISUAL_MATCHER_BACKEND", "torch"),
+                "cache_dir": _cache_dir() or "Hugging Face par défaut",
+                "error": str(exc),
+            }
+        status["sidecar"] = client.path
+        return status
     if load:
         load_model()
     if _MODEL is not None:
@@ -75,28 +222,154 @@ def model_status(load: bool = False) -> dict[str, Any]:
     return {
         "state": state,
         "model": MODEL_ID,
+        "backend": _MODEL.name if _MODEL is not None else os.environ.get("VISUAL_MATCHER_BACKEND", "torch"),
         "cache_dir": _cache_dir() or "Hugging Face par défaut",
         "error": _LOAD_ERROR,
     }
 
 
-def embed_image_bytes(data: bytes) -> np.ndarray | None:
-    """Retourne le vecteur CLS DINOv2 à partir d'octets image bruts, ou ``None`` si indisponible."""
-    loaded = load_model()
-    if loaded is None:
-        return None
+def set_num_threads(num_threads: int | None) -> None:
+    """Fixe le nombre de threads intra-op de torch (0 ou None : valeur par défaut de torch)."""
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+
+
+def _decode(data: bytes) -> Image.Image | None:
+    """Image RGB entièrement décodée, ou ``None`` si les octets ne sont pas lisibles."""
     if not data:
         return None
-    model, processor = loaded
     try:
         with Image.open(BytesIO(data)) as image:
-            inputs = processor(images=image.convert("RGB"), return_tensors="pt")
-        with torch.inference_mode():
-            outputs = model(**inputs)
-        return outputs.last_hidden_state[:, 0, :].squeeze(0).cpu().numpy()
-    except Exception:
-        _LOGGER.exception("Échec de l'embedding DINOv2 depuis des octets image")
+            return image.convert("RGB")
+    except Exception as exc:
+        _LOGGER.warning("Image illisible ignorée pour l'embedding DINOv2 : %s", exc)
+        return None
+
+
+def embed_images_bytes(images: list[bytes], *, batch_size: int | None = None,
+                       decode_workers: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Vecteurs CLS DINOv2 de plusieurs images : tableau (N, D) float32 et masque d'échec (N,).
+
+    Une passe avant par lot au lieu d'une par image. Le décodage JPEG/PNG se
+    fait dans un pool de threads (Pillow libère le GIL) et le lot suivant est
+    décodé pendant l'inférence du lot courant. Une image illisible, ou un lot
+    en erreur, n'est noté que dans le masque (``True`` = pas de vecteur, ligne
+    à zéro) ; si le modèle est indisponible, toutes les images sont en échec
+    et D vaut 0.
+    """
+    count = len(images)
+    failed = np.ones(count, dtype=bool)
+    client = _sidecar()
+    if client is not None:
+        # Le serveur de modèle fait ses propres lots, avec les images des
+        # autres workers : batch_size ne s'applique pas ici.
+        from model_server import ModelServerUnavailable
+        try:
+            return client.embed(images) if count else (np.zeros((0, 0), dtype=np.float32), failed)
+        except ModelServerUnavailable as exc:
+            _LOGGER.warning("Embedding DINOv2 indisponible : %s", exc)
+            return np.zeros((count, 0), dtype=np.float32), failed
+    loaded = load_model()
+    if loaded is None or not count:
+        return np.zeros((count, 0), dtype=np.float32), failed
+    backend, processor = loaded
+    vectors = np.zeros((count, backend.hidden_size), dtype=np.float32)
+    batch_size = max(1, batch_size or DEFAULT_BATCH_SIZE)
+    batches = [range(start, min(start + batch_size, count)) for start in range(0, count, batch_size)]
+    workers = decode_workers or min(4, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = [pool.submit(_decode, images[i]) for i in batches[0]]
+        for number, batch in enumerate(batches):
+            decoded = [future.result() for future in pending]
+            if number + 1 < len(batches):
+                pending = [pool.submit(_decode, images[i]) for i in batches[number + 1]]
+            ready = [(index, image) for index, image in zip(batch, decoded) if image is not None]
+            if not ready:
+                continue
+            try:
+                inputs = processor(images=[image for _, image in ready], return_tensors="pt")
+                rows = [index for index, _ in ready]
+                vectors[rows] = backend(inputs["pixel_values"])
+                failed[rows] = False
+            except Exception:
+                _LOGGER.exception("Échec de l'embedding DINOv2 d'un lot de %d image(s)", len(ready))
+            finally:
+                for _, image in ready:
+                    image.close()
+    return vectors, failed
+
+
+def embed_image_bytes(data: bytes) -> np.ndarray | None:
+    """Retourne le vecteur CLS DINOv2 à partir d'octets image bruts, ou ``None`` si indisponible."""
+    if not data:
         return None
+    vectors, failed = embed_images_bytes([data])
+    return None if failed[0] else vectors[0]
+
+
+def sample_images(count: int, size: tuple[int, int] = (1024, 768), seed: int = 0) -> list[bytes]:
+    """Images JPEG synthétiques et déterministes (dégradés, formes, bruit) pour tests et mesures."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    yy, xx = np.mgrid[0:height, 0:width]
+    images = []
+    for _ in range(count):
+        colours = rng.uniform(0, 255, size=(2, 3))
+        mix = ((xx * rng.uniform(0.5, 2) + yy * rng.uniform(0.5, 2)) / (width + height))[..., None]
+        pixels = colours[0] * (1 - mix) + colours[1] * mix
+        for _ in range(3):
+            x0, y0 = rng.integers(0, width // 2), rng.integers(0, height // 2)
+            x1, y1 = x0 + rng.integers(20, width // 2), y0 + rng.integers(20, height // 2)
+            pixels[y0:y1, x0:x1] = rng.uniform(0, 255, size=3)
+        pixels += rng.normal(0, 8, size=pixels.shape)
+        out = BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(out, "JPEG", quality=85)
+        images.append(out.getvalue())
+    return images
+
+
+def benchmark(images: list[bytes], batch_size: int, rounds: int = 3) -> dict[str, Any]:
+    """Mesure le moteur configuré : chargement, latence unitaire, débit par lots et RSS maximal.
+
+    À exécuter dans un processus dédié par moteur (voir ``benchmark_backend``) :
+    le RSS maximal d'un processus qui a déjà chargé un autre moteur ne dirait rien.
+    """
+    import resource
+    import time
+
+    started = time.perf_counter()
+    loaded = load_model()
+    load_seconds = time.perf_counter() - started
+    result: dict[str, Any] = {"backend": os.environ.get("VISUAL_MATCHER_BACKEND", "torch")}
+    if loaded is None:
+        result["error"] = _LOAD_ERROR
+        return result
+    embed_images_bytes(images[:batch_size], batch_size=batch_size)  # échauffement
+    latencies = []
+    for data in images[:10]:
+        tick = time.perf_counter()
+        embed_images_bytes([data], batch_size=1)
+        latencies.append(time.perf_counter() - tick)
+    tick = time.perf_counter()
+    for _ in range(rounds):
+        embed_images_bytes(images, batch_size=batch_size)
+    elapsed = time.perf_counter() - tick
+    result.update({
+        "load_s": round(load_seconds, 2),
+        "latency_ms_p50": round(1000 * float(np.percentile(latencies, 50)), 1),
+        "latency_ms_p95": round(1000 * float(np.percentile(latencies, 95)), 1),
+        "images_per_s": round(rounds * len(images) / elapsed, 1),
+        # ru_maxrss est en Kio sous Linux.
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+    return result
+
+
+def benchmark_backend(name: str, images: list[bytes], batch_size: int, rounds: int = 3) -> dict[str, Any]:
+    """Point d'entrée d'un processus de mesure : fixe le moteur puis appelle ``benchmark``."""
+    os.environ["VISUAL_MATCHER_BACKEND"] = name
+    os.environ.pop("VISUAL_MATCHER_SOCKET", None)  # on mesure le moteur local, pas le serveur partagé
+    return benchmark(images, batch_size, rounds)
 
 
 def embed_image(image_path: str) -> np.ndarray | None: